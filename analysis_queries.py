@@ -1,193 +1,735 @@
+import argparse
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import pandas as pd
+from collaboration_graph import CollaborationGraph
+from compact_schema import COMPACT_QUERIES, is_compact_schema
+from connection_pool import ReadOnlyConnectionPool, add_math_functions, enable_wal
+from leaderboards import (LEADERBOARD_QUERY, RANKING_QUERY, create_leaderboards, has_leaderboards,
+                          leaderboard_settings, refresh_leaderboards, scope_key)
+from movie_cube import CUBE_QUERIES, create_movie_cube, has_movie_cube, pending_changes, refresh_movie_cube
+from partitions import window_connection
+import query_profiler
+from query_profiler import profiled, timed_chunks
+from query_cache import QueryCache, database_fingerprint
+from rating_histograms import (BIN_VALUES, create_rating_histograms, has_rating_histograms,
+                               load_rating_histograms, means, quantiles, refresh_rating_histograms,
+                               rollup, stale_movies)
+from rating_sample import approximate_connection, with_error_columns
+from result_chunks import category_levels, compact_dtypes, frame_chunks
+from rating_stats import create_rating_stats, has_rating_stats, refresh_rating_stats
+from rating_trends import (DEFAULT_WINDOW, TRENDING_MOVIES_QUERY, create_rating_trends, has_rating_trends,
+                           latest_day, trend_params, trend_query, trending_params)
+from user_rating_stats import (USER_PROFILES_QUERY, create_user_rating_stats, has_user_rating_stats,
+                               user_bias_query)
+
+GENRE_POPULARITY_QUERY = """
+    SELECT 
+        genre,
+        strftime('%Y', release_date) as release_year,
+        COUNT(*) as movie_count,
+        AVG(s.rating_sum / s.rating_count) as avg_genre_rating,
+        SUM(box_office) as total_box_office
+    FROM movies m
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    GROUP BY genre, release_year
+    ORDER BY release_year, movie_count DESC
+    """
+
+DIRECTOR_PERFORMANCE_QUERY = """
+    SELECT 
+        d.name as director_name,
+        COUNT(m.movie_id) as total_movies,
+        AVG(s.rating_sum / s.rating_count) as avg_director_rating,
+        AVG(m.box_office) as avg_box_office,
+        SUM(m.box_office) as total_box_office,
+        AVG(m.box_office - m.budget) as avg_profit,
+        MIN(m.release_date) as first_movie,
+        MAX(m.release_date) as latest_movie
+    FROM directors d
+    JOIN movies m ON d.director_id = m.director_id
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    GROUP BY d.director_id, d.name
+    HAVING COUNT(m.movie_id) >= 2
+    ORDER BY avg_director_rating DESC
+    """
+
+RATING_DISTRIBUTION_QUERY = """
+    SELECT 
+        m.title,
+        m.genre,
+        strftime('%Y', m.release_date) as release_year,
+        d.name as director,
+        s.rating_sum / s.rating_count as avg_rating,
+        s.rating_count as total_ratings,
+        s.min_rating,
+        s.max_rating,
+        (m.box_office - m.budget) as profit,
+        CASE 
+            WHEN s.rating_sum / s.rating_count >= 8.0 THEN 'Excellent'
+            WHEN s.rating_sum / s.rating_count >= 7.0 THEN 'Good'
+            WHEN s.rating_sum / s.rating_count >= 6.0 THEN 'Average'
+            ELSE 'Poor'
+        END as rating_category
+    FROM movies m
+    JOIN directors d ON m.director_id = d.director_id
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    ORDER BY avg_rating DESC
+    """
+
+SEASONAL_RELEASE_QUERY = """
+    SELECT 
+        CASE 
+            WHEN CAST(strftime('%m', release_date) AS INTEGER) IN (12, 1, 2) THEN 'Winter'
+            WHEN CAST(strftime('%m', release_date) AS INTEGER) IN (3, 4, 5) THEN 'Spring'
+            WHEN CAST(strftime('%m', release_date) AS INTEGER) IN (6, 7, 8) THEN 'Summer'
+            ELSE 'Fall'
+        END as season,
+        genre,
+        COUNT(*) as movie_count,
+        AVG(s.rating_sum / s.rating_count) as avg_rating,
+        AVG(box_office) as avg_box_office,
+        AVG(box_office - budget) as avg_profit
+    FROM movies m
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    GROUP BY season, genre
+    ORDER BY season, avg_rating DESC
+    """
+
+BUDGET_RATING_QUERY = """
+    SELECT 
+        m.title,
+        m.budget,
+        m.box_office,
+        (m.box_office - m.budget) as profit,
+        s.rating_sum / s.rating_count as avg_rating,
+        s.rating_count,
+        CASE 
+            WHEN m.budget < 20000000 THEN 'Low Budget'
+            WHEN m.budget < 100000000 THEN 'Medium Budget'
+            ELSE 'High Budget'
+        END as budget_category
+    FROM movies m
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    ORDER BY m.budget DESC
+    """
+
+QUERIES = {
+    'genre_popularity_analysis': GENRE_POPULARITY_QUERY,
+    'director_performance_metrics': DIRECTOR_PERFORMANCE_QUERY,
+    'rating_distribution_analysis': RATING_DISTRIBUTION_QUERY,
+    'seasonal_release_patterns': SEASONAL_RELEASE_QUERY,
+    'budget_vs_rating_correlation': BUDGET_RATING_QUERY,
+}
+
+# (since, until, sample_fraction) of an exact, all-time analysis
+EXACT = (None, None, None)
+
+# Grouping keys for the histogram rollups
+HISTOGRAM_LEVELS = {
+    'movie': ['title', 'genre', 'director'],
+    'genre': ['genre'],
+    'director': ['director'],
+}
+
+# The collaboration network comes from the sparse graph engine rather than SQL
+ANALYSES = [
+    'genre_popularity_analysis',
+    'director_performance_metrics',
+    'rating_distribution_analysis',
+    'actor_collaboration_network',
+    'seasonal_release_patterns',
+    'budget_vs_rating_correlation',
+]
 
 class MovieAnalytics:
-    def __init__(self, db_path='movies.db'):
+    BACKENDS = ('sqlite', 'numpy', 'arrow')
+    
+    # sqlite3.Connection subclass used for every connection opened here
+    connection_factory = sqlite3.Connection
+    
+    def __init__(self, db_path='movies.db', cache=None, backend='sqlite', partitions=None, use_cube=True,
+                 export_dir='columnar_export'):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}")
         self.db_path = db_path
+        self.cache = cache
+        self.backend = backend
+        self.partitions = partitions
+        self.use_cube = use_cube
+        self.export_dir = export_dir
+        self._engine = None
+        self._local = threading.local()
+        self._pool = None
+        self._graph = None
+        self._graph_fingerprint = None
+        self._graph_lock = threading.Lock()
+        self._cube_lock = threading.Lock()
+        self._user_stats_lock = threading.Lock()
+        self._leaderboard_lock = threading.Lock()
+        self._trends_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats_ready = False
+        self._compact = None
+    
+    def _connect(self):
+        return add_math_functions(sqlite3.connect(self.db_path, factory=self.connection_factory))
+    
+    def _rating_stats(self):
+        """Build movie_rating_stats and its triggers on first use
+        
+        Every analysis reads the aggregates, but databases created before
+        they existed do not carry them.
+        """
+        if self._stats_ready:
+            return
+        with self._stats_lock:
+            if not self._stats_ready:
+                conn = self._connect()
+                try:
+                    if not has_rating_stats(conn):
+                        with conn:
+                            create_rating_stats(conn)
+                finally:
+                    conn.close()
+                self._stats_ready = True
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        self._rating_stats()
+        return self._connect()
     
-    def genre_popularity_analysis(self):
-        """Analyze genre popularity over time"""
-        query = """
-        SELECT 
-            genre,
-            strftime('%Y', release_date) as release_year,
-            COUNT(*) as movie_count,
-            AVG(mr.avg_rating) as avg_genre_rating,
-            SUM(box_office) as total_box_office
-        FROM movies m
-        JOIN (
-            SELECT 
-                movie_id, 
-                AVG(rating) as avg_rating
-            FROM movie_ratings 
-            GROUP BY movie_id
-        ) mr ON m.movie_id = mr.movie_id
-        GROUP BY genre, release_year
-        ORDER BY release_year, movie_count DESC
+    def get_window_connection(self, since=None, until=None, sample_fraction=None):
+        """Connection whose movie_rating_stats only covers ratings reviewed in [since, until)
+        
+        With a sample_fraction the aggregates are estimated from rating_sample.
         """
+        self._rating_stats()
+        if sample_fraction is not None:
+            return approximate_connection(self.db_path, sample_fraction, since, until,
+                                          factory=self.connection_factory)
+        if self.partitions is not None:
+            return self.partitions.window_connection(since, until, factory=self.connection_factory)
+        return window_connection(self.db_path, since, until, factory=self.connection_factory)
+    
+    @contextmanager
+    def _connection(self, scope=EXACT):
+        # Inside run_all each worker thread is bound to a pooled read-only connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'scope', EXACT) == scope:
+            yield conn
+            return
+        conn = self.get_connection() if scope == EXACT else self.get_window_connection(*scope)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    @property
+    def compact_schema(self):
+        """Whether the database uses the compact layout of compact_schema.py (checked once)"""
+        if self._compact is None:
+            conn = self.get_connection()
+            try:
+                self._compact = is_compact_schema(conn)
+            finally:
+                conn.close()
+        return self._compact
+    
+    @profiled
+    def refresh_cube(self):
+        """Bring movie_cube up to date, building it on first use; returns the cells recomputed"""
+        with self._cube_lock:
+            conn = self.get_connection()
+            try:
+                with conn:
+                    if not has_movie_cube(conn):
+                        create_movie_cube(conn)
+                        return conn.execute('SELECT COUNT(*) FROM movie_cube').fetchone()[0]
+                    return refresh_movie_cube(conn)
+            finally:
+                conn.close()
+    
+    def _refresh_cube_if_writable(self):
+        """refresh_cube() unless the database is read-only; returns whether it ran"""
+        try:
+            self.refresh_cube()
+        except sqlite3.OperationalError as e:
+            if 'readonly' not in str(e):
+                raise
+            return False
+        return True
+    
+    def _cube_current(self):
+        """Whether movie_cube can answer exact rollups
         
+        The cube is refreshed first, except on the read-only connections of
+        run_all or a read-only database; a missing or dirty cube is then left
+        as it is and the rollups are computed from the base tables.
+        """
+        if getattr(self._local, 'conn', None) is None and self._refresh_cube_if_writable():
+            return True
+        with self._connection() as conn:
+            return has_movie_cube(conn) and not pending_changes(conn)
+    
+    @profiled
+    def refresh_leaderboards(self):
+        """Bring the movie leaderboards up to date, building them on first use; returns their depth"""
+        with self._leaderboard_lock:
+            conn = self.get_connection()
+            try:
+                with conn:
+                    if not has_leaderboards(conn):
+                        create_leaderboards(conn)
+                    else:
+                        refresh_leaderboards(conn)
+                return leaderboard_settings(conn)[2]
+            finally:
+                conn.close()
+    
+    def refresh_rating_stats(self, movie_ids=None):
+        """Rebuild the movie_rating_stats aggregates (all movies or a subset)"""
         with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn)
+            refresh_rating_stats(conn, movie_ids)
     
-    def director_performance_metrics(self):
-        """Analyze director performance metrics"""
-        query = """
-        SELECT 
-            d.name as director_name,
-            COUNT(m.movie_id) as total_movies,
-            AVG(mr.avg_rating) as avg_director_rating,
-            AVG(m.box_office) as avg_box_office,
-            SUM(m.box_office) as total_box_office,
-            AVG(m.box_office - m.budget) as avg_profit,
-            MIN(m.release_date) as first_movie,
-            MAX(m.release_date) as latest_movie
-        FROM directors d
-        JOIN movies m ON d.director_id = m.director_id
-        JOIN (
-            SELECT 
-                movie_id, 
-                AVG(rating) as avg_rating,
-                COUNT(rating) as rating_count
-            FROM movie_ratings 
-            GROUP BY movie_id
-        ) mr ON m.movie_id = mr.movie_id
-        GROUP BY d.director_id, d.name
-        HAVING COUNT(m.movie_id) >= 2
-        ORDER BY avg_director_rating DESC
+    @property
+    def engine(self):
+        """In-memory columnar engine, loaded on first use when backend='numpy' or 'arrow'
+        
+        The arrow backend reads the memory-mapped Arrow IPC files written by
+        columnar_export.py to export_dir instead of querying SQLite; tables the
+        database has changed since the export are re-exported first.
         """
+        if self._engine is None:
+            from numpy_backend import ARROW_TABLES, NumpyAnalyticsEngine
+            self._rating_stats()
+            if self.backend == 'arrow':
+                from columnar_export import export_database, stale_tables
+                stale = stale_tables(self.db_path, self.export_dir, ARROW_TABLES)
+                if stale:
+                    export_database(self.db_path, self.export_dir, ['arrow'], stale)
+                self._engine = NumpyAnalyticsEngine.from_arrow(self.export_dir, self.db_path)
+            else:
+                self._engine = NumpyAnalyticsEngine.from_sqlite(self.db_path)
+        return self._engine
+    
+    def _scope(self, since=None, until=None, approximate=False, sample_fraction=None):
+        """(since, until, sample_fraction) for a call; sample_fraction is None for exact results"""
+        if approximate or sample_fraction is not None:
+            sample_fraction = 1.0 if sample_fraction is None else float(sample_fraction)
+            if not 0 < sample_fraction <= 1:
+                raise ValueError("sample_fraction must be in (0, 1]")
+        scope = (since, until, sample_fraction)
+        if self.backend != 'sqlite' and scope != EXACT:
+            raise ValueError("since/until windows and approximate mode require the sqlite backend")
+        return scope
+    
+    def _analysis(self, method, scope=EXACT, chunksize=None):
+        if chunksize is not None:
+            return self._analysis_chunks(method, scope, self._chunksize(chunksize))
+        if self.backend != 'sqlite':
+            return getattr(self.engine, method)()
+        return self._read(self._query(method, scope), scope=scope)
+    
+    def _query(self, method, scope=EXACT):
+        """SQL for an analysis; exact rollups are answered from movie_cube when enabled"""
+        if self.use_cube and scope == EXACT and method in CUBE_QUERIES and self._cube_current():
+            return CUBE_QUERIES[method]
+        query = COMPACT_QUERIES[method] if self.compact_schema else QUERIES[method]
+        if scope[2] is not None:
+            query = with_error_columns(method, query)
+        return query
+    
+    @staticmethod
+    def _chunksize(chunksize):
+        # Checked up front, since generators only fail once iterated
+        if int(chunksize) < 1:
+            raise ValueError("chunksize must be a positive number of rows")
+        return int(chunksize)
+    
+    def _analysis_chunks(self, method, scope, chunksize):
+        """Typed chunks of an analysis, streamed from the cursor (never cached)"""
+        with self._connection(scope) as conn:
+            levels = category_levels(conn)
+            if self.backend != 'sqlite':
+                chunks = frame_chunks(getattr(self.engine, method)(), chunksize)
+            else:
+                chunks = pd.read_sql_query(self._query(method, scope), conn, chunksize=chunksize)
+            for chunk in timed_chunks(chunks, f'{method} chunk'):
+                yield compact_dtypes(chunk, levels)
+    
+    def _frame_chunks(self, frame, chunksize):
+        """Typed chunks of a result that is computed in memory"""
+        with self._connection() as conn:
+            levels = category_levels(conn)
+        for chunk in frame_chunks(frame, chunksize):
+            yield compact_dtypes(chunk, levels)
+    
+    def _read(self, query, params=(), scope=EXACT):
+        key_params = tuple(params) + (scope if scope != EXACT else ())
+        return self._cached(query, key_params, lambda: self._execute(query, params, scope))
+    
+    def _cached(self, query, params, compute):
+        if self.cache is None:
+            return compute()
         
-        with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn)
+        key = self.cache.make_key(self.db_path, query, params)
+        df = self.cache.get(key)
+        query_profiler.annotate(cache_hit=df is not None)
+        if df is None:
+            df = compute()
+            self.cache.put(key, df)
+        return df
     
-    def rating_distribution_analysis(self):
-        """Analyze rating distributions by various factors"""
-        query = """
-        SELECT 
-            m.title,
-            m.genre,
-            strftime('%Y', m.release_date) as release_year,
-            d.name as director,
-            AVG(mr.rating) as avg_rating,
-            COUNT(mr.rating) as total_ratings,
-            MIN(mr.rating) as min_rating,
-            MAX(mr.rating) as max_rating,
-            (m.box_office - m.budget) as profit,
-            CASE 
-                WHEN AVG(mr.rating) >= 8.0 THEN 'Excellent'
-                WHEN AVG(mr.rating) >= 7.0 THEN 'Good'
-                WHEN AVG(mr.rating) >= 6.0 THEN 'Average'
-                ELSE 'Poor'
-            END as rating_category
-        FROM movies m
-        JOIN directors d ON m.director_id = d.director_id
-        JOIN movie_ratings mr ON m.movie_id = mr.movie_id
-        GROUP BY m.movie_id, m.title, m.genre, release_year, d.name, profit
-        ORDER BY avg_rating DESC
+    def _execute(self, query, params=(), scope=EXACT):
+        with self._connection(scope) as conn:
+            profiler = query_profiler.current()
+            if profiler is not None:
+                return profiler.profile_query(conn, query, params)
+            return pd.read_sql_query(query, conn, params=params)
+    
+    def _run_pooled(self, method):
+        with self._pool.connection() as conn:
+            self._local.conn = conn
+            try:
+                return getattr(self, method)()
+            finally:
+                self._local.conn = None
+    
+    @profiled
+    def run_all(self, methods=None, max_workers=None, since=None, until=None,
+                approximate=False, sample_fraction=None):
+        """Run several analyses concurrently and return {method name: DataFrame}
+        
+        Queries share a pool of read-only connections on a WAL database, so the
+        total wall time is bounded by the slowest query rather than their sum.
+        With a since/until window or in approximate mode the analyses run one
+        after another on a single connection, so the window or sample
+        aggregates are only built once.
         """
+        methods = list(methods or ANALYSES)
+        scope = self._scope(since, until, approximate, sample_fraction)
+        if scope != EXACT:
+            options = dict(zip(('since', 'until', 'sample_fraction'), scope))
+            with self._connection(scope) as conn:
+                self._local.conn, self._local.scope = conn, scope
+                try:
+                    return {method: getattr(self, method)(**options) for method in methods}
+                finally:
+                    self._local.conn, self._local.scope = None, EXACT
         
-        with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn)
+        workers = max_workers or len(methods)
+        if self._pool is None or self._pool.size < workers:
+            self.close()
+            # Pooled connections are read-only, so anything built on first use is built here
+            self._rating_stats()
+            enable_wal(self.db_path)
+            self._pool = ReadOnlyConnectionPool(self.db_path, size=workers)
+        if self.use_cube and set(methods) & set(CUBE_QUERIES):
+            self._refresh_cube_if_writable()
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {method: executor.submit(self._run_pooled, method) for method in methods}
+            return {method: future.result() for method, future in futures.items()}
     
-    def actor_collaboration_network(self):
+    def close(self):
+        """Release the pooled connections used by run_all"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+    
+    @profiled
+    def genre_popularity_analysis(self, since=None, until=None, approximate=False, sample_fraction=None,
+                                  chunksize=None):
+        """Analyze genre popularity over time"""
+        return self._analysis('genre_popularity_analysis',
+                              self._scope(since, until, approximate, sample_fraction), chunksize)
+    
+    @profiled
+    def director_performance_metrics(self, since=None, until=None, approximate=False, sample_fraction=None,
+                                     chunksize=None):
+        """Analyze director performance metrics"""
+        return self._analysis('director_performance_metrics',
+                              self._scope(since, until, approximate, sample_fraction), chunksize)
+    
+    @profiled
+    def rating_distribution_analysis(self, since=None, until=None, approximate=False, sample_fraction=None,
+                                     chunksize=None):
+        """Analyze rating distributions by various factors"""
+        return self._analysis('rating_distribution_analysis',
+                              self._scope(since, until, approximate, sample_fraction), chunksize)
+    
+    @profiled
+    def collaboration_graph(self):
+        """Sparse actor collaboration graph, rebuilt whenever the database changes"""
+        if self.backend != 'sqlite':
+            return self.engine.collaboration_graph()
+        with self._graph_lock:
+            fingerprint = database_fingerprint(self.db_path)
+            if self._graph is None or fingerprint != self._graph_fingerprint:
+                self._rating_stats()
+                self._graph = CollaborationGraph.from_sqlite(self.db_path)
+                self._graph_fingerprint = fingerprint
+            return self._graph
+    
+    def _scoped_collaborations(self, min_collaborations, top_k, scope):
+        with self._connection(scope) as conn:
+            return CollaborationGraph.from_connection(conn).collaborations(min_collaborations, top_k)
+    
+    def _collaboration_chunks(self, min_collaborations, top_k, scope, chunksize):
+        with self._connection(scope) as conn:
+            if scope != EXACT:
+                graph = CollaborationGraph.from_connection(conn)
+            elif self.backend != 'sqlite':
+                graph = self.engine.collaboration_graph()
+            else:
+                graph = self.collaboration_graph()
+            for chunk in timed_chunks(graph.collaboration_chunks(min_collaborations, top_k, chunksize),
+                                      'actor_collaboration_network chunk'):
+                yield compact_dtypes(chunk, {})
+    
+    @profiled
+    def actor_collaboration_network(self, min_collaborations=2, top_k=None, since=None, until=None,
+                                    approximate=False, sample_fraction=None, chunksize=None):
         """Analyze actor collaboration patterns"""
-        query = """
-        SELECT 
-            a1.name as actor1,
-            a2.name as actor2,
-            COUNT(*) as collaborations,
-            AVG(mr.avg_rating) as avg_collab_rating,
-            GROUP_CONCAT(m.title, ', ') as movies_together
-        FROM movie_actors ma1
-        JOIN movie_actors ma2 ON ma1.movie_id = ma2.movie_id AND ma1.actor_id < ma2.actor_id
-        JOIN actors a1 ON ma1.actor_id = a1.actor_id
-        JOIN actors a2 ON ma2.actor_id = a2.actor_id
-        JOIN movies m ON ma1.movie_id = m.movie_id
-        JOIN (
-            SELECT 
-                movie_id, 
-                AVG(rating) as avg_rating
-            FROM movie_ratings 
-            GROUP BY movie_id
-        ) mr ON m.movie_id = mr.movie_id
-        GROUP BY a1.actor_id, a2.actor_id, a1.name, a2.name
-        HAVING COUNT(*) >= 2
-        ORDER BY collaborations DESC, avg_collab_rating DESC
-        """
-        
-        with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn)
+        scope = self._scope(since, until, approximate, sample_fraction)
+        if chunksize is not None:
+            return self._collaboration_chunks(min_collaborations, top_k, scope, self._chunksize(chunksize))
+        if self.backend != 'sqlite':
+            return self.engine.actor_collaboration_network(min_collaborations, top_k)
+        if scope != EXACT:
+            return self._cached('collaboration_graph.collaborations', (min_collaborations, top_k) + scope,
+                                lambda: self._scoped_collaborations(min_collaborations, top_k, scope))
+        return self._cached('collaboration_graph.collaborations', (min_collaborations, top_k),
+                            lambda: self.collaboration_graph().collaborations(min_collaborations, top_k))
     
-    def seasonal_release_patterns(self):
+    @profiled
+    def seasonal_release_patterns(self, since=None, until=None, approximate=False, sample_fraction=None,
+                                  chunksize=None):
         """Analyze seasonal movie release patterns"""
-        query = """
-        SELECT 
-            CASE 
-                WHEN CAST(strftime('%m', release_date) AS INTEGER) IN (12, 1, 2) THEN 'Winter'
-                WHEN CAST(strftime('%m', release_date) AS INTEGER) IN (3, 4, 5) THEN 'Spring'
-                WHEN CAST(strftime('%m', release_date) AS INTEGER) IN (6, 7, 8) THEN 'Summer'
-                ELSE 'Fall'
-            END as season,
-            genre,
-            COUNT(*) as movie_count,
-            AVG(mr.avg_rating) as avg_rating,
-            AVG(box_office) as avg_box_office,
-            AVG(box_office - budget) as avg_profit
-        FROM movies m
-        JOIN (
-            SELECT 
-                movie_id, 
-                AVG(rating) as avg_rating
-            FROM movie_ratings 
-            GROUP BY movie_id
-        ) mr ON m.movie_id = mr.movie_id
-        GROUP BY season, genre
-        ORDER BY season, avg_rating DESC
+        return self._analysis('seasonal_release_patterns',
+                              self._scope(since, until, approximate, sample_fraction), chunksize)
+    
+    @profiled
+    def budget_vs_rating_correlation(self, since=None, until=None, approximate=False, sample_fraction=None,
+                                     chunksize=None):
+        """Analyze correlation between budget and ratings"""
+        return self._analysis('budget_vs_rating_correlation',
+                              self._scope(since, until, approximate, sample_fraction), chunksize)
+
+    def _load_rating_histograms(self):
+        """Per-movie histograms joined to movie metadata, refreshing any that drifted"""
+        conn = self.get_connection()
+        try:
+            with conn:
+                if not has_rating_histograms(conn):
+                    create_rating_histograms(conn)
+                else:
+                    # Ratings written outside the ingest hook leave totals out of step
+                    stale = stale_movies(conn)
+                    if stale:
+                        refresh_rating_histograms(conn, stale)
+            movie_ids, counts = load_rating_histograms(conn)
+            movies = pd.read_sql_query('''
+                SELECT m.movie_id, m.title, m.genre, m.director_id, d.name as director
+                FROM movies m
+                JOIN directors d ON m.director_id = d.director_id
+            ''', conn).set_index('movie_id')
+        finally:
+            conn.close()
+        movies = movies.reindex(movie_ids)
+        known = movies['title'].notna().to_numpy()
+        return movies[known].reset_index(), counts[known]
+    
+    def _histogram_rollup(self, level):
+        if level not in HISTOGRAM_LEVELS:
+            raise ValueError(f"level must be one of {list(HISTOGRAM_LEVELS)}")
+        movies, counts = self._load_rating_histograms()
+        if level == 'movie':
+            return movies[HISTOGRAM_LEVELS[level]], counts
+        # Directors are merged by id, since names need not be unique
+        key = 'director_id' if level == 'director' else level
+        keys, merged = rollup(movies[key].to_numpy(), counts)
+        labels = movies.drop_duplicates(key).set_index(key, drop=False).loc[keys, HISTOGRAM_LEVELS[level]]
+        return labels.reset_index(drop=True), merged
+    
+    def _rating_quantiles(self, level, levels):
+        labels, counts = self._histogram_rollup(level)
+        result = labels.copy()
+        result['rating_count'] = counts.sum(axis=1)
+        result['avg_rating'] = means(counts)
+        values = quantiles(counts, levels)
+        for i, q in enumerate(levels):
+            result[f'p{q * 100:g}'] = values[:, i]
+        return result.sort_values(f'p{levels[0] * 100:g}', ascending=False, kind='stable', ignore_index=True)
+    
+    @profiled
+    def rating_quantiles(self, level='movie', levels=(0.5, 0.9), chunksize=None):
+        """Median and other rating percentiles per movie, genre or director
+        
+        Computed from the per-movie rating histograms (merged for genres and
+        directors) instead of sorting raw ratings.
+        """
+        levels = tuple(levels)
+        result = self._cached('rating_histograms.quantiles', (level, levels),
+                              lambda: self._rating_quantiles(level, levels))
+        return result if chunksize is None else self._frame_chunks(result, self._chunksize(chunksize))
+    
+    def _rating_histogram(self, level):
+        # Flat, with string column names, so the result survives the disk cache
+        labels, counts = self._histogram_rollup(level)
+        bins = pd.DataFrame(counts, columns=[f'{value:.1f}' for value in BIN_VALUES])
+        return pd.concat([labels, bins], axis=1)
+    
+    @profiled
+    def rating_histogram(self, level='genre', chunksize=None):
+        """Rating counts per 0.1 step (columns 1.0-10.0) for every movie, genre or director"""
+        table = self._cached('rating_histograms.histogram', (level,), lambda: self._rating_histogram(level))
+        labels = HISTOGRAM_LEVELS[level]
+        result = table.set_index(labels if len(labels) > 1 else labels[0])
+        result.columns = BIN_VALUES
+        return result if chunksize is None else self._frame_chunks(result, self._chunksize(chunksize))
+    
+    def _user_rating_stats(self):
+        """Build user_rating_stats and the user_id index on first use"""
+        if self.backend != 'sqlite':
+            raise ValueError("user analytics require the sqlite backend")
+        with self._user_stats_lock:
+            conn = self.get_connection()
+            try:
+                if not has_user_rating_stats(conn):
+                    with conn:
+                        create_user_rating_stats(conn)
+            finally:
+                conn.close()
+    
+    def _query_chunks(self, query, params, name, chunksize):
+        """Typed chunks of a query, streamed from the cursor (never cached)"""
+        with self._connection() as conn:
+            levels = category_levels(conn)
+            chunks = pd.read_sql_query(query, conn, params=params, chunksize=chunksize)
+            for chunk in timed_chunks(chunks, f'{name} chunk'):
+                yield compact_dtypes(chunk, levels)
+    
+    @profiled
+    def user_rating_profiles(self, min_ratings=1, chunksize=None):
+        """Rating count, mean, spread and bias (mean minus the global mean) per user, most active first"""
+        self._user_rating_stats()
+        params = (min_ratings,)
+        if chunksize is not None:
+            return self._query_chunks(USER_PROFILES_QUERY, params, 'user_rating_profiles',
+                                      self._chunksize(chunksize))
+        return self._read(USER_PROFILES_QUERY, params)
+    
+    @profiled
+    def user_bias_adjusted_ratings(self, min_user_ratings=5, min_movie_ratings=1, chunksize=None):
+        """Movie averages corrected for how harshly or generously each rater scores
+        
+        adjusted_rating is the global mean plus the movie's average deviation of
+        a rating from its rater's own mean; avg_z_score also scales by the
+        rater's spread. Raters with fewer than min_user_ratings ratings are
+        measured against the global mean. Computed in one join over the
+        user_rating_stats aggregates, not per user.
         """
+        self._user_rating_stats()
+        query = user_bias_query(self.compact_schema)
+        params = (min_user_ratings, min_user_ratings, min_movie_ratings)
+        if chunksize is not None:
+            return self._query_chunks(query, params, 'user_bias_adjusted_ratings', self._chunksize(chunksize))
+        return self._read(query, params)
+
+    @profiled
+    def movie_leaderboard(self, scope='all', key=None, n=10, chunksize=None):
+        """Top n movies overall or of one genre, director id or year by Bayesian weighted score
         
-        with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn)
+        weighted_score shrinks each movie's mean towards the global mean by a
+        fixed number of pseudo-ratings (see leaderboards.py), so a few high
+        ratings do not outrank thousands. Reads within the stored depth come
+        from the precomputed lists; n=None ranks every movie of the scope.
+        """
+        params = (scope, scope_key(scope, key))
+        depth = self.refresh_leaderboards()
+        if n is not None and n <= depth:
+            query, params = LEADERBOARD_QUERY, params + (n,)
+        else:
+            query = RANKING_QUERY if n is None else RANKING_QUERY + f' LIMIT {int(n)}'
+        if chunksize is not None:
+            return self._query_chunks(query, params, 'movie_leaderboard', self._chunksize(chunksize))
+        return self._read(query, params)
     
-    def budget_vs_rating_correlation(self):
-        """Analyze correlation between budget and ratings"""
-        query = """
-        SELECT 
-            m.title,
-            m.budget,
-            m.box_office,
-            (m.box_office - m.budget) as profit,
-            AVG(mr.rating) as avg_rating,
-            COUNT(mr.rating) as rating_count,
-            CASE 
-                WHEN m.budget < 20000000 THEN 'Low Budget'
-                WHEN m.budget < 100000000 THEN 'Medium Budget'
-                ELSE 'High Budget'
-            END as budget_category
-        FROM movies m
-        JOIN movie_ratings mr ON m.movie_id = mr.movie_id
-        GROUP BY m.movie_id, m.title, m.budget, m.box_office
-        ORDER BY m.budget DESC
+    def _rating_trends(self):
+        """Build the daily rating buckets on first use; returns the latest bucket's day number"""
+        if self.backend != 'sqlite':
+            raise ValueError("rating trends require the sqlite backend")
+        with self._trends_lock:
+            conn = self.get_connection()
+            try:
+                if not has_rating_trends(conn):
+                    with conn:
+                        create_rating_trends(conn)
+                return latest_day(conn)
+            finally:
+                conn.close()
+    
+    @profiled
+    def movie_rating_trend(self, movie_id, since=None, until=None, window=DEFAULT_WINDOW, granularity='day'):
+        """Ratings of one movie per day or week with rolling mean, momentum and year-over-year change
+        
+        rolling_mean pools the ratings of the window days up to each period;
+        momentum compares it with the window before, yoy_change with the
+        same window 52 weeks earlier. Without since, the last year is shown.
+        Only the buckets of the requested range (plus a year of lookback) are
+        read, so latency does not grow with the history.
         """
+        latest = self._rating_trends()
+        return self._read(trend_query('movie', True, granularity),
+                          trend_params(latest, movie_id, since, until, window, granularity))
+    
+    @profiled
+    def genre_rating_trend(self, genre=None, since=None, until=None, window=DEFAULT_WINDOW, granularity='week'):
+        """Rolling rating trend of one genre, or of every genre when genre is None (see movie_rating_trend)"""
+        latest = self._rating_trends()
+        return self._read(trend_query('genre', genre is not None, granularity),
+                          trend_params(latest, genre, since, until, window, granularity))
+    
+    @profiled
+    def trending_movies(self, as_of=None, window=DEFAULT_WINDOW, min_ratings=5, n=20):
+        """Movies whose mean rating rose most over the last window days against the window before
         
-        with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn)
+        Both windows need at least min_ratings ratings; as_of defaults to the
+        day after the latest review.
+        """
+        latest = self._rating_trends()
+        return self._read(TRENDING_MOVIES_QUERY, trending_params(latest, as_of, window, min_ratings, n))
 
 if __name__ == "__main__":
-    analytics = MovieAnalytics()
-    
-    print("Running sample queries...")
+    parser = argparse.ArgumentParser(description='Run the sample analyses')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--no-cache', action='store_true', help='always query the database')
+    parser.add_argument('--profile', nargs='?', const=query_profiler.DEFAULT_TRACE_PATH, metavar='TRACE',
+                        help='time each query and write a trace (.json for chrome://tracing, '
+                             'anything else for flamegraph.pl folded stacks)')
+    args = parser.parse_args()
     
-    # Test each analysis
-    print("\n1. Genre Popularity Analysis:")
-    genre_data = analytics.genre_popularity_analysis()
-    print(genre_data.head())
+    analytics = MovieAnalytics(args.db, cache=None if args.no_cache else QueryCache())
     
-    print("\n2. Director Performance:")
-    director_data = analytics.director_performance_metrics()
-    print(director_data.head())
+    with query_profiler.profiling(args.profile) as profiler:
+        print("Running sample queries...")
+        
+        # Test each analysis
+        print("\n1. Genre Popularity Analysis:")
+        genre_data = analytics.genre_popularity_analysis()
+        print(genre_data.head())
+        
+        print("\n2. Director Performance:")
+        director_data = analytics.director_performance_metrics()
+        print(director_data.head())
+        
+        print("\n3. Rating Distribution:")
+        rating_data = analytics.rating_distribution_analysis()
+        print(rating_data.head())
     
-    print("\n3. Rating Distribution:")
-    rating_data = analytics.rating_distribution_analysis()
-    print(rating_data.head())
\ No newline at end of file
+    if args.profile:
+        query_profiler.print_profile(profiler)
+        print(f"\nTrace written to {args.profile}")
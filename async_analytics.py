@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from analysis_queries import ANALYSES, EXACT, MovieAnalytics
+from connection_pool import ReadOnlyConnectionPool, enable_wal
+from query_cache import QueryCache
+
+# Methods that can be awaited; chunked results are not offered, since
+# iterating them would run queries on the event loop thread
+ASYNC_METHODS = ANALYSES + ['rating_quantiles', 'rating_histogram', 'user_rating_profiles',
+                             'user_bias_adjusted_ratings', 'movie_leaderboard', 'movie_rating_trend',
+                             'genre_rating_trend', 'trending_movies']
+
+_SCOPE_OPTIONS = ('since', 'until', 'approximate', 'sample_fraction')
+
+
+# Running statements are stopped with interrupt(); the progress handler also
+# stops statements started after a cancellation, between interrupts
+CANCEL_CHECK_INTERVAL = 1000
+
+_current = threading.local()
+
+
+class _Call:
+    """Connections used by one running query, so another thread can interrupt them"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _check(self):
+        return self.cancelled
+
+    def bind(self, conn):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._connections.append(conn)
+        conn.set_progress_handler(self._check, CANCEL_CHECK_INTERVAL)
+        return True
+
+    def release(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+    def interrupt(self):
+        with self._lock:
+            self.cancelled = True
+            for conn in self._connections:
+                try:
+                    conn.interrupt()
+                except sqlite3.ProgrammingError:
+                    # Already closed by the code that opened it
+                    pass
+
+
+class InterruptibleConnection(sqlite3.Connection):
+    """Connection that joins the async call running on its thread
+
+    Installed as MovieAnalytics.connection_factory, so window, sample and
+    write connections opened during a call can be interrupted with it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = getattr(_current, 'call', None)
+        if call is not None and not call.bind(self):
+            self.close()
+            raise sqlite3.OperationalError('interrupted')
+
+
+class AsyncMovieAnalytics:
+    """asyncio front end for MovieAnalytics, for serving many concurrent requests
+
+    Queries run on a bounded thread pool, each bound to one of a fixed set of
+    persistent read-only connections, so a burst of requests queues up instead
+    of opening threads and connections per request. Identical calls that are
+    in flight at the same time share one execution. When every caller of a
+    query has timed out or been cancelled, the query is stopped with SQLite's
+    interrupt and its connection goes back to the pool.
+    """
+
+    def __init__(self, db_path='movies.db', cache=None, max_workers=8, timeout=None, analytics=None):
+        self.analytics = analytics or MovieAnalytics(db_path, cache=cache)
+        self.analytics.connection_factory = InterruptibleConnection
+        self.db_path = self.analytics.db_path
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._pool = None
+        self._inflight = {}
+        self.executed = 0
+        self.collapsed = 0
+        self.interrupted = 0
+
+    def _start(self):
+        if self._executor is None:
+            # The pooled connections are read-only
+            self.analytics._rating_stats()
+            enable_wal(self.db_path)
+            self._pool = ReadOnlyConnectionPool(self.db_path, size=self.max_workers)
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='analytics')
+
+    def _run(self, method, options, call):
+        """Worker side: run one analysis on a pooled (or scoped) connection"""
+        analytics = self.analytics
+        scope = analytics._scope(*(options.get(name) for name in _SCOPE_OPTIONS))
+        _current.call = call
+        try:
+            if scope == EXACT:
+                with self._pool.connection() as conn:
+                    if not call.bind(conn):
+                        return None
+                    try:
+                        return self._run_on(conn, scope, method, options)
+                    finally:
+                        call.release(conn)
+                        conn.set_progress_handler(None, 0)
+            # Window and sample aggregates live on their own connection, as in
+            # run_all; it joins the call as it is opened, so building them can
+            # be interrupted too
+            with analytics._connection(scope) as conn:
+                try:
+                    return self._run_on(conn, scope, method, options)
+                finally:
+                    call.release(conn)
+        finally:
+            _current.call = None
+
+    def _run_on(self, conn, scope, method, options):
+        analytics = self.analytics
+        analytics._local.conn, analytics._local.scope = conn, scope
+        try:
+            return getattr(analytics, method)(**options)
+        finally:
+            analytics._local.conn, analytics._local.scope = None, EXACT
+
+    async def _execute(self, method, options):
+        call = _Call()
+        loop = asyncio.get_running_loop()
+        self.executed += 1
+        try:
+            return await loop.run_in_executor(self._executor, self._run, method, options, call)
+        except asyncio.CancelledError:
+            # Queued work is dropped by the cancel; running SQL needs an interrupt
+            call.interrupt()
+            self.interrupted += 1
+            raise
+
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    async def query(self, method, timeout=None, **options):
+        """Await one analysis; timeout (seconds) defaults to the instance's timeout
+
+        Raises asyncio.TimeoutError when the result is not ready in time.
+        Callers that share an execution get their own copy of the result.
+        """
+        if method not in ASYNC_METHODS:
+            raise ValueError(f"method must be one of {ASYNC_METHODS}")
+        if options.get('chunksize') is not None:
+            raise ValueError("chunked results are not available asynchronously")
+        self._start()
+        timeout = self.timeout if timeout is None else timeout
+
+        key = (method, tuple(sorted((name, repr(value)) for name, value in options.items())))
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._execute(method, options))
+            entry = self._inflight[key] = {'task': task, 'waiters': 0}
+            task.add_done_callback(lambda _: self._forget(key, entry))
+            shared = False
+        else:
+            self.collapsed += 1
+            shared = True
+
+        entry['waiters'] += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(entry['task']), timeout)
+        finally:
+            entry['waiters'] -= 1
+            if entry['waiters'] == 0 and not entry['task'].done():
+                entry['task'].cancel()
+        return result.copy() if shared and isinstance(result, pd.DataFrame) else result
+
+    async def run_all(self, methods=None, timeout=None, **options):
+        """Await several analyses concurrently and return {method name: DataFrame}"""
+        methods = list(methods or ANALYSES)
+        results = await asyncio.gather(*(self.query(method, timeout, **options) for method in methods))
+        return dict(zip(methods, results))
+
+    async def genre_popularity_analysis(self, **options):
+        return await self.query('genre_popularity_analysis', **options)
+
+    async def director_performance_metrics(self, **options):
+        return await self.query('director_performance_metrics', **options)
+
+    async def rating_distribution_analysis(self, **options):
+        return await self.query('rating_distribution_analysis', **options)
+
+    async def actor_collaboration_network(self, **options):
+        return await self.query('actor_collaboration_network', **options)
+
+    async def seasonal_release_patterns(self, **options):
+        return await self.query('seasonal_release_patterns', **options)
+
+    async def budget_vs_rating_correlation(self, **options):
+        return await self.query('budget_vs_rating_correlation', **options)
+
+    async def rating_quantiles(self, **options):
+        return await self.query('rating_quantiles', **options)
+
+    async def rating_histogram(self, **options):
+        return await self.query('rating_histogram', **options)
+
+    async def user_rating_profiles(self, **options):
+        return await self.query('user_rating_profiles', **options)
+
+    async def user_bias_adjusted_ratings(self, **options):
+        return await self.query('user_bias_adjusted_ratings', **options)
+
+    async def movie_leaderboard(self, **options):
+        return await self.query('movie_leaderboard', **options)
+
+    async def movie_rating_trend(self, **options):
+        return await self.query('movie_rating_trend', **options)
+
+    async def genre_rating_trend(self, **options):
+        return await self.query('genre_rating_trend', **options)
+
+    async def trending_movies(self, **options):
+        return await self.query('trending_movies', **options)
+
+    async def close(self):
+        """Cancel queued work, wait for running queries and release the connections"""
+        for entry in list(self._inflight.values()):
+            entry['task'].cancel()
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+            self._pool.close()
+            self._executor = self._pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def _simulate(args):
+    requests = [random.choice(ANALYSES) for _ in range(args.requests)]
+    async with AsyncMovieAnalytics(args.db, cache=None if args.no_cache else QueryCache(),
+                                   max_workers=args.workers, timeout=args.timeout) as service:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(service.query(method) for method in requests),
+                                       return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        timeouts = sum(isinstance(result, asyncio.TimeoutError) for result in results)
+        print(f"{len(requests)} concurrent requests in {elapsed:.2f}s on {args.workers} worker threads "
+              f"({threading.active_count()} threads alive)")
+        print(f"Executed {service.executed} queries, collapsed {service.collapsed} duplicates, "
+              f"{timeouts} timed out, {service.interrupted} interrupted")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a burst of concurrent dashboard requests')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per request')
+    parser.add_argument('--no-cache', action='store_true', help='always query the database')
+    asyncio.run(_simulate(parser.parse_args()))
@@ -0,0 +1,215 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+
+# name -> (movies, ratings)
+SIZES = {
+    '1k': (50, 1000),
+    '100k': (1000, 100000),
+    '10m': (100000, 10000000),
+    '100m': (1000000, 100000000),
+}
+
+ANALYTICS_CASES = [
+    'genre_popularity_analysis',
+    'director_performance_metrics',
+    'rating_distribution_analysis',
+    'actor_collaboration_network',
+    'seasonal_release_patterns',
+    'budget_vs_rating_correlation',
+]
+
+CHART_CASES = [
+    'create_genre_popularity_chart',
+    'create_director_performance_chart',
+    'create_rating_distribution_chart',
+    'create_seasonal_analysis_chart',
+    'create_budget_analysis_chart',
+]
+
+REPORT_CASES = ['generate_html_report']
+
+VM_STEP_INTERVAL = 1000
+
+
+def build_database(size, data_dir='bench_data', rebuild=False):
+    """Create (or reuse) a generated database for one of the benchmark sizes
+
+    Returns the database path and the generation measurement, or None when an
+    existing database was reused.
+    """
+    from data_generator import DataGenerator
+
+    os.makedirs(data_dir, exist_ok=True)
+    db_path = os.path.abspath(os.path.join(data_dir, f'movies_{size}.db'))
+    if not rebuild and os.path.exists(db_path):
+        return db_path, None
+
+    num_movies, num_ratings = SIZES[size]
+    print(f"Building {size} database ({num_ratings:,} ratings)...")
+    start = time.perf_counter()
+    DataGenerator(db_path, num_movies=num_movies, num_ratings=num_ratings,
+                  num_users=max(1000, num_ratings // 50)).generate()
+    return db_path, {'wall_seconds': time.perf_counter() - start, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def estimate_rows_scanned(conn, query):
+    """Rows read by full (table or covering index) scans in the query plan"""
+    from index_manager import explain, plan_tables
+
+    tables = plan_tables(conn, query)
+    total = 0
+    for step in explain(conn, query):
+        match = re.match(r'SCAN (\w+)', step)
+        if match and match.group(1) in tables:
+            total += conn.execute(f'SELECT COUNT(*) FROM {tables[match.group(1)]}').fetchone()[0]
+    return total
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_case(db_path, case, workdir, results):
+    os.chdir(workdir)
+    os.environ['MPLBACKEND'] = 'Agg'
+    from analysis_queries import MovieAnalytics, QUERIES
+
+    analytics = MovieAnalytics(db_path)
+    measurement = {}
+    if case in ANALYTICS_CASES:
+        # The SQL the analysis actually runs (the cube rollup when it answers
+        # it); resolving it builds the cube up front, outside the timing
+        query = analytics._query(case) if case in QUERIES else None
+        steps = [0]
+
+        def count_steps():
+            steps[0] += VM_STEP_INTERVAL
+            return 0
+
+        # Bind the query to one connection so the progress handler sees it
+        conn = analytics.get_connection()
+        conn.set_progress_handler(count_steps, VM_STEP_INTERVAL)
+        analytics._local.conn = conn
+        start = time.perf_counter()
+        df = getattr(analytics, case)()
+        measurement['wall_seconds'] = time.perf_counter() - start
+        conn.set_progress_handler(None, 0)
+        analytics._local.conn = None
+        measurement['rows_returned'] = len(df)
+        measurement['vm_steps'] = steps[0]
+        # The collaboration network is computed from a sparse graph, not one query
+        if query is not None:
+            measurement['rows_scanned'] = estimate_rows_scanned(conn, query)
+    elif case in CHART_CASES:
+        from visualizations import MovieVisualizations
+        viz = MovieVisualizations(analytics)
+        start = time.perf_counter()
+        getattr(viz, case)()
+        measurement['wall_seconds'] = time.perf_counter() - start
+    else:
+        from generate_report import ReportGenerator
+        generator = ReportGenerator(analytics)
+        start = time.perf_counter()
+        generator.generate_html_report()
+        measurement['wall_seconds'] = time.perf_counter() - start
+    measurement['peak_rss_mb'] = _peak_rss_mb()
+    results.put(measurement)
+
+
+def run_case(db_path, case, repeat=1):
+    """Run one case in fresh processes and keep the fastest of `repeat` runs"""
+    context = multiprocessing.get_context('spawn')
+    best = None
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(repeat):
+            results = context.Queue()
+            process = context.Process(target=_run_case, args=(db_path, case, workdir, results))
+            process.start()
+            measurement = results.get()
+            process.join()
+            if best is None or measurement['wall_seconds'] < best['wall_seconds']:
+                best = measurement
+    return best
+
+
+def run_benchmarks(sizes, cases, repeat=1, data_dir='bench_data', rebuild=False):
+    records = []
+    for size in sizes:
+        db_path, generation = build_database(size, data_dir, rebuild)
+        if generation is not None:
+            records.append({'size': size, 'case': 'generate_database', **generation})
+        for case in cases:
+            measurement = run_case(db_path, case, repeat)
+            records.append({'size': size, 'case': case, **measurement})
+            print(f"[{size}] {case}: {measurement['wall_seconds'] * 1000:.1f}ms, "
+                  f"peak RSS {measurement['peak_rss_mb']:.0f}MB")
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': repeat,
+        },
+        'results': records,
+    }
+
+
+def find_regressions(baseline, current, threshold=0.25, min_seconds=0.005):
+    """Cases whose wall time grew by more than `threshold` relative to the baseline"""
+    previous = {(r['size'], r['case']): r for r in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        before = previous.get((record['size'], record['case']))
+        if before is None:
+            continue
+        # Ignore noise on cases that are too fast to time reliably
+        if record['wall_seconds'] < min_seconds:
+            continue
+        ratio = record['wall_seconds'] / max(before['wall_seconds'], 1e-9)
+        if ratio > 1 + threshold:
+            regressions.append((record['size'], record['case'], before['wall_seconds'],
+                                record['wall_seconds'], ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark data generation, analytics, charts and report')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['1k', '100k'])
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='subset of cases to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default='bench_data')
+    parser.add_argument('--rebuild', action='store_true', help='regenerate the benchmark databases')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative slowdown before a case counts as a regression')
+    args = parser.parse_args()
+
+    cases = args.cases or ANALYTICS_CASES + CHART_CASES + REPORT_CASES
+    results = run_benchmarks(args.sizes, cases, args.repeat, args.data_dir, args.rebuild)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(baseline, results, args.threshold)
+        for size, case, before, after, ratio in regressions:
+            print(f"REGRESSION [{size}] {case}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print("No regressions above threshold")
@@ -0,0 +1,263 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+COLLABORATION_COLUMNS = ['actor1', 'actor2', 'collaborations', 'avg_collab_rating', 'movies_together']
+
+# Stay well below SQLite's host parameter limit
+_PARAMS_PER_QUERY = 500
+
+
+def fetch_titles(conn, movie_ids):
+    """Titles for a set of movie ids as a Series indexed by movie_id"""
+    movie_ids = [int(movie_id) for movie_id in movie_ids]
+    titles = {}
+    for start in range(0, len(movie_ids), _PARAMS_PER_QUERY):
+        chunk = movie_ids[start:start + _PARAMS_PER_QUERY]
+        placeholders = ', '.join('?' * len(chunk))
+        titles.update(conn.execute(
+            f'SELECT movie_id, title FROM movies WHERE movie_id IN ({placeholders})', chunk))
+    return pd.Series(titles, dtype=object)
+
+
+class CollaborationGraph:
+    """Sparse actor co-occurrence graph built from movie_actors
+
+    Credits form an actor x movie incidence matrix A, so the number of films two
+    actors share is (A @ A.T)[i, j] and the sum of those films' average ratings
+    is (A @ diag(rating) @ A.T)[i, j]. The sparse product only touches pairs that
+    actually appear together, instead of materializing every joined row the way
+    a movie_actors self-join does, and titles are looked up only for the pairs
+    that are finally returned. Only rated movies are included, matching the SQL
+    analyses. The graph is a snapshot of the tables it was built from.
+    """
+
+    def __init__(self, actors, credits, movie_ratings, load_titles):
+        """actors: actor_id/name frame, credits: movie_id/actor_id frame,
+        movie_ratings: average rating per movie_id, load_titles: movie ids -> titles Series
+        """
+        actors = actors.sort_values('actor_id', ignore_index=True)
+        movie_ratings = movie_ratings.sort_index()
+        self.actor_ids = actors['actor_id'].to_numpy(np.int64)
+        self.actor_names = actors['name'].to_numpy(object)
+        self.movie_ids = movie_ratings.index.to_numpy(np.int64)
+        self.movie_ratings = movie_ratings.to_numpy(np.float64)
+        self.load_titles = load_titles
+
+        credit_actors = self._positions(self.actor_ids, credits['actor_id'].to_numpy(np.int64))
+        credit_movies = self._positions(self.movie_ids, credits['movie_id'].to_numpy(np.int64))
+        keep = (credit_actors >= 0) & (credit_movies >= 0)
+        self.incidence = sparse.csr_matrix(
+            (np.ones(keep.sum()), (credit_actors[keep], credit_movies[keep])),
+            shape=(len(self.actor_ids), len(self.movie_ids)))
+        self.incidence.sum_duplicates()
+        self.incidence.data[:] = 1
+        self.incidence.sort_indices()
+
+        counts = (self.incidence @ self.incidence.T).tocsr()
+        rating_sums = (self.incidence.multiply(self.movie_ratings).tocsr() @ self.incidence.T).tocsr()
+        counts.sort_indices()
+        rating_sums.sort_indices()
+
+        # Every pair once (i < j); ratings are >= 1 so both products share a pattern
+        upper = sparse.triu(counts, k=1).tocoo()
+        upper_sums = sparse.triu(rating_sums, k=1).tocoo()
+        self.pair_rows = upper.row.astype(np.int64)
+        self.pair_cols = upper.col.astype(np.int64)
+        self.pair_counts = upper.data.astype(np.int64)
+        self.pair_rating_sums = upper_sums.data
+
+        adjacency = counts - sparse.diags(counts.diagonal())
+        adjacency.eliminate_zeros()
+        self.adjacency = adjacency.tocsr()
+
+    @staticmethod
+    def _positions(sorted_ids, ids):
+        """Row positions of ids in a sorted id array, with -1 for unknown ids"""
+        if len(sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == ids, positions, -1)
+
+    @classmethod
+    def from_sqlite(cls, db_path='movies.db'):
+        """Build the graph from movie_actors, actors and movie_rating_stats"""
+        conn = sqlite3.connect(db_path)
+        try:
+            graph = cls.from_connection(conn)
+        finally:
+            conn.close()
+
+        def load_titles(movie_ids):
+            conn = sqlite3.connect(db_path)
+            try:
+                return fetch_titles(conn, movie_ids)
+            finally:
+                conn.close()
+
+        graph.load_titles = load_titles
+        return graph
+
+    @classmethod
+    def from_connection(cls, conn):
+        """Build the graph over an open connection, which also serves the title lookups"""
+        actors = pd.read_sql_query('SELECT actor_id, name FROM actors', conn)
+        credits = pd.read_sql_query('SELECT movie_id, actor_id FROM movie_actors', conn)
+        ratings = pd.read_sql_query('''
+            SELECT movie_id, rating_sum / rating_count as avg_rating
+            FROM movie_rating_stats
+            WHERE rating_count > 0
+        ''', conn)
+        return cls(actors, credits, ratings.set_index('movie_id')['avg_rating'],
+                   lambda movie_ids: fetch_titles(conn, movie_ids))
+
+    def _actor_position(self, actor_id):
+        position = self._positions(self.actor_ids, np.array([actor_id], dtype=np.int64))[0]
+        if position < 0:
+            raise KeyError(f"unknown actor_id {actor_id}")
+        return position
+
+    def _shared_titles(self, rows, cols):
+        """', '-joined titles of the movies each (row, col) actor pair has in common"""
+        indptr, indices = self.incidence.indptr, self.incidence.indices
+        shared = [np.intersect1d(indices[indptr[a]:indptr[a + 1]], indices[indptr[b]:indptr[b + 1]],
+                                 assume_unique=True)
+                  for a, b in zip(rows.tolist(), cols.tolist())]
+        needed = np.unique(np.concatenate(shared)) if shared else np.array([], dtype=np.int64)
+        titles = self.load_titles(self.movie_ids[needed]).reindex(self.movie_ids)
+        titles = titles.fillna('').to_numpy(object)
+        return [', '.join(titles[movies]) for movies in shared]
+
+    def _pairs(self, min_collaborations, top_k):
+        """(rows, cols, counts, avg) of the selected pairs in result order"""
+        keep = self.pair_counts >= min_collaborations
+        rows = self.pair_rows[keep]
+        cols = self.pair_cols[keep]
+        counts = self.pair_counts[keep]
+        avg = self.pair_rating_sums[keep] / counts
+
+        if top_k is not None:
+            # Rank every pair from the point of view of both of its actors
+            pair = np.arange(len(rows))
+            actor = np.concatenate([rows, cols])
+            order = np.lexsort((-np.tile(avg, 2), -np.tile(counts, 2), actor))
+            starts = np.searchsorted(actor[order], actor[order], side='left')
+            rank = np.arange(len(order)) - starts
+            selected = np.zeros(len(rows), dtype=bool)
+            selected[np.tile(pair, 2)[order][rank < top_k]] = True
+            rows, cols, counts, avg = rows[selected], cols[selected], counts[selected], avg[selected]
+
+        order = np.lexsort((-avg, -counts))
+        return rows[order], cols[order], counts[order], avg[order]
+
+    def _pair_frame(self, rows, cols, counts, avg, with_titles):
+        result = pd.DataFrame({
+            'actor1': self.actor_names[rows],
+            'actor2': self.actor_names[cols],
+            'collaborations': counts,
+            'avg_collab_rating': avg,
+        })
+        if with_titles:
+            result['movies_together'] = self._shared_titles(rows, cols)
+        return result
+
+    def collaborations(self, min_collaborations=2, top_k=None, with_titles=True):
+        """Actor pairs that made at least min_collaborations rated movies together
+
+        With top_k, only pairs that are among the top_k strongest partnerships
+        (by shared movies, then average rating) of either actor are returned.
+        Sorted by collaborations, then average rating, like the SQL analysis.
+        """
+        return self._pair_frame(*self._pairs(min_collaborations, top_k), with_titles)
+
+    def collaboration_chunks(self, min_collaborations=2, top_k=None, chunksize=10000, with_titles=True):
+        """Same rows as collaborations(), yielded chunksize rows at a time
+
+        Shared titles are only joined for the pairs of the current chunk.
+        """
+        rows, cols, counts, avg = self._pairs(min_collaborations, top_k)
+        for start in range(0, len(rows), chunksize):
+            chunk = slice(start, start + chunksize)
+            yield self._pair_frame(rows[chunk], cols[chunk], counts[chunk], avg[chunk], with_titles)
+
+    def degree(self):
+        """Number of rated movies and distinct collaborators per actor"""
+        result = pd.DataFrame({
+            'actor_id': self.actor_ids,
+            'name': self.actor_names,
+            'movies': np.diff(self.incidence.indptr),
+            'collaborators': np.diff(self.adjacency.indptr),
+        })
+        return result.sort_values(['collaborators', 'movies'], ascending=False,
+                                  kind='stable', ignore_index=True)
+
+    def connected_components(self):
+        """Component label per actor; labels are numbered from the largest component down"""
+        _, labels = csgraph.connected_components(self.adjacency, directed=False)
+        sizes = np.bincount(labels)
+        rank = np.empty(len(sizes), dtype=np.int64)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+        return pd.DataFrame({
+            'actor_id': self.actor_ids,
+            'name': self.actor_names,
+            'component': rank[labels],
+            'component_size': sizes[labels],
+        })
+
+    def shortest_path(self, source_actor_id, target_actor_id):
+        """Fewest-hops chain of collaborations between two actors
+
+        Returns one row per hop (actor1, actor2, movies_together), an empty frame
+        when source and target are the same actor, or None when they are not
+        connected.
+        """
+        source = self._actor_position(source_actor_id)
+        target = self._actor_position(target_actor_id)
+        _, predecessors = csgraph.breadth_first_order(self.adjacency, source, directed=False,
+                                                      return_predecessors=True)
+        if source != target and predecessors[target] < 0:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(predecessors[path[-1]])
+        path = np.array(path[::-1], dtype=np.int64)
+        return pd.DataFrame({
+            'actor1': self.actor_names[path[:-1]],
+            'actor2': self.actor_names[path[1:]],
+            'movies_together': self._shared_titles(path[:-1], path[1:]),
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Actor collaboration graph queries')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--min-collaborations', type=int, default=2)
+    parser.add_argument('--top-k', type=int, default=None)
+    parser.add_argument('--path', nargs=2, type=int, metavar=('ACTOR_ID', 'ACTOR_ID'),
+                        help='print the shortest collaboration path between two actors')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = CollaborationGraph.from_sqlite(args.db)
+    print(f"Built graph of {len(graph.actor_ids):,} actors and {len(graph.pair_counts):,} "
+          f"collaborating pairs in {time.perf_counter() - start:.2f}s")
+
+    print("\nStrongest collaborations:")
+    print(graph.collaborations(args.min_collaborations, args.top_k).head(10))
+
+    print("\nMost connected actors:")
+    print(graph.degree().head(10))
+
+    components = graph.connected_components()
+    print(f"\n{components['component'].nunique():,} connected components, "
+          f"largest has {components['component_size'].max():,} actors")
+
+    if args.path:
+        hops = graph.shortest_path(*args.path)
+        print("\nShortest path:")
+        print("not connected" if hops is None else hops)
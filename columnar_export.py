@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs
+from connection_pool import connect_read_only
+from report_fragments import create_table_versions, has_table_versions, signature, table_signatures
+
+DEFAULT_EXPORT_DIR = 'columnar_export'
+FORMATS = ('parquet', 'arrow')
+
+# Movie-level tables are split into genre=<genre>/release_year=<year> directories
+PARTITION_SCHEMA = pa.schema([('genre', pa.string()), ('release_year', pa.string())])
+
+# Table name -> export query. movies.genre is stored as the partition column.
+EXPORT_QUERIES = {
+    'directors': 'SELECT director_id, name, birth_year FROM directors',
+    'actors': 'SELECT actor_id, name, birth_year FROM actors',
+    'movies': 'SELECT movie_id, title, release_date, director_id, budget, box_office FROM movies',
+    'movie_actors': 'SELECT movie_id, actor_id, role_type FROM movie_actors',
+    'movie_ratings': 'SELECT rating_id, movie_id, user_id, rating, review_date FROM movie_ratings',
+    'movie_rating_stats': '''
+        SELECT movie_id, rating_count, rating_sum, rating_sum_sq, min_rating, max_rating
+        FROM movie_rating_stats
+    ''',
+}
+
+PARTITIONED_TABLES = {'movies', 'movie_actors', 'movie_ratings', 'movie_rating_stats'}
+
+_ARROW_TYPES = {'INTEGER': pa.int64(), 'REAL': pa.float64()}
+
+# export_dir/manifest.json records, per format and table, a signature of the
+# SQLite rows the files were written from; readers compare it to detect
+# exports the database has moved past.
+MANIFEST = 'manifest.json'
+
+# movie_ratings has no version counter (see report_fragments.py), so its
+# export is signed with checksums over every exported column
+RATINGS_CHECKSUM_SQL = '''
+    SELECT COUNT(*), TOTAL(rating_id), TOTAL(rating_id * movie_id), TOTAL(rating_id * user_id),
+           TOTAL(rating_id * rating), TOTAL(rating_id * julianday(review_date))
+    FROM movie_ratings
+'''
+
+
+def _table_schema(conn, table, query):
+    """Arrow schema from the declared SQLite column types (TEXT and DATE map to string)
+
+    table_xinfo also lists generated columns, which the compact schema uses
+    for ratings and dates.
+    """
+    cursor = conn.execute(f'SELECT * FROM ({query}) LIMIT 0')
+    declared = {column: decltype.upper()
+                for _, column, decltype, *_ in conn.execute(f'PRAGMA table_xinfo({table})')}
+    schema = pa.schema([(column[0], _ARROW_TYPES.get(declared.get(column[0]), pa.string()))
+                        for column in cursor.description])
+    if table in PARTITIONED_TABLES:
+        schema = pa.unify_schemas([schema, PARTITION_SCHEMA])
+    return schema
+
+
+def _partition_keys(conn):
+    """movie_id -> (genre, release year) lookup as Arrow arrays"""
+    rows = conn.execute("SELECT movie_id, genre, strftime('%Y', release_date) FROM movies").fetchall()
+    movie_ids, genres, years = zip(*rows) if rows else ((), (), ())
+    return (pa.array(movie_ids, type=pa.int64()), pa.array(genres, type=pa.string()),
+            pa.array(years, type=pa.string()))
+
+
+def _batches(conn, query, schema, chunk_rows, keys=None):
+    """Record batches of a query; with keys, the movie's partition columns are appended
+
+    The partition keys are looked up with Arrow compute rather than joined in
+    SQL, which would evaluate strftime once per rating.
+    """
+    cursor = conn.execute(query)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        if keys is not None:
+            movie_ids, genres, years = keys
+            positions = pc.index_in(arrays[0], value_set=movie_ids)
+            arrays += [pc.take(genres, positions), pc.take(years, positions)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_path(export_dir, fmt, table):
+    return os.path.join(export_dir, fmt, table)
+
+
+def source_signatures(conn, tables):
+    """{table: signature of the SQLite rows its export is built from}
+
+    Partitioned tables also depend on movies, which supplies their genre and
+    release year. Returns None when the database has no table_versions
+    counters, which only export_database() installs.
+    """
+    if not has_table_versions(conn):
+        return None
+    versions = table_signatures(conn)
+    versions['movie_rating_stats'] = versions.pop('movie_ratings')
+    signatures = {}
+    for table in tables:
+        if table == 'movie_ratings':
+            parts = [list(conn.execute(RATINGS_CHECKSUM_SQL).fetchone())]
+        else:
+            parts = [versions[table]]
+        if table in PARTITIONED_TABLES:
+            parts.append(versions['movies'])
+        signatures[table] = signature(table, *parts)
+    return signatures
+
+
+def read_manifest(export_dir=DEFAULT_EXPORT_DIR):
+    try:
+        with open(os.path.join(export_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(export_dir, manifest):
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def stale_tables(db_path='movies.db', export_dir=DEFAULT_EXPORT_DIR, tables=None, fmt='arrow'):
+    """Tables whose export is missing or older than the database content
+
+    Only reads the database; without version counters every table is stale.
+    """
+    tables = list(tables or EXPORT_QUERIES)
+    conn = connect_read_only(db_path)
+    try:
+        current = source_signatures(conn, tables)
+    finally:
+        conn.close()
+    if current is None:
+        return tables
+    recorded = read_manifest(export_dir).get(fmt, {})
+    return [table for table in tables if recorded.get(table) != current[table]]
+
+
+def export_database(db_path='movies.db', export_dir=DEFAULT_EXPORT_DIR, formats=FORMATS,
+                    tables=None, chunk_rows=100000):
+    """Write every table as a Parquet and/or Arrow IPC dataset; returns {table: rows}
+
+    Rows are streamed from SQLite in record batches, so memory use depends on
+    chunk_rows rather than on table size. Arrow files are written uncompressed,
+    one record batch per file where it fits, so readers can memory-map them
+    and view whole columns without copying. Each table's source signature is
+    recorded in the export manifest once its files are complete.
+    """
+    tables = list(tables or EXPORT_QUERIES)
+    # write_dataset pulls batches from its own thread while this one waits
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    written = {}
+    try:
+        if not has_table_versions(conn):
+            create_table_versions(conn)
+            conn.commit()
+        signatures = source_signatures(conn, tables)
+        manifest = read_manifest(export_dir)
+        # Tables being rewritten are unsigned until their files are complete
+        for fmt in formats:
+            for table in tables:
+                manifest.get(fmt, {}).pop(table, None)
+        _write_manifest(export_dir, manifest)
+
+        keys = _partition_keys(conn)
+        for table in tables:
+            query = EXPORT_QUERIES[table]
+            schema = _table_schema(conn, table, query)
+            partitioned = table in PARTITIONED_TABLES
+            # Only the first format is read from SQLite; the others are converted from it
+            source = _batches(conn, query, schema, chunk_rows, keys if partitioned else None)
+            for fmt in formats:
+                path = export_path(export_dir, fmt, table)
+                shutil.rmtree(path, ignore_errors=True)
+                ds.write_dataset(
+                    source, path, schema=schema,
+                    format='ipc' if fmt == 'arrow' else fmt,
+                    partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive') if partitioned else None,
+                    basename_template='part-{i}.' + fmt,
+                    max_partitions=1 << 20,
+                    min_rows_per_group=1 << 20 if fmt == 'arrow' else 0,
+                )
+                source = open_dataset(export_dir, table, fmt)
+                manifest.setdefault(fmt, {})[table] = signatures[table]
+                _write_manifest(export_dir, manifest)
+            written[table] = source.count_rows()
+    finally:
+        conn.close()
+    return written
+
+
+def open_dataset(export_dir=DEFAULT_EXPORT_DIR, table='movies', fmt='arrow'):
+    """Dataset over one exported table; Arrow IPC files are memory-mapped"""
+    return ds.dataset(
+        export_path(export_dir, fmt, table),
+        format='ipc' if fmt == 'arrow' else fmt,
+        partitioning=(ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+                      if table in PARTITIONED_TABLES else None),
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def read_table(export_dir=DEFAULT_EXPORT_DIR, table='movies', columns=None, fmt='arrow'):
+    """Exported table as a pyarrow Table; IPC buffers point into the mapped files"""
+    return open_dataset(export_dir, table, fmt).to_table(columns=columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export movies.db to Parquet and Arrow IPC datasets')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--output-dir', default=DEFAULT_EXPORT_DIR)
+    parser.add_argument('--format', choices=FORMATS, action='append',
+                        help='format to write (repeatable; default: both)')
+    parser.add_argument('--chunk-rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = export_database(args.db, args.output_dir, args.format or FORMATS,
+                              chunk_rows=args.chunk_rows)
+    for table, rows in written.items():
+        print(f"{table}: {rows:,} rows")
+    print(f"Exported {sum(written.values()):,} rows to {args.output_dir}/ "
+          f"in {time.perf_counter() - start:.2f}s")
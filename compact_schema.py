@@ -0,0 +1,532 @@
+import argparse
+import re
+import sqlite3
+import time
+from datetime import date
+
+# Compact storage for the large and repetitive columns:
+#   dates               -> integer day numbers (days since 1970-01-01)
+#   movies.genre        -> genre_id referencing a genres lookup table
+#   role_type           -> role_code referencing role_types
+#   movie_ratings.rating -> rating_tenths, a one-byte integer
+# The original columns stay readable under their old names as VIRTUAL
+# generated columns, so code that only reads them keeps working. Release
+# year and month are STORED generated columns, computed once per write
+# instead of by strftime in every query.
+EPOCH = date(1970, 1, 1)
+TO_DAY = "CAST(julianday({value}) - 2440587.5 AS INTEGER)"
+TO_DATE = "date({value} + 2440587.5)"
+
+GENRES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS genres (
+        genre_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+'''
+
+ROLE_TYPES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS role_types (
+        role_code INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+'''
+
+# Legacy column -> the stored column it is generated from. UPDATE OF triggers
+# only fire for columns named in the statement's SET clause, which now names
+# the stored column.
+STORED_COLUMNS = {
+    'genre': 'genre_id',
+    'release_date': 'release_day',
+    'role_type': 'role_code',
+    'rating': 'rating_tenths',
+    'review_date': 'review_day',
+}
+
+# Lookup tables are a few rows long, so scanning them in a join is expected
+LOOKUP_TABLES = ('genres', 'role_types')
+
+# Indexes recreated on the compact columns instead of their virtual copies
+COMPACT_INDEXES = {
+    'idx_movies_genre': 'movies (genre_id, release_day, box_office, budget)',
+    'idx_movies_director': 'movies (director_id, release_day, box_office, budget)',
+    'idx_movie_ratings_user': 'movie_ratings (user_id, movie_id, rating_tenths)',
+}
+
+
+# Generated columns cannot look names up in another table, so the genre and
+# role_type columns carry a CASE over the lookup rows and are regenerated by
+# sync_lookup_columns whenever a lookup table changes. Until then, rows using
+# a code the CASE does not know are rejected instead of reading back as NULL,
+# which aggregates keyed on the name would silently lose. Renames are rejected
+# too, since the cube, leaderboards and trends store the names they saw.
+LOOKUP_GUARD_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_{name}_check_{event}
+    AFTER {'INSERT' if event == 'insert' else f'UPDATE OF {code}'} ON {table}
+    WHEN NEW.{code} IS NOT NULL AND NEW.{name} IS NULL
+    BEGIN
+        SELECT RAISE(ABORT, 'unknown {code}; add it with compact_schema.add_lookup_name or run sync_lookup_columns');
+    END
+    """
+    for table, code, name in (('movies', 'genre_id', 'genre'), ('movie_actors', 'role_code', 'role_type'))
+    for event in ('insert', 'update')
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {lookup}_rename_check
+    BEFORE UPDATE OF {key}, name ON {lookup}
+    BEGIN
+        SELECT RAISE(ABORT, '{lookup} names are part of the movies schema and cached aggregates');
+    END
+    """
+    for lookup, key in (('genres', 'genre_id'), ('role_types', 'role_code'))
+]
+
+
+def _labels(conn, table, key):
+    return conn.execute(f'SELECT {key}, name FROM {table} ORDER BY {key}').fetchall()
+
+
+def _case(column, labels):
+    """CASE expression mapping lookup codes back to their names"""
+    whens = ' '.join(f"WHEN {code} THEN '{name.replace(chr(39), chr(39) * 2)}'" for code, name in labels)
+    return f'CASE {column} {whens} END' if labels else 'NULL'
+
+
+def movies_table_sql(name, genres):
+    return f'''
+        CREATE TABLE {name} (
+            movie_id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            genre_id INTEGER NOT NULL,
+            release_day INTEGER,
+            director_id INTEGER,
+            budget INTEGER,
+            box_office INTEGER,
+            released_year INTEGER GENERATED ALWAYS AS
+                (CAST(strftime('%Y', release_day + 2440587.5) AS INTEGER)) STORED,
+            released_month INTEGER GENERATED ALWAYS AS
+                (CAST(strftime('%m', release_day + 2440587.5) AS INTEGER)) STORED,
+            genre TEXT GENERATED ALWAYS AS ({_case('genre_id', genres)}) VIRTUAL,
+            release_date TEXT GENERATED ALWAYS AS ({TO_DATE.format(value='release_day')}) VIRTUAL,
+            FOREIGN KEY (genre_id) REFERENCES genres (genre_id),
+            FOREIGN KEY (director_id) REFERENCES directors (director_id)
+        )
+    '''
+
+
+def movie_actors_table_sql(name, roles):
+    return f'''
+        CREATE TABLE {name} (
+            movie_id INTEGER,
+            actor_id INTEGER,
+            role_code INTEGER,
+            role_type TEXT GENERATED ALWAYS AS ({_case('role_code', roles)}) VIRTUAL,
+            PRIMARY KEY (movie_id, actor_id),
+            FOREIGN KEY (movie_id) REFERENCES movies (movie_id),
+            FOREIGN KEY (actor_id) REFERENCES actors (actor_id),
+            FOREIGN KEY (role_code) REFERENCES role_types (role_code)
+        )
+    '''
+
+
+def ratings_table_sql(name, clustered=False):
+    """Compact movie_ratings; clustered keeps the WITHOUT ROWID (movie_id, rating_id) layout"""
+    key = 'NOT NULL' if clustered else 'PRIMARY KEY'
+    return f'''
+        CREATE TABLE {name} (
+            rating_id INTEGER {key},
+            movie_id INTEGER{' NOT NULL' if clustered else ''},
+            user_id INTEGER,
+            rating_tenths INTEGER CHECK (rating_tenths >= 10 AND rating_tenths <= 100),
+            review_day INTEGER,
+            rating REAL GENERATED ALWAYS AS (rating_tenths / 10.0) VIRTUAL,
+            review_date TEXT GENERATED ALWAYS AS ({TO_DATE.format(value='review_day')}) VIRTUAL,
+            {'PRIMARY KEY (movie_id, rating_id),' if clustered else ''}
+            FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+        ){' WITHOUT ROWID' if clustered else ''}
+    '''
+
+
+# Writers have to fill the compact columns; ratings are stored to 0.1
+RATING_INSERT_SQL = f'''
+    INSERT INTO movie_ratings (rating_id, movie_id, user_id, rating_tenths, review_day)
+    VALUES (?, ?, ?, CAST(round(? * 10) AS INTEGER), {TO_DAY.format(value='?')})
+'''
+
+COMPACT_GENRE_POPULARITY_QUERY = """
+    SELECT
+        genres.name as genre,
+        CAST(m.released_year AS TEXT) as release_year,
+        COUNT(*) as movie_count,
+        AVG(s.rating_sum / s.rating_count) as avg_genre_rating,
+        SUM(m.box_office) as total_box_office
+    FROM movies m
+    JOIN genres ON genres.genre_id = m.genre_id
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    GROUP BY genres.name, m.released_year
+    ORDER BY release_year, movie_count DESC
+    """
+
+COMPACT_DIRECTOR_PERFORMANCE_QUERY = """
+    SELECT
+        d.name as director_name,
+        COUNT(m.movie_id) as total_movies,
+        AVG(s.rating_sum / s.rating_count) as avg_director_rating,
+        AVG(m.box_office) as avg_box_office,
+        SUM(m.box_office) as total_box_office,
+        AVG(m.box_office - m.budget) as avg_profit,
+        date(MIN(m.release_day) + 2440587.5) as first_movie,
+        date(MAX(m.release_day) + 2440587.5) as latest_movie
+    FROM directors d
+    JOIN movies m ON d.director_id = m.director_id
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    GROUP BY d.director_id, d.name
+    HAVING COUNT(m.movie_id) >= 2
+    ORDER BY avg_director_rating DESC
+    """
+
+COMPACT_RATING_DISTRIBUTION_QUERY = """
+    SELECT
+        m.title,
+        genres.name as genre,
+        CAST(m.released_year AS TEXT) as release_year,
+        d.name as director,
+        s.rating_sum / s.rating_count as avg_rating,
+        s.rating_count as total_ratings,
+        s.min_rating,
+        s.max_rating,
+        (m.box_office - m.budget) as profit,
+        CASE
+            WHEN s.rating_sum / s.rating_count >= 8.0 THEN 'Excellent'
+            WHEN s.rating_sum / s.rating_count >= 7.0 THEN 'Good'
+            WHEN s.rating_sum / s.rating_count >= 6.0 THEN 'Average'
+            ELSE 'Poor'
+        END as rating_category
+    FROM movies m
+    JOIN genres ON genres.genre_id = m.genre_id
+    JOIN directors d ON m.director_id = d.director_id
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    ORDER BY avg_rating DESC
+    """
+
+COMPACT_SEASONAL_RELEASE_QUERY = """
+    SELECT
+        CASE
+            WHEN m.released_month IN (12, 1, 2) THEN 'Winter'
+            WHEN m.released_month IN (3, 4, 5) THEN 'Spring'
+            WHEN m.released_month IN (6, 7, 8) THEN 'Summer'
+            ELSE 'Fall'
+        END as season,
+        genres.name as genre,
+        COUNT(*) as movie_count,
+        AVG(s.rating_sum / s.rating_count) as avg_rating,
+        AVG(m.box_office) as avg_box_office,
+        AVG(m.box_office - m.budget) as avg_profit
+    FROM movies m
+    JOIN genres ON genres.genre_id = m.genre_id
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    GROUP BY season, genres.name
+    ORDER BY season, avg_rating DESC
+    """
+
+# Reads no dates or genres, so it is the same query on either layout
+COMPACT_BUDGET_RATING_QUERY = """
+    SELECT
+        m.title,
+        m.budget,
+        m.box_office,
+        (m.box_office - m.budget) as profit,
+        s.rating_sum / s.rating_count as avg_rating,
+        s.rating_count,
+        CASE
+            WHEN m.budget < 20000000 THEN 'Low Budget'
+            WHEN m.budget < 100000000 THEN 'Medium Budget'
+            ELSE 'High Budget'
+        END as budget_category
+    FROM movies m
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+    ORDER BY m.budget DESC
+    """
+
+COMPACT_QUERIES = {
+    'genre_popularity_analysis': COMPACT_GENRE_POPULARITY_QUERY,
+    'director_performance_metrics': COMPACT_DIRECTOR_PERFORMANCE_QUERY,
+    'rating_distribution_analysis': COMPACT_RATING_DISTRIBUTION_QUERY,
+    'seasonal_release_patterns': COMPACT_SEASONAL_RELEASE_QUERY,
+    'budget_vs_rating_correlation': COMPACT_BUDGET_RATING_QUERY,
+}
+
+
+def is_compact_schema(conn):
+    """Check whether the database has been migrated to the compact layout"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(movies)')]
+    return 'genre_id' in columns
+
+
+def day_number(value):
+    """Day number of a date; 'YYYY' and 'YYYY-MM' mean the first day of the period
+
+    Comparing day numbers then matches comparing the 'YYYY-MM-DD' strings
+    against the same prefix.
+    """
+    text = str(value)[:10]
+    text += '-01-01'[len(text) - 4:] if len(text) < 10 else ''
+    return (date.fromisoformat(text) - EPOCH).days
+
+
+def day_filter(since, until):
+    """SQL condition and parameters for a half-open [since, until) review_day window"""
+    where = ''
+    params = []
+    if since is not None:
+        where += ' AND review_day >= ?'
+        params.append(day_number(since))
+    if until is not None:
+        where += ' AND review_day < ?'
+        params.append(day_number(until))
+    return where, params
+
+
+def _check_convertible(conn):
+    """Refuse to migrate values the compact columns would not round-trip"""
+    problems = {
+        'movies.release_date': '''
+            SELECT COUNT(*) FROM movies
+            WHERE release_date IS NOT NULL AND date(release_date) IS NOT release_date
+        ''',
+        'movie_ratings.review_date': '''
+            SELECT COUNT(*) FROM movie_ratings
+            WHERE review_date IS NOT NULL AND date(review_date) IS NOT review_date
+        ''',
+        'movie_ratings.rating': '''
+            SELECT COUNT(*) FROM movie_ratings
+            WHERE rating IS NOT NULL AND (rating * 10 != ROUND(rating * 10) OR rating < 1 OR rating > 10)
+        ''',
+    }
+    for column, query in problems.items():
+        count = conn.execute(query).fetchone()[0]
+        if count:
+            raise ValueError(f"{count:,} values of {column} cannot be stored compactly "
+                             "(dates must be YYYY-MM-DD, ratings multiples of 0.1 in 1-10)")
+
+
+def _with_stored_columns(trigger_sql):
+    """Add the stored column of every legacy column in an UPDATE OF list"""
+    def extend(match):
+        columns = [column.strip() for column in match.group(1).split(',')]
+        columns += [STORED_COLUMNS[column] for column in columns
+                    if column in STORED_COLUMNS and STORED_COLUMNS[column] not in columns]
+        return f"UPDATE OF {', '.join(columns)} ON"
+    return re.sub(r'UPDATE\s+OF\s+(.*?)\s+ON\b', extend, trigger_sql, flags=re.IGNORECASE | re.DOTALL)
+
+
+def _rebuild(conn, table, create_sql, copy_sql):
+    """Replace a table by a new layout, keeping its indexes and triggers"""
+    dependents = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''', (table,)).fetchall()
+    conn.execute(create_sql)
+    conn.execute(copy_sql)
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_compact RENAME TO {table}')
+    for kind, name, sql in dependents:
+        if kind == 'index' and name in COMPACT_INDEXES:
+            sql = f'CREATE INDEX {name} ON {COMPACT_INDEXES[name]}'
+        elif kind == 'trigger':
+            sql = _with_stored_columns(sql)
+        conn.execute(sql)
+
+
+def _baked_case(conn, table, column, labels):
+    """Whether table's generated column still maps exactly the given lookup rows"""
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    return f'AS ({_case(column, labels)}) VIRTUAL' in sql
+
+
+def sync_lookup_columns(conn):
+    """Regenerate movies.genre and movie_actors.role_type from the current lookup rows
+
+    Rebuilds only the tables whose CASE no longer matches genres or role_types
+    and returns their names. The stored columns are copied unchanged, so
+    nothing built from them needs refreshing.
+    """
+    if not is_compact_schema(conn):
+        return []
+    rebuilt = []
+    conn.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        with conn:
+            genres = _labels(conn, 'genres', 'genre_id')
+            if not _baked_case(conn, 'movies', 'genre_id', genres):
+                _rebuild(conn, 'movies', movies_table_sql('movies_compact', genres), '''
+                    INSERT INTO movies_compact
+                        (movie_id, title, genre_id, release_day, director_id, budget, box_office)
+                    SELECT movie_id, title, genre_id, release_day, director_id, budget, box_office
+                    FROM movies
+                ''')
+                rebuilt.append('movies')
+            roles = _labels(conn, 'role_types', 'role_code')
+            if not _baked_case(conn, 'movie_actors', 'role_code', roles):
+                _rebuild(conn, 'movie_actors', movie_actors_table_sql('movie_actors_compact', roles), '''
+                    INSERT INTO movie_actors_compact (movie_id, actor_id, role_code)
+                    SELECT movie_id, actor_id, role_code FROM movie_actors
+                ''')
+                rebuilt.append('movie_actors')
+            for trigger_sql in LOOKUP_GUARD_TRIGGERS_SQL:
+                conn.execute(trigger_sql)
+    finally:
+        conn.execute('PRAGMA legacy_alter_table = OFF')
+    return rebuilt
+
+
+def add_lookup_name(conn, lookup, name):
+    """Add a genre or role type name (lookup is 'genres' or 'role_types') and return its code
+
+    The generated name column is regenerated right away, so rows can use the
+    new code as soon as this returns.
+    """
+    if lookup not in LOOKUP_TABLES:
+        raise ValueError(f"lookup must be one of {LOOKUP_TABLES}")
+    key = 'genre_id' if lookup == 'genres' else 'role_code'
+    with conn:
+        conn.execute(f'INSERT OR IGNORE INTO {lookup} (name) VALUES (?)', (name,))
+    code = conn.execute(f'SELECT {key} FROM {lookup} WHERE name = ?', (name,)).fetchone()[0]
+    sync_lookup_columns(conn)
+    return code
+
+
+def migrate_to_compact(conn):
+    """Convert movies, movie_actors and movie_ratings to the compact layout in place
+
+    Returns False when the database is already compact. Aggregates built from
+    these tables (rating stats, cube, histograms, samples) stay valid, since
+    every value reads back unchanged.
+    """
+    if is_compact_schema(conn):
+        return False
+    _check_convertible(conn)
+    clustered = 'WITHOUT ROWID' in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'movie_ratings'").fetchone()[0].upper()
+
+    # Triggers elsewhere still name the tables being swapped out; don't rewrite them
+    conn.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        with conn:
+            conn.execute(GENRES_TABLE_SQL)
+            conn.execute('INSERT OR IGNORE INTO genres (name) SELECT DISTINCT genre FROM movies ORDER BY 1')
+            conn.execute(ROLE_TYPES_TABLE_SQL)
+            conn.execute('''
+                INSERT OR IGNORE INTO role_types (name)
+                SELECT DISTINCT role_type FROM movie_actors WHERE role_type IS NOT NULL ORDER BY 1
+            ''')
+
+            _rebuild(conn, 'movies', movies_table_sql('movies_compact', _labels(conn, 'genres', 'genre_id')), f'''
+                INSERT INTO movies_compact
+                    (movie_id, title, genre_id, release_day, director_id, budget, box_office)
+                SELECT m.movie_id, m.title, g.genre_id, {TO_DAY.format(value='m.release_date')},
+                       m.director_id, m.budget, m.box_office
+                FROM movies m
+                JOIN genres g ON g.name = m.genre
+            ''')
+            _rebuild(conn, 'movie_actors',
+                     movie_actors_table_sql('movie_actors_compact', _labels(conn, 'role_types', 'role_code')), '''
+                INSERT INTO movie_actors_compact (movie_id, actor_id, role_code)
+                SELECT a.movie_id, a.actor_id, r.role_code
+                FROM movie_actors a
+                LEFT JOIN role_types r ON r.name = a.role_type
+            ''')
+            _rebuild(conn, 'movie_ratings', ratings_table_sql('movie_ratings_compact', clustered), f'''
+                INSERT INTO movie_ratings_compact (rating_id, movie_id, user_id, rating_tenths, review_day)
+                SELECT rating_id, movie_id, user_id, CAST(ROUND(rating * 10) AS INTEGER),
+                       {TO_DAY.format(value='review_date')}
+                FROM movie_ratings
+                ORDER BY {'movie_id, rating_id' if clustered else 'rating_id'}
+            ''')
+            for trigger_sql in LOOKUP_GUARD_TRIGGERS_SQL:
+                conn.execute(trigger_sql)
+            conn.execute('ANALYZE')
+    finally:
+        conn.execute('PRAGMA legacy_alter_table = OFF')
+    return True
+
+
+def table_sizes(conn):
+    """Bytes used per table including its indexes (empty when dbstat is unavailable)"""
+    try:
+        rows = conn.execute('''
+            SELECT COALESCE(m.tbl_name, s.name), SUM(s.pgsize)
+            FROM dbstat s
+            LEFT JOIN sqlite_master m ON m.name = s.name
+            GROUP BY 1
+        ''').fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return dict(rows)
+
+
+def database_size(conn):
+    """Bytes in the database once the WAL, if any, is checkpointed into it"""
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    return page_count * conn.execute('PRAGMA page_size').fetchone()[0]
+
+
+def _time_workload(db_path, repeat):
+    """Best-of-repeat seconds for the SQL analyses and a ratings window, after a warm-up run"""
+    from analysis_queries import QUERIES, MovieAnalytics
+    analytics = MovieAnalytics(db_path, use_cube=False)
+    workload = {method: getattr(analytics, method) for method in QUERIES}
+    last_year = analytics.get_connection().execute('SELECT MAX(review_date) FROM movie_ratings').fetchone()[0]
+    since = f'{int(last_year[:4]) - 1}{last_year[4:]}' if last_year else None
+    workload['genre_popularity_analysis (last 12 months)'] = (
+        lambda: analytics.genre_popularity_analysis(since=since))
+    timings = {}
+    for label, run in workload.items():
+        run()
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert movies.db to the compact schema in place')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per query when timing')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if is_compact_schema(conn):
+        rebuilt = sync_lookup_columns(conn)
+        print(f"{args.db} already uses the compact schema"
+              + (f"; regenerated lookup names in {', '.join(rebuilt)}" if rebuilt else ''))
+        raise SystemExit
+    # migrate_to_compact ends with ANALYZE; do the same first so both runs plan from statistics
+    conn.execute('ANALYZE')
+    conn.execute('VACUUM')
+    size_before, tables_before = database_size(conn), table_sizes(conn)
+    timings_before = _time_workload(args.db, args.repeat)
+
+    start = time.perf_counter()
+    migrate_to_compact(conn)
+    conn.execute('VACUUM')
+    print(f"Migrated in {time.perf_counter() - start:.2f}s")
+    size_after, tables_after = database_size(conn), table_sizes(conn)
+    conn.close()
+    timings_after = _time_workload(args.db, args.repeat)
+
+    print(f"\n{'table':<28}{'before':>12}{'after':>12}")
+    for table in ('movies', 'movie_actors', 'movie_ratings'):
+        if table in tables_before:
+            print(f"{table:<28}{tables_before[table] / 2**20:>10.1f}MB{tables_after.get(table, 0) / 2**20:>10.1f}MB")
+    print(f"{'database file':<28}{size_before / 2**20:>10.1f}MB{size_after / 2**20:>10.1f}MB")
+
+    # Decoding the generated columns costs CPU, so the compact schema is not necessarily faster
+    print(f"\n{'query':<50}{'before':>10}{'after':>10}{'after/before':>14}")
+    for label, before in timings_before.items():
+        after = timings_after[label]
+        print(f"{label:<50}{before * 1000:>8.1f}ms{after * 1000:>8.1f}ms{after / before:>13.2f}x")
@@ -0,0 +1,59 @@
+import math
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+
+def enable_wal(db_path):
+    """Switch the database to WAL so readers never block on (or block) a writer"""
+    conn = sqlite3.connect(db_path)
+    try:
+        mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    finally:
+        conn.close()
+    return mode
+
+
+def add_math_functions(conn):
+    """Register SQRT on SQLite builds compiled without the math functions"""
+    try:
+        conn.execute('SELECT SQRT(1)')
+    except sqlite3.OperationalError:
+        conn.create_function('SQRT', 1, math.sqrt, deterministic=True)
+    return conn
+
+
+def connect_read_only(db_path, check_same_thread=False):
+    """Open a connection that cannot modify the database"""
+    uri = f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+    conn.execute('PRAGMA query_only = ON')
+    return add_math_functions(conn)
+
+
+class ReadOnlyConnectionPool:
+    """Fixed-size pool of read-only connections that can be shared across threads"""
+
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self.size = size
+        self._connections = [connect_read_only(db_path) for _ in range(size)]
+        self._idle = queue.Queue()
+        for conn in self._connections:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of the with-block"""
+        conn = self._idle.get(timeout=timeout)
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
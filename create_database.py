@@ -1,18 +1,40 @@
 import sqlite3
 import random
 from datetime import datetime, timedelta
+from leaderboards import drop_leaderboards
+from movie_cube import drop_movie_cube
+from partitions import drop_rating_partitions
+from rating_histograms import drop_rating_histograms
+from rating_sample import drop_rating_sample
+from rating_stats import create_rating_stats, drop_rating_stats
+from rating_trends import drop_rating_trends
+from recommender import drop_movie_similarity
+from report_fragments import drop_table_versions
+from user_rating_stats import drop_user_rating_stats
 
-def create_database():
-    """Create SQLite database with movie rating data"""
-    conn = sqlite3.connect('movies.db')
-    cursor = conn.cursor()
-    
+GENRES = ['Drama', 'Action', 'Comedy', 'Thriller', 'Sci-Fi', 'Horror', 'Romance', 'Adventure']
+ROLE_TYPES = ['Lead', 'Supporting', 'Cameo']
+
+def create_schema(cursor):
+    """Drop and recreate the movie tables"""
     # Drop existing tables if they exist
+    drop_rating_stats(cursor.connection)
+    drop_rating_sample(cursor.connection)
+    drop_rating_histograms(cursor.connection)
+    drop_movie_cube(cursor.connection)
+    drop_table_versions(cursor.connection)
+    drop_user_rating_stats(cursor.connection)
+    drop_movie_similarity(cursor.connection)
+    drop_leaderboards(cursor.connection)
+    drop_rating_trends(cursor.connection)
+    drop_rating_partitions(cursor.connection)
     cursor.execute('DROP TABLE IF EXISTS movie_ratings')
     cursor.execute('DROP TABLE IF EXISTS movies')
     cursor.execute('DROP TABLE IF EXISTS directors')
     cursor.execute('DROP TABLE IF EXISTS actors')
     cursor.execute('DROP TABLE IF EXISTS movie_actors')
+    cursor.execute('DROP TABLE IF EXISTS genres')
+    cursor.execute('DROP TABLE IF EXISTS role_types')
     
     # Create tables
     cursor.execute('''
@@ -65,6 +87,13 @@ def create_database():
             FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
         )
     ''')
+
+def create_database(db_path='movies.db'):
+    """Create SQLite database with movie rating data"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    create_schema(cursor)
     
     # Insert sample directors
     directors = [
@@ -104,7 +133,6 @@ def create_database():
     cursor.executemany('INSERT INTO actors (name, birth_year) VALUES (?, ?)', actors)
     
     # Insert sample movies
-    genres = ['Drama', 'Action', 'Comedy', 'Thriller', 'Sci-Fi', 'Horror', 'Romance', 'Adventure']
     movies_data = []
     
     movie_titles = [
@@ -123,7 +151,7 @@ def create_database():
     for i, title in enumerate(movie_titles):
         release_date = datetime(2015, 1, 1) + timedelta(days=random.randint(0, 3000))
         director_id = random.randint(1, 10)
-        genre = random.choice(genres)
+        genre = random.choice(GENRES)
         budget = random.randint(5000000, 200000000)
         box_office = budget + random.randint(-budget//2, budget*3)
         
@@ -143,7 +171,7 @@ def create_database():
         selected_actors = random.sample(range(1, 16), num_actors)
         
         for actor_id in selected_actors:
-            role_type = random.choice(['Lead', 'Supporting', 'Cameo'])
+            role_type = random.choice(ROLE_TYPES)
             movie_actors_data.append((movie_id, actor_id, role_type))
     
     cursor.executemany('''
@@ -171,6 +199,9 @@ def create_database():
         VALUES (?, ?, ?, ?)
     ''', ratings_data)
     
+    # Build per-movie aggregates once, then let triggers keep them current
+    create_rating_stats(conn)
+    
     conn.commit()
     conn.close()
     print("Database created successfully with sample data!")
@@ -0,0 +1,191 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+from create_database import create_schema, GENRES, ROLE_TYPES
+from rating_stats import create_rating_stats
+
+BASE_DATE = np.datetime64('2015-01-01')
+DATE_SPAN_DAYS = 3000
+
+
+def apply_bulk_load_pragmas(conn, cache_size_mb=256):
+    """Trade durability for speed while the database is being (re)built"""
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute(f'PRAGMA cache_size = -{cache_size_mb * 1024}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+
+def restore_pragmas(conn):
+    """Put the database back into a durable journal mode after loading"""
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+
+
+class DataGenerator:
+    """Generate synthetic movie data of arbitrary size and bulk load it into SQLite"""
+
+    DISTRIBUTIONS = ('uniform', 'lognormal', 'zipf')
+
+    def __init__(self, db_path='movies.db', num_movies=1000, num_ratings=100000,
+                 num_users=10000, num_directors=None, num_actors=None,
+                 distribution='lognormal', seed=42, chunk_size=500000):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {self.DISTRIBUTIONS}")
+        self.db_path = db_path
+        self.num_movies = num_movies
+        self.num_ratings = num_ratings
+        self.num_users = num_users
+        self.num_directors = num_directors or max(10, num_movies // 20)
+        self.num_actors = num_actors or max(15, num_movies // 5)
+        self.distribution = distribution
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+
+    def ratings_per_movie(self):
+        """Split num_ratings across movies according to the popularity distribution"""
+        if self.distribution == 'uniform':
+            weights = self.rng.uniform(0.5, 1.5, self.num_movies)
+        elif self.distribution == 'lognormal':
+            weights = self.rng.lognormal(0.0, 1.0, self.num_movies)
+        else:
+            ranks = self.rng.permutation(self.num_movies) + 1
+            weights = 1.0 / ranks
+        return self.rng.multinomial(self.num_ratings, weights / weights.sum())
+
+    def _movie_chunks(self):
+        for start in range(0, self.num_movies, self.chunk_size):
+            yield start, min(start + self.chunk_size, self.num_movies)
+
+    def _dates(self, size):
+        offsets = self.rng.integers(0, DATE_SPAN_DAYS + 1, size)
+        return np.datetime_as_string(BASE_DATE + offsets, unit='D')
+
+    def _insert_people(self, conn, table, id_column, count, label):
+        birth_years = self.rng.integers(1940, 2000, count)
+        conn.executemany(
+            f'INSERT INTO {table} ({id_column}, name, birth_year) VALUES (?, ?, ?)',
+            ((i + 1, f'{label} {i + 1}', int(year)) for i, year in enumerate(birth_years))
+        )
+        return count
+
+    def _insert_movies(self, conn):
+        genres = np.array(GENRES)
+        for start, end in self._movie_chunks():
+            size = end - start
+            budgets = self.rng.integers(5000000, 200000000, size)
+            box_office = budgets + (budgets * self.rng.uniform(-0.5, 3.0, size)).astype(np.int64)
+            rows = zip(
+                range(start + 1, end + 1),
+                (f'Movie {i}' for i in range(start + 1, end + 1)),
+                genres[self.rng.integers(0, len(genres), size)].tolist(),
+                self._dates(size).tolist(),
+                self.rng.integers(1, self.num_directors + 1, size).tolist(),
+                budgets.tolist(),
+                box_office.tolist(),
+            )
+            conn.executemany('''
+                INSERT INTO movies (movie_id, title, genre, release_date, director_id, budget, box_office)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        return self.num_movies
+
+    def _insert_movie_actors(self, conn):
+        roles = np.array(ROLE_TYPES)
+        changes_before = conn.total_changes
+        for start, end in self._movie_chunks():
+            # Each movie has 2-4 main actors; duplicate draws are dropped by the primary key
+            cast_sizes = self.rng.integers(2, 5, end - start)
+            movie_ids = np.repeat(np.arange(start + 1, end + 1), cast_sizes)
+            actor_ids = self.rng.integers(1, self.num_actors + 1, len(movie_ids))
+            role_types = roles[self.rng.integers(0, len(roles), len(movie_ids))]
+            conn.executemany(
+                'INSERT OR IGNORE INTO movie_actors (movie_id, actor_id, role_type) VALUES (?, ?, ?)',
+                zip(movie_ids.tolist(), actor_ids.tolist(), role_types.tolist())
+            )
+        return conn.total_changes - changes_before
+
+    def _insert_ratings(self, conn):
+        counts = self.ratings_per_movie()
+        boundaries = np.cumsum(counts)
+        # Per-movie quality offset so averages differ between movies
+        quality = self.rng.normal(0.0, 0.8, self.num_movies)
+
+        for start in range(0, self.num_ratings, self.chunk_size):
+            end = min(start + self.chunk_size, self.num_ratings)
+            movie_index = np.searchsorted(boundaries, np.arange(start, end), side='right')
+            ratings = self.rng.normal(7.2, 1.5, end - start) + quality[movie_index]
+            ratings = np.round(np.clip(ratings, 1.0, 10.0), 1)
+            rows = zip(
+                range(start + 1, end + 1),
+                (movie_index + 1).tolist(),
+                self.rng.integers(1, self.num_users + 1, end - start).tolist(),
+                ratings.tolist(),
+                self._dates(end - start).tolist(),
+            )
+            conn.executemany('''
+                INSERT INTO movie_ratings (rating_id, movie_id, user_id, rating, review_date)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+        return self.num_ratings
+
+    def _build_rating_stats(self, conn):
+        create_rating_stats(conn)
+        return conn.execute('SELECT COUNT(*) FROM movie_rating_stats').fetchone()[0]
+
+    def generate(self):
+        """Build the database in a single transaction and report throughput"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        apply_bulk_load_pragmas(conn)
+        create_schema(conn.cursor())
+
+        timings = {}
+        started = time.perf_counter()
+        conn.execute('BEGIN')
+        steps = [
+            ('directors', lambda: self._insert_people(conn, 'directors', 'director_id',
+                                                      self.num_directors, 'Director')),
+            ('actors', lambda: self._insert_people(conn, 'actors', 'actor_id',
+                                                   self.num_actors, 'Actor')),
+            ('movies', lambda: self._insert_movies(conn)),
+            ('movie_actors', lambda: self._insert_movie_actors(conn)),
+            ('movie_ratings', lambda: self._insert_ratings(conn)),
+            ('movie_rating_stats', lambda: self._build_rating_stats(conn)),
+        ]
+        for table, step in steps:
+            step_start = time.perf_counter()
+            rows = step()
+            elapsed = time.perf_counter() - step_start
+            timings[table] = {'rows': rows, 'seconds': elapsed}
+            print(f"{table}: {rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+        conn.execute('COMMIT')
+        restore_pragmas(conn)
+        conn.close()
+
+        total = time.perf_counter() - started
+        total_rows = sum(t['rows'] for t in timings.values())
+        print(f"Generated {total_rows:,} rows in {total:.2f}s ({total_rows / max(total, 1e-9):,.0f} rows/sec)")
+        return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic movie database')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--ratings', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--distribution', choices=DataGenerator.DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    args = parser.parse_args()
+
+    DataGenerator(
+        db_path=args.db,
+        num_movies=args.movies,
+        num_ratings=args.ratings,
+        num_users=args.users,
+        distribution=args.distribution,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+    ).generate()
@@ -1,357 +1,464 @@
+import argparse
+import hashlib
+import html
+import os
+from itertools import islice
 import pandas as pd
 from analysis_queries import MovieAnalytics
-import sqlite3
+from query_cache import QueryCache
+import query_profiler
+from query_profiler import span
+from report_fragments import (DEFAULT_FRAGMENT_DIR, FragmentCache, create_table_versions,
+                              has_table_versions, hashed_chunks, signature, table_signatures,
+                              update_frame_hash)
+from report_writer import HtmlReportWriter, escape, integer, decimal, currency, truncated
 
-class ReportGenerator:
-    def __init__(self):
-        self.analytics = MovieAnalytics()
-        
-    def generate_html_report(self):
-        """Generate comprehensive HTML report with findings"""
-        
-        # Get all analysis data
-        genre_data = self.analytics.genre_popularity_analysis()
-        director_data = self.analytics.director_performance_metrics()
-        rating_data = self.analytics.rating_distribution_analysis()
-        collab_data = self.analytics.actor_collaboration_network()
-        seasonal_data = self.analytics.seasonal_release_patterns()
-        budget_data = self.analytics.budget_vs_rating_correlation()
-        
-        # Calculate key insights
-        total_movies = len(rating_data)
-        avg_rating = rating_data['avg_rating'].mean()
-        top_genre = genre_data.groupby('genre')['movie_count'].sum().idxmax()
-        best_director = director_data.loc[director_data['avg_director_rating'].idxmax(), 'director_name']
-        most_profitable_movie = rating_data.loc[rating_data['profit'].idxmax(), 'title']
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Movie Rating Analysis Report</title>
-            <style>
-                body {{
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    line-height: 1.6;
-                    margin: 0;
-                    padding: 20px;
-                    background-color: #f5f5f5;
-                }}
-                .container {{
-                    max-width: 1200px;
-                    margin: 0 auto;
-                    background-color: white;
-                    padding: 30px;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0,0,0,0.1);
-                }}
-                h1 {{
-                    color: #2c3e50;
-                    text-align: center;
-                    border-bottom: 3px solid #3498db;
-                    padding-bottom: 10px;
-                }}
-                h2 {{
-                    color: #34495e;
-                    border-left: 4px solid #3498db;
-                    padding-left: 15px;
-                    margin-top: 30px;
-                }}
-                .summary-stats {{
-                    display: grid;
-                    grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-                    gap: 20px;
-                    margin: 20px 0;
-                }}
-                .stat-card {{
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    padding: 20px;
-                    border-radius: 10px;
-                    text-align: center;
-                }}
-                .stat-number {{
-                    font-size: 2em;
-                    font-weight: bold;
-                    display: block;
-                }}
-                .stat-label {{
-                    font-size: 0.9em;
-                    opacity: 0.9;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin: 20px 0;
-                    background-color: white;
-                }}
-                th, td {{
-                    padding: 12px;
-                    text-align: left;
-                    border-bottom: 1px solid #ddd;
-                }}
-                th {{
-                    background-color: #3498db;
-                    color: white;
-                }}
-                tr:hover {{
-                    background-color: #f5f5f5;
-                }}
-                .insight-box {{
-                    background-color: #e8f4fd;
-                    border-left: 4px solid #3498db;
-                    padding: 15px;
-                    margin: 15px 0;
-                    border-radius: 5px;
-                }}
-                .chart-placeholder {{
-                    background-color: #ecf0f1;
-                    height: 200px;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    margin: 20px 0;
-                    border-radius: 5px;
-                    color: #7f8c8d;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🎬 Movie Rating Analysis Report</h1>
-                
-                <div class="summary-stats">
-                    <div class="stat-card">
-                        <span class="stat-number">{total_movies}</span>
-                        <span class="stat-label">Total Movies Analyzed</span>
-                    </div>
-                    <div class="stat-card">
-                        <span class="stat-number">{avg_rating:.1f}</span>
-                        <span class="stat-label">Average Rating</span>
-                    </div>
-                    <div class="stat-card">
-                        <span class="stat-number">{top_genre}</span>
-                        <span class="stat-label">Most Popular Genre</span>
-                    </div>
-                    <div class="stat-card">
-                        <span class="stat-number">{len(director_data)}</span>
-                        <span class="stat-label">Directors Analyzed</span>
-                    </div>
-                </div>
+REPORT_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Movie Rating Analysis Report</title>
+    <style>
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            line-height: 1.6;
+            margin: 0;
+            padding: 20px;
+            background-color: #f5f5f5;
+        }
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+            background-color: white;
+            padding: 30px;
+            border-radius: 10px;
+            box-shadow: 0 0 20px rgba(0,0,0,0.1);
+        }
+        h1 {
+            color: #2c3e50;
+            text-align: center;
+            border-bottom: 3px solid #3498db;
+            padding-bottom: 10px;
+        }
+        h2 {
+            color: #34495e;
+            border-left: 4px solid #3498db;
+            padding-left: 15px;
+            margin-top: 30px;
+        }
+        .summary-stats {
+            display: grid;
+            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
+            gap: 20px;
+            margin: 20px 0;
+        }
+        .stat-card {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 20px;
+            border-radius: 10px;
+            text-align: center;
+        }
+        .stat-number {
+            font-size: 2em;
+            font-weight: bold;
+            display: block;
+        }
+        .stat-label {
+            font-size: 0.9em;
+            opacity: 0.9;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin: 20px 0;
+            background-color: white;
+        }
+        th, td {
+            padding: 12px;
+            text-align: left;
+            border-bottom: 1px solid #ddd;
+        }
+        th {
+            background-color: #3498db;
+            color: white;
+        }
+        tr:hover {
+            background-color: #f5f5f5;
+        }
+        .insight-box {
+            background-color: #e8f4fd;
+            border-left: 4px solid #3498db;
+            padding: 15px;
+            margin: 15px 0;
+            border-radius: 5px;
+        }
+        .chart-placeholder {
+            background-color: #ecf0f1;
+            height: 200px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            margin: 20px 0;
+            border-radius: 5px;
+            color: #7f8c8d;
+        }
+    </style>
+</head>
+<body>
+"""
 
-                <h2>📊 Key Insights</h2>
-                <div class="insight-box">
-                    <strong>🏆 Top Performer:</strong> {best_director} has the highest average rating among directors with multiple films.
-                </div>
-                <div class="insight-box">
-                    <strong>💰 Most Profitable:</strong> "{most_profitable_movie}" generated the highest profit in our dataset.
-                </div>
-                <div class="insight-box">
-                    <strong>🎭 Genre Leader:</strong> {top_genre} is the most frequently produced genre in our analysis.
-                </div>
+DIRECTOR_COLUMNS = [
+    ('Director', 'director_name', escape),
+    ('Movies', 'total_movies', integer),
+    ('Avg Rating', 'avg_director_rating', decimal(1)),
+    ('Avg Box Office', 'avg_box_office', currency),
+    ('Total Box Office', 'total_box_office', currency),
+]
 
-                <h2>🎯 Director Performance Analysis</h2>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Director</th>
-                            <th>Movies</th>
-                            <th>Avg Rating</th>
-                            <th>Avg Box Office</th>
-                            <th>Total Box Office</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        # Add top directors to table
-        top_directors = director_data.nlargest(10, 'avg_director_rating')
-        for _, director in top_directors.iterrows():
-            html_content += f"""
-                        <tr>
-                            <td>{director['director_name']}</td>
-                            <td>{director['total_movies']}</td>
-                            <td>{director['avg_director_rating']:.1f}</td>
-                            <td>${director['avg_box_office']:,.0f}</td>
-                            <td>${director['total_box_office']:,.0f}</td>
-                        </tr>
-            """
-        
-        html_content += """
-                    </tbody>
-                </table>
+MOVIE_COLUMNS = [
+    ('Movie', 'title', escape),
+    ('Director', 'director', escape),
+    ('Genre', 'genre', escape),
+    ('Year', 'release_year', escape),
+    ('Rating', 'avg_rating', decimal(1)),
+    ('Total Ratings', 'total_ratings', integer),
+    ('Weighted Score', 'weighted_score', decimal(2)),
+]
 
-                <h2>🏅 Top Rated Movies</h2>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Movie</th>
-                            <th>Director</th>
-                            <th>Genre</th>
-                            <th>Year</th>
-                            <th>Rating</th>
-                            <th>Total Ratings</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        # Add top movies to table
-        top_movies = rating_data.nlargest(15, 'avg_rating')
-        for _, movie in top_movies.iterrows():
-            html_content += f"""
-                        <tr>
-                            <td>{movie['title']}</td>
-                            <td>{movie['director']}</td>
-                            <td>{movie['genre']}</td>
-                            <td>{movie['release_year']}</td>
-                            <td>{movie['avg_rating']:.1f}</td>
-                            <td>{movie['total_ratings']}</td>
-                        </tr>
-            """
-        
-        html_content += """
-                    </tbody>
-                </table>
+COLLABORATION_COLUMNS = [
+    ('Actor 1', 'actor1', escape),
+    ('Actor 2', 'actor2', escape),
+    ('Collaborations', 'collaborations', integer),
+    ('Avg Rating', 'avg_collab_rating', decimal(1)),
+    ('Movies Together', 'movies_together', truncated(50)),
+]
 
-                <h2>🤝 Actor Collaboration Network</h2>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Actor 1</th>
-                            <th>Actor 2</th>
-                            <th>Collaborations</th>
-                            <th>Avg Rating</th>
-                            <th>Movies Together</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        # Add collaborations to table
-        for _, collab in collab_data.head(10).iterrows():
-            html_content += f"""
-                        <tr>
-                            <td>{collab['actor1']}</td>
-                            <td>{collab['actor2']}</td>
-                            <td>{collab['collaborations']}</td>
-                            <td>{collab['avg_collab_rating']:.1f}</td>
-                            <td>{collab['movies_together'][:50]}...</td>
-                        </tr>
-            """
-        
-        # Calculate genre insights
-        genre_stats = genre_data.groupby('genre').agg({
+GENRE_COLUMNS = [
+    ('Genre', 'genre', escape),
+    ('Total Movies', 'movie_count', integer),
+    ('Avg Rating', 'avg_genre_rating', decimal(1)),
+    ('Total Box Office', 'total_box_office', currency),
+]
+
+SEASON_COLUMNS = [
+    ('Season', 'season', escape),
+    ('Movies Released', 'movie_count', integer),
+    ('Avg Rating', 'avg_rating', decimal(1)),
+    ('Avg Box Office', 'avg_box_office', currency),
+]
+
+METHODOLOGY = """
+        <h2>💡 Analysis Methodology</h2>
+        <div class="insight-box">
+            <p><strong>Data Source:</strong> SQLite database with synthetic movie data including ratings, box office, cast, and crew information.</p>
+            <p><strong>Analysis Techniques:</strong> SQL aggregations, joins, window functions, and statistical analysis using Python pandas.</p>
+            <p><strong>Key Metrics:</strong> Average ratings, box office performance, profit margins, collaboration patterns, and seasonal trends.</p>
+            <p><strong>Visualizations:</strong> Generated using matplotlib and seaborn for comprehensive data exploration.</p>
+        </div>
+
+        <h2>🔍 SQL Queries Used</h2>
+        <div class="insight-box">
+            <p>This analysis demonstrates advanced SQL skills including:</p>
+            <ul>
+                <li>Complex JOINs across multiple tables</li>
+                <li>Aggregate functions (AVG, COUNT, SUM, MIN, MAX)</li>
+                <li>Subqueries and CTEs</li>
+                <li>Window functions and ranking</li>
+                <li>Date/time functions</li>
+                <li>CASE statements for categorization</li>
+                <li>GROUP BY with HAVING clauses</li>
+            </ul>
+        </div>
+"""
+
+# Rows per chunk when streaming per-movie results from the database
+CHUNK_ROWS = 20000
+
+
+def summarize_movies(chunks):
+    """Report figures from rating_distribution_analysis chunks in a single pass
+    
+    Returns the movie count, mean rating and most profitable title.
+    """
+    total_movies = 0
+    rating_sum = 0.0
+    rated = 0
+    best_profit = None
+    most_profitable = None
+    for chunk in chunks:
+        total_movies += len(chunk)
+        ratings = chunk['avg_rating'].astype('float64')
+        rating_sum += ratings.sum()
+        rated += ratings.count()
+        profits = chunk['profit']
+        if profits.notna().any():
+            row = profits.idxmax()
+            if best_profit is None or profits[row] > best_profit:
+                best_profit, most_profitable = profits[row], chunk.at[row, 'title']
+    return {
+        'total_movies': total_movies,
+        'avg_rating': rating_sum / rated if rated else float('nan'),
+        'most_profitable': most_profitable,
+    }
+
+
+class ReportData:
+    """Inputs of the report sections, queried on first use so clean sections cost nothing"""
+    
+    def __init__(self, analytics, full_tables=False):
+        self.analytics = analytics
+        self.full_tables = full_tables
+        self.results = {}
+        self._movie_summary = None
+    
+    def fetch(self, methods):
+        """Run the aggregate analyses not fetched yet in one concurrent batch"""
+        missing = [method for method in methods if method not in self.results]
+        if missing:
+            self.results.update(self.analytics.run_all(missing))
+    
+    def analysis(self, method):
+        self.fetch([method])
+        return self.results[method]
+    
+    @property
+    def movie_summary(self):
+        # Per-movie results are only ever held one chunk at a time
+        if self._movie_summary is None:
+            with span('summarize_movies', 'report'):
+                self._movie_summary = summarize_movies(
+                    self.analytics.rating_distribution_analysis(chunksize=CHUNK_ROWS))
+        return self._movie_summary
+    
+    def summary(self):
+        genre_data = self.analysis('genre_popularity_analysis')
+        director_data = self.analysis('director_performance_metrics')
+        movie_summary = self.movie_summary
+        return pd.DataFrame([{
+            'total_movies': movie_summary['total_movies'],
+            'avg_rating': movie_summary['avg_rating'],
+            'top_genre': genre_data.groupby('genre')['movie_count'].sum().idxmax(),
+            'directors': len(director_data),
+            'best_director': director_data.loc[director_data['avg_director_rating'].idxmax(), 'director_name'],
+            'most_profitable': movie_summary['most_profitable'],
+        }])
+    
+    def directors(self):
+        director_data = self.analysis('director_performance_metrics')
+        if self.full_tables:
+            return director_data.sort_values('avg_director_rating', ascending=False)
+        return director_data.nlargest(10, 'avg_director_rating')
+    
+    def top_movies(self):
+        # Ranked by weighted score, so a handful of ratings cannot top the table;
+        # the top rows are read from the precomputed leaderboard
+        if self.full_tables:
+            return self.analytics.movie_leaderboard(n=None, chunksize=CHUNK_ROWS)
+        return self.analytics.movie_leaderboard(n=15)
+    
+    def collaborations(self):
+        if self.full_tables:
+            return self.analytics.actor_collaboration_network(chunksize=CHUNK_ROWS)
+        chunks = list(islice(self.analytics.actor_collaboration_network(chunksize=10), 1))
+        return chunks[0] if chunks else pd.DataFrame(columns=[column for _, column, _ in COLLABORATION_COLUMNS])
+    
+    def genres(self):
+        return self.analysis('genre_popularity_analysis').groupby('genre').agg({
             'movie_count': 'sum',
             'avg_genre_rating': 'mean',
             'total_box_office': 'sum'
-        }).round(2)
-        
-        html_content += f"""
-                    </tbody>
-                </table>
-
-                <h2>🎭 Genre Analysis</h2>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Genre</th>
-                            <th>Total Movies</th>
-                            <th>Avg Rating</th>
-                            <th>Total Box Office</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        for genre, stats in genre_stats.iterrows():
-            html_content += f"""
-                        <tr>
-                            <td>{genre}</td>
-                            <td>{stats['movie_count']}</td>
-                            <td>{stats['avg_genre_rating']:.1f}</td>
-                            <td>${stats['total_box_office']:,.0f}</td>
-                        </tr>
-            """
-        
-        # Calculate seasonal insights
-        seasonal_stats = seasonal_data.groupby('season').agg({
+        }).round(2).reset_index()
+    
+    def seasons(self):
+        return self.analysis('seasonal_release_patterns').groupby('season').agg({
             'movie_count': 'sum',
             'avg_rating': 'mean',
             'avg_box_office': 'mean'
-        }).round(2)
-        
-        html_content += f"""
-                    </tbody>
-                </table>
+        }).round(2).reset_index()
 
-                <h2>🌟 Seasonal Release Patterns</h2>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Season</th>
-                            <th>Movies Released</th>
-                            <th>Avg Rating</th>
-                            <th>Avg Box Office</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        for season, stats in seasonal_stats.iterrows():
-            html_content += f"""
-                        <tr>
-                            <td>{season}</td>
-                            <td>{stats['movie_count']}</td>
-                            <td>{stats['avg_rating']:.1f}</td>
-                            <td>${stats['avg_box_office']:,.0f}</td>
-                        </tr>
-            """
+
+def write_summary(writer, summary):
+    row = summary.iloc[0]
+    writer.write(f"""
+    <div class="container">
+        <h1>🎬 Movie Rating Analysis Report</h1>
         
-        html_content += """
-                    </tbody>
-                </table>
+        <div class="summary-stats">
+            <div class="stat-card">
+                <span class="stat-number">{row['total_movies']}</span>
+                <span class="stat-label">Total Movies Analyzed</span>
+            </div>
+            <div class="stat-card">
+                <span class="stat-number">{row['avg_rating']:.1f}</span>
+                <span class="stat-label">Average Rating</span>
+            </div>
+            <div class="stat-card">
+                <span class="stat-number">{html.escape(str(row['top_genre']))}</span>
+                <span class="stat-label">Most Popular Genre</span>
+            </div>
+            <div class="stat-card">
+                <span class="stat-number">{row['directors']}</span>
+                <span class="stat-label">Directors Analyzed</span>
+            </div>
+        </div>
 
-                <h2>💡 Analysis Methodology</h2>
-                <div class="insight-box">
-                    <p><strong>Data Source:</strong> SQLite database with synthetic movie data including ratings, box office, cast, and crew information.</p>
-                    <p><strong>Analysis Techniques:</strong> SQL aggregations, joins, window functions, and statistical analysis using Python pandas.</p>
-                    <p><strong>Key Metrics:</strong> Average ratings, box office performance, profit margins, collaboration patterns, and seasonal trends.</p>
-                    <p><strong>Visualizations:</strong> Generated using matplotlib and seaborn for comprehensive data exploration.</p>
-                </div>
+        <h2>📊 Key Insights</h2>
+        <div class="insight-box">
+            <strong>🏆 Top Performer:</strong> {html.escape(str(row['best_director']))} has the highest average rating among directors with multiple films.
+        </div>
+        <div class="insight-box">
+            <strong>💰 Most Profitable:</strong> "{html.escape(str(row['most_profitable']))}" generated the highest profit in our dataset.
+        </div>
+        <div class="insight-box">
+            <strong>🎭 Genre Leader:</strong> {html.escape(str(row['top_genre']))} is the most frequently produced genre in our analysis.
+        </div>
+""")
 
-                <h2>🔍 SQL Queries Used</h2>
-                <div class="insight-box">
-                    <p>This analysis demonstrates advanced SQL skills including:</p>
-                    <ul>
-                        <li>Complex JOINs across multiple tables</li>
-                        <li>Aggregate functions (AVG, COUNT, SUM, MIN, MAX)</li>
-                        <li>Subqueries and CTEs</li>
-                        <li>Window functions and ranking</li>
-                        <li>Date/time functions</li>
-                        <li>CASE statements for categorization</li>
-                        <li>GROUP BY with HAVING clauses</li>
-                    </ul>
-                </div>
 
-                <div style="text-align: center; margin-top: 40px; color: #7f8c8d;">
-                    <p>Report generated on """ + pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S') + """</p>
-                    <p>Movie Rating Analysis Project | Data Analytics Portfolio</p>
-                </div>
-            </div>
-        </body>
-        </html>
+def table_section(title, columns):
+    def write(writer, data):
+        writer.write(f'\n        <h2>{title}</h2>')
+        writer.table(columns, data)
+    return write
+
+
+# Report sections in page order: the writer, the tables the section's data is
+# computed from, and the aggregate analyses it reads
+SECTIONS = {
+    'summary': (write_summary, ('movies', 'directors', 'movie_ratings'),
+                ('genre_popularity_analysis', 'director_performance_metrics')),
+    'directors': (table_section('🎯 Director Performance Analysis', DIRECTOR_COLUMNS),
+                  ('movies', 'directors', 'movie_ratings'), ('director_performance_metrics',)),
+    'top_movies': (table_section('🏅 Top Rated Movies', MOVIE_COLUMNS),
+                   ('movies', 'directors', 'movie_ratings'), ()),
+    'collaborations': (table_section('🤝 Actor Collaboration Network', COLLABORATION_COLUMNS),
+                       ('movies', 'actors', 'movie_actors', 'movie_ratings'), ()),
+    'genres': (table_section('🎭 Genre Analysis', GENRE_COLUMNS),
+               ('movies', 'movie_ratings'), ('genre_popularity_analysis',)),
+    'seasons': (table_section('🌟 Seasonal Release Patterns', SEASON_COLUMNS),
+                ('movies', 'movie_ratings'), ('seasonal_release_patterns',)),
+}
+
+
+class ReportGenerator:
+    def __init__(self, analytics=None, fragments=None):
+        self.analytics = analytics or MovieAnalytics(cache=QueryCache())
+        self.fragments = fragments
+        self.rendered = []
+        self.reused = []
+    
+    def _dependencies(self):
+        """Signature of the source tables of every section"""
+        conn = self.analytics.get_connection()
+        try:
+            with conn:
+                if not has_table_versions(conn):
+                    create_table_versions(conn)
+            tables = table_signatures(conn)
+        finally:
+            conn.close()
+        source = (os.path.abspath(self.analytics.db_path), self.analytics.backend)
+        return {name: signature(source, [tables[table] for table in section_tables])
+                for name, (_, section_tables, _) in SECTIONS.items()}
+    
+    def _write_section(self, writer, name, key, data, dependencies):
+        write = SECTIONS[name][0]
+        if self.fragments is None:
+            write(writer, getattr(data, name)())
+            self.rendered.append(name)
+            return
+        
+        path = self.fragments.lookup(key, dependencies)
+        if path is None:
+            section_data = getattr(data, name)()
+            digest = hashlib.sha256()
+            if isinstance(section_data, pd.DataFrame):
+                update_frame_hash(digest, section_data)
+                path = self.fragments.lookup(key, dependencies, digest.hexdigest())
+            else:
+                # Streamed tables are hashed while they are rendered
+                section_data = hashed_chunks(section_data, digest)
+            if path is None:
+                with self.fragments.write(key, dependencies, digest) as stream:
+                    write(HtmlReportWriter(stream), section_data)
+                self.rendered.append(name)
+        if name not in self.rendered:
+            self.reused.append(name)
+        self.fragments.copy_to(key, writer.stream)
+    
+    def generate_html_report(self, output_path='movie_analysis_report.html', full_tables=False):
+        """Generate comprehensive HTML report with findings
+        
+        The document is streamed to output_path section by section. With
+        full_tables=True the director, movie and collaboration tables list every
+        row instead of the top 10/15/10.
+        
+        With a FragmentCache each section is kept as a rendered fragment. A
+        section is only queried again when one of its source tables changed,
+        and only rendered again when its data changed; clean sections are
+        copied from the cache.
         """
+        mode = 'full' if full_tables else 'top'
+        data = ReportData(self.analytics, full_tables)
+        self.rendered, self.reused = [], []
+        
+        if self.fragments is None:
+            dependencies = dict.fromkeys(SECTIONS)
+            stale = list(SECTIONS)
+        else:
+            dependencies = self._dependencies()
+            stale = [name for name in SECTIONS
+                     if self.fragments.lookup(f'{name}.{mode}', dependencies[name]) is None]
+        
+        # The aggregate analyses are small, so the stale sections' ones run in one concurrent batch
+        data.fetch(list(dict.fromkeys(method for name in stale for method in SECTIONS[name][2])))
         
-        # Save the report
-        with open('movie_analysis_report.html', 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            writer = HtmlReportWriter(f)
+            writer.write(REPORT_HEAD)
+            for name in SECTIONS:
+                with span(name, 'report'):
+                    self._write_section(writer, name, f'{name}.{mode}', data, dependencies[name])
+            
+            writer.write(METHODOLOGY)
+            writer.write(f"""
+        <div style="text-align: center; margin-top: 40px; color: #7f8c8d;">
+            <p>Report generated on {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p>Movie Rating Analysis Project | Data Analytics Portfolio</p>
+        </div>
+    </div>
+</body>
+</html>
+""")
         
-        print("HTML report generated successfully: movie_analysis_report.html")
-        return html_content
+        print(f"HTML report generated successfully: {output_path}")
+        if self.fragments is not None:
+            print(f"Rendered sections: {', '.join(self.rendered) or 'none'}; "
+                  f"reused from cache: {', '.join(self.reused) or 'none'}")
+        return output_path
 
 if __name__ == "__main__":
-    generator = ReportGenerator()
-    generator.generate_html_report()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Generate the movie analysis HTML report')
+    parser.add_argument('--output', default='movie_analysis_report.html')
+    parser.add_argument('--full-tables', action='store_true',
+                        help='list every director, movie and collaboration instead of the top rows')
+    parser.add_argument('--fragment-dir', default=DEFAULT_FRAGMENT_DIR,
+                        help='where rendered sections are cached between runs')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='discard cached sections and render every section again')
+    parser.add_argument('--profile', nargs='?', const=query_profiler.DEFAULT_TRACE_PATH, metavar='TRACE',
+                        help='time queries and report sections and write a trace (.json for '
+                             'chrome://tracing, anything else for flamegraph.pl folded stacks)')
+    args = parser.parse_args()
+    
+    fragments = FragmentCache(args.fragment_dir)
+    if args.rebuild:
+        fragments.clear()
+    with query_profiler.profiling(args.profile) as profiler:
+        generator = ReportGenerator(fragments=fragments)
+        generator.generate_html_report(args.output, full_tables=args.full_tables)
+    if args.profile:
+        query_profiler.print_profile(profiler)
+        print(f"\nTrace written to {args.profile}")
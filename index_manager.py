@@ -0,0 +1,239 @@
+import argparse
+import re
+import sqlite3
+import sys
+from analysis_queries import QUERIES
+from compact_schema import COMPACT_INDEXES, COMPACT_QUERIES, LOOKUP_TABLES, is_compact_schema, ratings_table_sql
+from connection_pool import add_math_functions
+from leaderboards import LEADERBOARD_QUERY, RANKING_QUERY, has_leaderboards
+from movie_cube import CUBE_QUERIES, has_movie_cube
+from rating_trends import TRENDING_MOVIES_QUERY, has_rating_trends, trend_query
+from recommender import RECOMMEND_QUERY, SIMILAR_MOVIES_QUERY, has_movie_similarity
+from user_rating_stats import (USER_INDEX, USER_INDEX_NAME, USER_PROFILES_QUERY, has_user_rating_stats,
+                               user_bias_query)
+
+# Covering indexes for the MovieAnalytics workload, keyed by index name.
+# Directors and actors are indexed on name so the rowid join key plus the
+# projected name are both available from the index alone.
+INDEXES = {
+    'idx_movie_ratings_movie_rating': 'movie_ratings (movie_id, rating)',
+    USER_INDEX_NAME: USER_INDEX,
+    'idx_movies_genre': 'movies (genre, release_date, box_office, budget)',
+    'idx_movies_director': 'movies (director_id, release_date, box_office, budget)',
+    'idx_movies_budget': 'movies (budget, box_office)',
+    'idx_movie_actors_actor': 'movie_actors (actor_id, movie_id)',
+    'idx_directors_name': 'directors (name)',
+    'idx_actors_name': 'actors (name)',
+}
+
+# Full scans that are the point of the query: each of these reads every row of
+# a derived table (every cube cell, movie or user), so an index would only turn
+# the scan into an equally long index scan. leaderboard_prior holds one row.
+ACCEPTED_SCANS = {
+    'seasonal_release_patterns (cube)': {'movie_cube'},
+    'movie_leaderboard (full ranking)': {'movies', 'leaderboard_prior'},
+    'user_rating_profiles': {'user_rating_stats'},
+    'user_bias_adjusted_ratings': {'user_rating_stats'},
+}
+
+# Words that can follow a table name in FROM/JOIN instead of an alias
+_NOT_ALIASES = {'AS', 'CROSS', 'GROUP', 'HAVING', 'INNER', 'JOIN', 'LEFT', 'LIMIT', 'NATURAL', 'ON',
+                'ORDER', 'UNION', 'USING', 'WHERE', 'WINDOW'}
+
+RATINGS_WITHOUT_ROWID_SQL = '''
+    CREATE TABLE movie_ratings_clustered (
+        rating_id INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        user_id INTEGER,
+        rating REAL CHECK (rating >= 1 AND rating <= 10),
+        review_date DATE,
+        PRIMARY KEY (movie_id, rating_id),
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    ) WITHOUT ROWID
+'''
+
+
+def read_queries(conn):
+    """name -> SQL of every read the analytics serve; None where its tables are not built yet
+
+    Besides the SQL analyses this covers the cube rollups MovieAnalytics
+    answers them from by default and the leaderboard, trend, similarity and
+    user queries.
+    """
+    compact = is_compact_schema(conn)
+    queries = dict(COMPACT_QUERIES if compact else QUERIES)
+    cube = has_movie_cube(conn)
+    queries.update({f'{method} (cube)': query if cube else None for method, query in CUBE_QUERIES.items()})
+    leaderboards = has_leaderboards(conn)
+    queries['movie_leaderboard'] = LEADERBOARD_QUERY if leaderboards else None
+    queries['movie_leaderboard (full ranking)'] = RANKING_QUERY if leaderboards else None
+    trends = has_rating_trends(conn)
+    queries['movie_rating_trend'] = trend_query('movie', True, 'day') if trends else None
+    queries['genre_rating_trend'] = trend_query('genre', True, 'week') if trends else None
+    queries['genre_rating_trend (all genres)'] = trend_query('genre', False, 'week') if trends else None
+    queries['trending_movies'] = TRENDING_MOVIES_QUERY if trends else None
+    similarity = has_movie_similarity(conn)
+    queries['similar_movies'] = SIMILAR_MOVIES_QUERY if similarity else None
+    queries['recommend'] = RECOMMEND_QUERY if similarity else None
+    users = has_user_rating_stats(conn)
+    queries['user_rating_profiles'] = USER_PROFILES_QUERY if users else None
+    queries['user_bias_adjusted_ratings'] = user_bias_query(compact) if users else None
+    return queries
+
+
+def explain(conn, query):
+    """EXPLAIN QUERY PLAN details; parameters are bound to NULL"""
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, [None] * query.count('?'))]
+
+
+def plan_tables(conn, query):
+    """{name a query plan may SCAN: table} for the tables (and their aliases) a query reads
+
+    CTEs and subqueries are left out, since scanning them reads no table.
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    names = {table: table for table in tables}
+    for table, alias in re.findall(r'(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', query, re.IGNORECASE):
+        if table in tables and alias and alias.upper() not in _NOT_ALIASES:
+            names[alias] = table
+    return names
+
+
+class IndexManager:
+    def __init__(self, db_path='movies.db'):
+        self.db_path = db_path
+
+    def get_connection(self):
+        # EXPLAIN needs every function the queries call, SQRT included
+        return add_math_functions(sqlite3.connect(self.db_path))
+
+    def ratings_without_rowid(self, conn):
+        """Check whether movie_ratings is already clustered by (movie_id, rating_id)"""
+        row = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'movie_ratings'"
+        ).fetchone()
+        return row is not None and 'WITHOUT ROWID' in row[0].upper()
+
+    def create_indexes(self):
+        """Create the covering indexes for every analytics query and refresh statistics"""
+        with self.get_connection() as conn:
+            clustered = self.ratings_without_rowid(conn)
+            compact = is_compact_schema(conn)
+            for name, definition in INDEXES.items():
+                if compact:
+                    definition = COMPACT_INDEXES.get(name, definition)
+                # The clustered primary key already orders ratings by movie_id
+                if clustered and definition.startswith('movie_ratings (movie_id'):
+                    continue
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+            conn.execute('ANALYZE')
+
+    def drop_indexes(self):
+        """Remove the indexes created by create_indexes"""
+        with self.get_connection() as conn:
+            for name in INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+    def convert_ratings_to_without_rowid(self):
+        """Rebuild movie_ratings as a WITHOUT ROWID table keyed by (movie_id, rating_id)
+
+        Ratings for a movie are then stored contiguously, which keeps per-movie
+        aggregate refreshes to a single range read. New rows must supply rating_id
+        explicitly since it is no longer a rowid alias.
+        """
+        conn = self.get_connection()
+        try:
+            if self.ratings_without_rowid(conn):
+                return False
+            # Dropping the table also drops its triggers; keep their definitions
+            triggers = [row[0] for row in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'movie_ratings'")]
+            # The compact layout copies its stored columns; the rest are generated
+            if is_compact_schema(conn):
+                create_sql = ratings_table_sql('movie_ratings_clustered', clustered=True)
+                columns = 'rating_id, movie_id, user_id, rating_tenths, review_day'
+            else:
+                create_sql = RATINGS_WITHOUT_ROWID_SQL
+                columns = 'rating_id, movie_id, user_id, rating, review_date'
+            with conn:
+                conn.execute(create_sql)
+                conn.execute(f'''
+                    INSERT INTO movie_ratings_clustered ({columns})
+                    SELECT {columns}
+                    FROM movie_ratings
+                    ORDER BY movie_id, rating_id
+                ''')
+                conn.execute('DROP TABLE movie_ratings')
+                conn.execute('ALTER TABLE movie_ratings_clustered RENAME TO movie_ratings')
+                for trigger_sql in triggers:
+                    conn.execute(trigger_sql)
+            conn.execute('VACUUM')
+            return True
+        finally:
+            conn.close()
+
+    def query_plans(self):
+        """Return the EXPLAIN QUERY PLAN details for every analytics read (None where not built)"""
+        plans = {}
+        with self.get_connection() as conn:
+            for name, query in read_queries(conn).items():
+                plans[name] = None if query is None else explain(conn, query)
+        return plans
+
+    @staticmethod
+    def full_scans(plan, tables=None):
+        """Tables a plan reads whole without going through an index (lookup tables aside)
+
+        tables maps plan names to tables (see plan_tables); without it every
+        unindexed SCAN counts.
+        """
+        scans = []
+        for step in plan:
+            if not step.startswith('SCAN ') or ' USING ' in step:
+                continue
+            name = step.split()[1]
+            table = name if tables is None else tables.get(name)
+            if table is not None and table not in LOOKUP_TABLES:
+                scans.append(table)
+        return scans
+
+    def check(self):
+        """Print every query plan and report whether any read does an unexpected full table scan"""
+        ok = True
+        with self.get_connection() as conn:
+            queries = read_queries(conn)
+            for name, query in queries.items():
+                if query is None:
+                    print(f"\n{name}: skipped (not built)")
+                    continue
+                plan = explain(conn, query)
+                scans = set(self.full_scans(plan, plan_tables(conn, query)))
+                unexpected = scans - ACCEPTED_SCANS.get(name, set())
+                status = 'FULL SCAN' if unexpected else 'ok (accepted full scan)' if scans else 'ok'
+                print(f"\n{name}: {status}")
+                for step in plan:
+                    print(f"    {step}")
+                ok = ok and not unexpected
+        return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create and verify indexes for the analytics workload')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--without-rowid', action='store_true',
+                        help='cluster movie_ratings by (movie_id, rating_id)')
+    parser.add_argument('--check', action='store_true',
+                        help='only print query plans and fail on full table scans')
+    args = parser.parse_args()
+
+    manager = IndexManager(args.db)
+    if not args.check:
+        if args.without_rowid and manager.convert_ratings_to_without_rowid():
+            print("movie_ratings rebuilt as a WITHOUT ROWID table")
+        manager.create_indexes()
+        print(f"Created {len(INDEXES)} indexes and refreshed planner statistics")
+
+    if not manager.check():
+        print("\nSome queries still perform unexpected full table scans")
+        sys.exit(1)
+    print("\nAll analytics queries use indexes (or an accepted full scan)")
@@ -0,0 +1,325 @@
+import argparse
+import csv
+import io
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+from compact_schema import RATING_INSERT_SQL, is_compact_schema
+from leaderboards import has_leaderboards, update_leaderboards
+from rating_histograms import has_rating_histograms, update_rating_histograms
+from recommender import has_movie_similarity, refresh_movie_similarity
+
+RATING_COLUMNS = ('movie_id', 'user_id', 'rating', 'review_date')
+_END = object()
+
+
+def validate_events(frame, known_movies=None):
+    """Vectorized validation of a chunk of raw events
+
+    Returns the insertable (movie_id, user_id, rating, review_date) tuples and a
+    list of (row position, error) for the rejected rows.
+    """
+    frame = frame.reindex(columns=RATING_COLUMNS)
+    movie_id = pd.to_numeric(frame['movie_id'], errors='coerce')
+    user_id = pd.to_numeric(frame['user_id'], errors='coerce')
+    rating = pd.to_numeric(frame['rating'], errors='coerce')
+    review_text = frame['review_date'].astype(str)
+    review_date = pd.to_datetime(review_text, format='%Y-%m-%d', errors='coerce')
+
+    # Mirror CHECK (rating >= 1 AND rating <= 10) so bad rows never abort a batch
+    checks = [
+        (frame.isna().any(axis=1), 'missing field'),
+        (movie_id.isna() | (movie_id != movie_id.round()), 'invalid movie_id'),
+        (user_id.isna() | (user_id != user_id.round()), 'invalid user_id'),
+        (rating.isna(), 'invalid rating'),
+        (~rating.between(1, 10), 'rating outside 1-10'),
+        (review_date.isna(), 'invalid review_date'),
+    ]
+    if known_movies is not None:
+        # known_movies is a boolean lookup array indexed by movie_id
+        ids = movie_id.fillna(-1).to_numpy()
+        in_range = (ids >= 0) & (ids < len(known_movies))
+        known = np.zeros(len(ids), dtype=bool)
+        known[in_range] = known_movies[ids[in_range].astype(np.int64)]
+        checks.append((pd.Series(~known, index=frame.index), 'unknown movie_id'))
+
+    bad = np.zeros(len(frame), dtype=bool)
+    errors = np.full(len(frame), None, dtype=object)
+    for mask, message in checks:
+        mask = mask.to_numpy() & ~bad
+        errors[mask] = message
+        bad |= mask
+
+    ok = ~bad
+    # Normalize dates only where the input was not already YYYY-MM-DD
+    dates = review_text[ok]
+    irregular = dates.str.len() != 10
+    if irregular.any():
+        dates = dates.where(~irregular, review_date[ok].dt.strftime('%Y-%m-%d'))
+
+    rows = list(zip(
+        movie_id[ok].astype('int64').tolist(),
+        user_id[ok].astype('int64').tolist(),
+        rating[ok].astype(float).tolist(),
+        dates.tolist(),
+    ))
+    rejects = [(int(i), errors[i]) for i in np.flatnonzero(bad)]
+    return rows, rejects
+
+
+def parse_chunk(lines, fmt='jsonl', header=None):
+    """Parse a list of JSONL or CSV lines into a DataFrame of raw values
+
+    Lines that are not valid JSON come back as (position, error) pairs.
+    """
+    if fmt == 'csv':
+        # Let the C parser convert numeric columns; malformed values leave a
+        # column as object dtype and are caught by validate_events
+        try:
+            frame = pd.read_csv(io.StringIO(''.join(lines)), names=header, header=None,
+                                dtype={'review_date': str}, keep_default_na=False, na_values=[''])
+            if len(frame) == len(lines):
+                return frame, []
+        except (pd.errors.ParserError, ValueError):
+            pass
+        # Slow path for chunks with malformed lines: parse them one at a time
+        records = []
+        positions = []
+        failures = []
+        for position, fields in enumerate(csv.reader(lines)):
+            if len(fields) != len(header):
+                failures.append((position, f'expected {len(header)} fields, got {len(fields)}'))
+                continue
+            records.append([field or None for field in fields])
+            positions.append(position)
+        return pd.DataFrame(records, index=positions, columns=header), failures
+
+    records = []
+    positions = []
+    failures = []
+    for position, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            failures.append((position, f'invalid JSON: {e}'))
+            continue
+        if not isinstance(record, dict):
+            failures.append((position, 'event is not a JSON object'))
+            continue
+        records.append(record)
+        positions.append(position)
+    if not records:
+        # from_records cannot build an empty frame with named columns
+        return pd.DataFrame(columns=RATING_COLUMNS), failures
+    return pd.DataFrame.from_records(records, index=positions, columns=RATING_COLUMNS), failures
+
+
+class RatingIngestor:
+    """Append rating events to movie_ratings in small transactions
+
+    A reader thread parses and validates events in chunks and hands them to the
+    writer through a bounded queue, so a slow database pushes back on the input
+    instead of buffering without limit. The writer commits a micro-transaction
+    whenever batch_rows events are pending or the oldest pending event is
+    max_latency seconds old. movie_rating_stats is kept current by its triggers;
+    batch_hooks are called as hook(conn, rows) inside the same transaction for
+    any other aggregates that should follow the inserted rows.
+    """
+
+    def __init__(self, db_path='movies.db', batch_rows=20000, max_latency=0.5,
+                 max_pending_chunks=8, chunk_rows=20000,
+                 dead_letter_path='rejected_ratings.jsonl', batch_hooks=None):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.max_latency = max_latency
+        self.chunk_rows = chunk_rows
+        self.dead_letter_path = dead_letter_path
+        self.batch_hooks = list(batch_hooks or [])
+        self._queue = queue.Queue(maxsize=max_pending_chunks)
+        self._dead_letter = None
+        self._dead_letter_lock = threading.Lock()
+        self._compact = False
+
+    def add_batch_hook(self, hook):
+        self.batch_hooks.append(hook)
+
+    def _reject(self, line_number, raw, error):
+        with self._dead_letter_lock:
+            if self._dead_letter is None:
+                self._dead_letter = open(self.dead_letter_path, 'a', encoding='utf-8')
+            self._dead_letter.write(json.dumps({'line': line_number, 'record': raw, 'error': str(error)}) + '\n')
+            self.rejected += 1
+
+    def _line_chunks(self, lines, fmt):
+        header = None
+        chunk = []
+        line_numbers = []
+        for line_number, line in enumerate(lines, 1):
+            if fmt == 'csv' and header is None:
+                header = [name.strip() for name in next(csv.reader([line]))]
+                continue
+            if not line.strip():
+                continue
+            chunk.append(line)
+            line_numbers.append(line_number)
+            if len(chunk) >= self.chunk_rows:
+                yield line_numbers, chunk, header
+                chunk, line_numbers = [], []
+        if chunk:
+            yield line_numbers, chunk, header
+
+    def _read(self, lines, fmt, known_movies):
+        try:
+            for line_numbers, chunk, header in self._line_chunks(lines, fmt):
+                frame, failures = parse_chunk(chunk, fmt, header)
+                rows, rejects = validate_events(frame, known_movies)
+                positions = frame.index.to_numpy()
+                for position, error in failures + [(positions[i], e) for i, e in rejects]:
+                    self._reject(line_numbers[position], chunk[position].rstrip('\n'), error)
+                if rows:
+                    # Blocks while the writer is behind (backpressure)
+                    self._queue.put(rows)
+        except Exception as e:
+            # The writer re-raises it once the rows read so far are written
+            self._queue.put(e)
+        finally:
+            self._queue.put(_END)
+
+    def _next_rating_id(self, conn):
+        # Explicit ids keep inserts valid when movie_ratings is a WITHOUT ROWID table
+        return (conn.execute('SELECT MAX(rating_id) FROM movie_ratings').fetchone()[0] or 0) + 1
+
+    def _write_batch(self, conn, rows, next_id):
+        if self._compact:
+            # Stored as tenths; round here so the batch hooks see the stored value
+            batch = [(next_id + i, movie_id, user_id, round(rating, 1), review_date)
+                     for i, (movie_id, user_id, rating, review_date) in enumerate(rows)]
+        else:
+            batch = [(next_id + i,) + row for i, row in enumerate(rows)]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(RATING_INSERT_SQL if self._compact else '''
+                INSERT INTO movie_ratings (rating_id, movie_id, user_id, rating, review_date)
+                VALUES (?, ?, ?, ?, ?)
+            ''', batch)
+            for hook in self.batch_hooks:
+                hook(conn, batch)
+            conn.execute('COMMIT')
+        except sqlite3.DatabaseError as e:
+            conn.execute('ROLLBACK')
+            if len(batch) == 1:
+                self._reject(None, dict(zip(RATING_COLUMNS, rows[0])), e)
+                return 0
+            # Split the batch to isolate the offending rows
+            middle = len(rows) // 2
+            written = self._write_batch(conn, rows[:middle], next_id)
+            return written + self._write_batch(conn, rows[middle:], next_id + middle)
+        self.batches += 1
+        return len(batch)
+
+    def ingest(self, lines, fmt='jsonl'):
+        """Consume events from an iterable of text lines until it is exhausted"""
+        self.accepted = self.rejected = self.batches = 0
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        self._compact = is_compact_schema(conn)
+        max_movie_id = conn.execute('SELECT MAX(movie_id) FROM movies').fetchone()[0] or 0
+        known_movies = np.zeros(max_movie_id + 1, dtype=bool)
+        known_movies[[row[0] for row in conn.execute('SELECT movie_id FROM movies')]] = True
+
+        reader = threading.Thread(target=self._read, args=(lines, fmt, known_movies), daemon=True)
+        started = time.perf_counter()
+        reader.start()
+
+        next_id = self._next_rating_id(conn)
+        pending = []
+        oldest = None
+        finished = False
+        failure = None
+        try:
+            while not finished:
+                timeout = None if oldest is None else max(0.0, oldest + self.max_latency - time.perf_counter())
+                try:
+                    chunk = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    chunk = None
+
+                if chunk is _END:
+                    finished = True
+                elif isinstance(chunk, Exception):
+                    failure, finished = chunk, True
+                elif chunk is not None:
+                    if oldest is None:
+                        oldest = time.perf_counter()
+                    pending.extend(chunk)
+
+                due = oldest is not None and time.perf_counter() - oldest >= self.max_latency
+                if pending and (finished or due or len(pending) >= self.batch_rows):
+                    written = self._write_batch(conn, pending, next_id)
+                    next_id += len(pending)
+                    self.accepted += written
+                    pending = []
+                    oldest = None
+        finally:
+            # Drain the queue so a reader blocked on backpressure can finish
+            while reader.is_alive():
+                try:
+                    self._queue.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            conn.close()
+            if self._dead_letter is not None:
+                self._dead_letter.close()
+                self._dead_letter = None
+        if failure is not None:
+            raise failure
+
+        elapsed = time.perf_counter() - started
+        rate = self.accepted / max(elapsed, 1e-9)
+        print(f"Ingested {self.accepted:,} ratings in {self.batches} batches, "
+              f"rejected {self.rejected:,} ({rate:,.0f} events/sec)")
+        return {'accepted': self.accepted, 'rejected': self.rejected,
+                'batches': self.batches, 'seconds': elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Append rating events to movies.db')
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help="JSONL/CSV files to read, '-' for stdin")
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                        help='input format (default: from file extension, jsonl for stdin)')
+    parser.add_argument('--batch-rows', type=int, default=20000)
+    parser.add_argument('--max-latency', type=float, default=0.5)
+    parser.add_argument('--dead-letter', default='rejected_ratings.jsonl')
+    args = parser.parse_args()
+
+    ingestor = RatingIngestor(args.db, batch_rows=args.batch_rows, max_latency=args.max_latency,
+                              dead_letter_path=args.dead_letter)
+    conn = sqlite3.connect(args.db)
+    if has_rating_histograms(conn):
+        ingestor.add_batch_hook(update_rating_histograms)
+    if has_leaderboards(conn):
+        ingestor.add_batch_hook(update_leaderboards)
+    conn.close()
+    for path in args.inputs:
+        fmt = args.format or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            ingestor.ingest(sys.stdin, fmt)
+        else:
+            with open(path, encoding='utf-8', newline='') as f:
+                ingestor.ingest(f, fmt)
+
+    # Neighbor lists are brought up to date once per run rather than per batch
+    conn = sqlite3.connect(args.db)
+    if has_movie_similarity(conn):
+        with conn:
+            refreshed = refresh_movie_similarity(conn)
+        print(f"Neighbor lists refreshed for {refreshed:,} rated movies")
+    conn.close()
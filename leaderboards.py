@@ -0,0 +1,389 @@
+import argparse
+import sqlite3
+import time
+
+# Leaderboards rank movies overall and within each genre, director and release year
+SCOPES = ('all', 'genre', 'director', 'year')
+
+# Entries guaranteed per leaderboard; deeper reads fall back to ranking the scope
+DEFAULT_DEPTH = 100
+
+# Lists are ranked DEPTH_SLACK times deeper than they are served, so movies
+# dropping out of a list rarely force its scope to be ranked again
+DEPTH_SLACK = 2
+
+# The best movies of every leaderboard, clustered by (scope, scope_key,
+# rank) so a top-N read is a single range scan. scope_key is '' for 'all',
+# the genre, the director id or the release year.
+LEADERBOARD_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS movie_leaderboard (
+        scope TEXT NOT NULL,
+        scope_key TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (scope, scope_key, rank)
+    ) WITHOUT ROWID
+'''
+
+LEADERBOARD_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_movie_leaderboard_movie ON movie_leaderboard (movie_id)'
+
+# The Bayesian prior every score is shrunk towards: prior_count pseudo-ratings
+# at the global mean (the IMDb weighted rating). It is fixed when the
+# leaderboards are built, so scores stay comparable across refreshes.
+PRIOR_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS leaderboard_prior (
+        prior_mean REAL NOT NULL,
+        prior_count REAL NOT NULL,
+        depth INTEGER NOT NULL
+    )
+'''
+
+# Movies whose rating aggregates or scopes changed since the last refresh
+DIRTY_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS movie_leaderboard_dirty (movie_id INTEGER PRIMARY KEY)'
+
+# As in movie_cube.py, UPDATE OF names the stored columns of the compact schema too
+LEADERBOARD_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_leaderboard_stats_insert
+    AFTER INSERT ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_leaderboard_dirty (movie_id) VALUES (NEW.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_leaderboard_stats_update
+    AFTER UPDATE ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_leaderboard_dirty (movie_id) VALUES (OLD.movie_id), (NEW.movie_id)
+        ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_leaderboard_stats_delete
+    AFTER DELETE ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_leaderboard_dirty (movie_id) VALUES (OLD.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_leaderboard_movies_update
+    AFTER UPDATE OF movie_id, genre, genre_id, release_date, release_day, director_id ON movies
+    BEGIN
+        INSERT INTO movie_leaderboard_dirty (movie_id) VALUES (OLD.movie_id), (NEW.movie_id)
+        ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_leaderboard_movies_delete
+    AFTER DELETE ON movies
+    BEGIN
+        INSERT INTO movie_leaderboard_dirty (movie_id) VALUES (OLD.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+]
+
+_TRIGGER_NAMES = ('stats_insert', 'stats_update', 'stats_delete', 'movies_update', 'movies_delete')
+
+# Every (scope, scope_key, movie_id, score) membership of the movies matching
+# {where}; the weighted score is (sum + m * C) / (count + m)
+_MEMBERSHIPS = '''
+    WITH scored AS (
+        SELECT
+            m.movie_id,
+            m.genre,
+            m.director_id,
+            strftime('%Y', m.release_date) as release_year,
+            (s.rating_sum + p.prior_mean * p.prior_count) / (s.rating_count + p.prior_count) as score
+        FROM movies m
+        JOIN movie_rating_stats s ON s.movie_id = m.movie_id
+        CROSS JOIN leaderboard_prior p
+        {where}
+    ),
+    memberships AS (
+        SELECT 'all' as scope, '' as scope_key, movie_id, score FROM scored
+        UNION ALL
+        SELECT 'genre', genre, movie_id, score FROM scored WHERE genre IS NOT NULL
+        UNION ALL
+        SELECT 'director', CAST(director_id AS TEXT), movie_id, score FROM scored WHERE director_id IS NOT NULL
+        UNION ALL
+        SELECT 'year', release_year, movie_id, score FROM scored WHERE release_year IS NOT NULL
+    )
+'''
+
+_RANKED = '''
+    SELECT scope, scope_key, rank, movie_id, score FROM (
+        SELECT scope, scope_key, movie_id, score,
+               ROW_NUMBER() OVER (PARTITION BY scope, scope_key ORDER BY score DESC, movie_id) - 1 as rank
+        FROM {source}
+    )
+    WHERE rank < ?
+'''
+
+_DIRTY = 'SELECT movie_id FROM movie_leaderboard_dirty'
+
+# Leaderboards a refresh has to touch: those a changed movie belongs to now,
+# and those it was listed in. stored is the list length and (last_score,
+# last_movie) its last entry. A list shorter than depth holds its whole scope.
+_TOUCHED_SQL = f'''
+    CREATE TEMP TABLE leaderboard_touched AS
+    SELECT t.scope, t.scope_key, l.rank + 1 as stored, l.score as last_score, l.movie_id as last_movie
+    FROM (
+        SELECT scope, scope_key FROM temp.leaderboard_candidates
+        UNION
+        SELECT scope, scope_key FROM movie_leaderboard WHERE movie_id IN ({_DIRTY})
+    ) t
+    LEFT JOIN movie_leaderboard l
+      ON l.scope = t.scope AND l.scope_key = t.scope_key
+     AND l.rank = (SELECT MAX(rank) FROM movie_leaderboard
+                   WHERE scope = t.scope AND scope_key = t.scope_key)
+'''
+
+# Unchanged entries keep their place relative to each other, and every movie
+# left out of a longer list ranked below its last entry. So a changed movie
+# belongs in a touched list when it ranks above that entry, or when the list
+# held the whole scope.
+_MERGED_SQL = f'''
+    CREATE TEMP TABLE leaderboard_merged AS
+    {_RANKED.format(source="""(
+        SELECT l.scope, l.scope_key, l.movie_id, l.score
+        FROM temp.leaderboard_touched t
+        JOIN movie_leaderboard l ON l.scope = t.scope AND l.scope_key = t.scope_key
+        WHERE l.movie_id NOT IN (""" + _DIRTY + """)
+        UNION ALL
+        SELECT c.scope, c.scope_key, c.movie_id, c.score
+        FROM temp.leaderboard_candidates c
+        JOIN temp.leaderboard_touched t ON t.scope = c.scope AND t.scope_key = c.scope_key
+        WHERE t.stored IS NULL OR t.stored < ?
+           OR c.score > t.last_score OR (c.score = t.last_score AND c.movie_id <= t.last_movie)
+    )""")}
+'''
+
+# Lists that fell below depth entries cannot be topped up from what is
+# stored; those scopes are ranked again from scratch
+_RECOMPUTE_SQL = '''
+    CREATE TEMP TABLE leaderboard_recompute AS
+    SELECT t.scope, t.scope_key
+    FROM temp.leaderboard_touched t
+    WHERE t.stored >= ?
+      AND (SELECT COUNT(*) FROM temp.leaderboard_merged g
+           WHERE g.scope = t.scope AND g.scope_key = t.scope_key) < ?
+'''
+
+# Movies of the scopes being ranked again
+_RECOMPUTE_MOVIES = '''
+    WHERE EXISTS (SELECT 1 FROM temp.leaderboard_recompute WHERE scope = 'all')
+       OR m.genre IN (SELECT scope_key FROM temp.leaderboard_recompute WHERE scope = 'genre')
+       OR CAST(m.director_id AS TEXT) IN (SELECT scope_key FROM temp.leaderboard_recompute WHERE scope = 'director')
+       OR strftime('%Y', m.release_date) IN (SELECT scope_key FROM temp.leaderboard_recompute WHERE scope = 'year')
+'''
+
+_TEMP_TABLES = ('leaderboard_candidates', 'leaderboard_touched', 'leaderboard_merged', 'leaderboard_recompute')
+
+_ENTRY_COLUMNS = '''
+        m.movie_id,
+        m.title,
+        d.name as director,
+        m.genre,
+        strftime('%Y', m.release_date) as release_year,
+        s.rating_sum / s.rating_count as avg_rating,
+        s.rating_count as total_ratings,
+'''
+
+LEADERBOARD_QUERY = f"""
+    SELECT
+        l.rank + 1 as rank,{_ENTRY_COLUMNS}
+        l.score as weighted_score
+    FROM movie_leaderboard l
+    JOIN movies m ON m.movie_id = l.movie_id
+    LEFT JOIN directors d ON d.director_id = m.director_id
+    JOIN movie_rating_stats s ON s.movie_id = l.movie_id
+    WHERE l.scope = ? AND l.scope_key = ? AND l.rank < ?
+    ORDER BY l.rank
+    """
+
+# Every movie of one scope by weighted score, for reads deeper than the stored lists
+RANKING_QUERY = _MEMBERSHIPS.format(where='') + f"""
+    SELECT
+        ROW_NUMBER() OVER (ORDER BY r.score DESC, r.movie_id) as rank,{_ENTRY_COLUMNS}
+        r.score as weighted_score
+    FROM memberships r
+    JOIN movies m ON m.movie_id = r.movie_id
+    LEFT JOIN directors d ON d.director_id = m.director_id
+    JOIN movie_rating_stats s ON s.movie_id = r.movie_id
+    WHERE r.scope = ? AND r.scope_key = ?
+    ORDER BY rank
+    """
+
+
+def scope_key(scope, key=None):
+    """Stored scope_key of a leaderboard: '' for 'all', else the key as text"""
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {SCOPES}")
+    if scope == 'all':
+        return ''
+    if key is None:
+        raise ValueError(f"a key is required for the {scope} leaderboards")
+    return str(key)
+
+
+def _set_prior(conn, depth, prior_count=None):
+    """Fix the prior at the current global mean; prior_count defaults to the median ratings per movie"""
+    if prior_count is None:
+        prior_count = conn.execute('''
+            SELECT rating_count FROM movie_rating_stats ORDER BY rating_count
+            LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM movie_rating_stats)
+        ''').fetchone()
+        prior_count = prior_count[0] if prior_count else 1
+    conn.execute('DELETE FROM leaderboard_prior')
+    conn.execute('''
+        INSERT INTO leaderboard_prior (prior_mean, prior_count, depth)
+        SELECT COALESCE(TOTAL(rating_sum) / NULLIF(TOTAL(rating_count), 0), 0), ?, ?
+        FROM movie_rating_stats
+    ''', (prior_count, depth))
+
+
+def leaderboard_settings(conn):
+    """(prior_mean, prior_count, depth) the leaderboards were built with"""
+    return conn.execute('SELECT prior_mean, prior_count, depth FROM leaderboard_prior').fetchone()
+
+
+def create_leaderboards(conn, depth=DEFAULT_DEPTH, prior_count=None):
+    """Create the leaderboard tables, rank every scope and install the triggers"""
+    conn.execute(LEADERBOARD_TABLE_SQL)
+    conn.execute(LEADERBOARD_INDEX_SQL)
+    conn.execute(PRIOR_TABLE_SQL)
+    conn.execute(DIRTY_TABLE_SQL)
+    rebuild_leaderboards(conn, depth, prior_count)
+    for trigger_sql in LEADERBOARD_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_leaderboards(conn):
+    """Drop the leaderboards, their prior, change table and triggers"""
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS movie_leaderboard_{name}')
+    for table in ('movie_leaderboard', 'leaderboard_prior', 'movie_leaderboard_dirty'):
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def has_leaderboards(conn):
+    """Check whether the database already carries the leaderboards"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie_leaderboard'"
+    ).fetchone()
+    return row is not None
+
+
+def _rank_all(conn, depth):
+    conn.execute('DELETE FROM movie_leaderboard')
+    conn.execute(f'''
+        {_MEMBERSHIPS.format(where='')}
+        INSERT INTO movie_leaderboard (scope, scope_key, rank, movie_id, score)
+        {_RANKED.format(source='memberships')}
+    ''', (depth * DEPTH_SLACK,))
+    conn.execute('DELETE FROM movie_leaderboard_dirty')
+
+
+def rebuild_leaderboards(conn, depth=None, prior_count=None):
+    """Rank every scope again, with the prior reset to the current global mean"""
+    if depth is None:
+        settings = leaderboard_settings(conn)
+        depth = settings[2] if settings else DEFAULT_DEPTH
+    _set_prior(conn, depth, prior_count)
+    _rank_all(conn, depth)
+
+
+def refresh_leaderboards(conn):
+    """Bring the leaderboards up to date with changed movies; returns how many changed
+
+    Only the lists a changed movie belongs to or was listed in are touched,
+    by merging the changed movies into what is stored. A full list that
+    loses entries this way is ranked again from its scope. The prior stays
+    as built; rebuild_leaderboards() moves it to the current global mean.
+    """
+    changed = conn.execute('SELECT COUNT(*) FROM movie_leaderboard_dirty').fetchone()[0]
+    if not changed:
+        return 0
+    depth = leaderboard_settings(conn)[2]
+    rated = conn.execute('SELECT COUNT(*) FROM movie_rating_stats').fetchone()[0]
+    if changed * 4 > rated:
+        # e.g. after refresh_rating_stats(): ranking everything is cheaper than merging
+        _rank_all(conn, depth)
+        return changed
+
+    for table in _TEMP_TABLES:
+        conn.execute(f'DROP TABLE IF EXISTS temp.{table}')
+    conn.execute(f'''
+        CREATE TEMP TABLE leaderboard_candidates AS
+        {_MEMBERSHIPS.format(where=f'WHERE m.movie_id IN ({_DIRTY})')}
+        SELECT scope, scope_key, movie_id, score FROM memberships
+    ''')
+    conn.execute(_TOUCHED_SQL)
+    conn.execute(_MERGED_SQL, (depth, depth * DEPTH_SLACK))
+    conn.execute(_RECOMPUTE_SQL, (depth, depth))
+
+    conn.execute('''
+        DELETE FROM movie_leaderboard
+        WHERE (scope, scope_key) IN (SELECT scope, scope_key FROM temp.leaderboard_touched)
+    ''')
+    conn.execute('''
+        INSERT INTO movie_leaderboard (scope, scope_key, rank, movie_id, score)
+        SELECT scope, scope_key, rank, movie_id, score FROM temp.leaderboard_merged
+        WHERE (scope, scope_key) NOT IN (SELECT scope, scope_key FROM temp.leaderboard_recompute)
+    ''')
+    if conn.execute('SELECT 1 FROM temp.leaderboard_recompute LIMIT 1').fetchone():
+        conn.execute(f'''
+            {_MEMBERSHIPS.format(where=_RECOMPUTE_MOVIES)}
+            INSERT INTO movie_leaderboard (scope, scope_key, rank, movie_id, score)
+            {_RANKED.format(source="""(
+                SELECT memberships.* FROM memberships
+                JOIN temp.leaderboard_recompute r USING (scope, scope_key)
+            )""")}
+        ''', (depth * DEPTH_SLACK,))
+    for table in _TEMP_TABLES:
+        conn.execute(f'DROP TABLE temp.{table}')
+    conn.execute('DELETE FROM movie_leaderboard_dirty')
+    return changed
+
+
+def update_leaderboards(conn, batch):
+    """RatingIngestor batch hook: refresh the leaderboards the batch touched"""
+    if batch:
+        refresh_leaderboards(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or refresh the movie leaderboards')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--rebuild', action='store_true', help='rank every scope and reset the prior')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    parser.add_argument('--prior-count', type=float, default=None,
+                        help='pseudo-ratings at the global mean (default: median ratings per movie)')
+    parser.add_argument('--scope', choices=SCOPES, default='all')
+    parser.add_argument('--key', default=None, help='genre, director id or year of the leaderboard to show')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    with conn:
+        if args.rebuild or not has_leaderboards(conn):
+            drop_leaderboards(conn)
+            create_leaderboards(conn, args.depth, args.prior_count)
+            action = 'Built'
+        else:
+            action = f'Refreshed {refresh_leaderboards(conn):,} movies of'
+    lists = conn.execute('SELECT COUNT(DISTINCT scope || scope_key) FROM movie_leaderboard').fetchone()[0]
+    print(f"{action} {lists:,} leaderboards in {time.perf_counter() - start:.2f}s")
+    prior_mean, prior_count, depth = leaderboard_settings(conn)
+    print(f"Prior: {prior_count:g} ratings at {prior_mean:.2f}, {depth} entries per leaderboard")
+
+    start = time.perf_counter()
+    rows = conn.execute(LEADERBOARD_QUERY, (args.scope, scope_key(args.scope, args.key), args.top)).fetchall()
+    elapsed = time.perf_counter() - start
+    print(f"\nTop {args.top} ({args.scope}{' ' + args.key if args.key else ''}), read in {elapsed * 1e3:.2f}ms:")
+    for rank, _, title, _, genre, year, avg_rating, total_ratings, score in rows:
+        print(f"  {rank:>3}. {title:<30} {genre or '':<12} {year or '':<5} "
+              f"{score:.2f} (avg {avg_rating:.2f} from {total_ratings:,} ratings)")
+    conn.close()
@@ -0,0 +1,335 @@
+import argparse
+import sqlite3
+import time
+
+# Additive measures per (genre, release year, release month, director) cell.
+# The genre, season and director analyses all average per-movie average ratings,
+# so the cube keeps the sum of those averages next to the movie count; pooled
+# rating totals, box office, budget and profit sums with their non-null counts
+# and the release date range complete the measures the rollups need.
+CUBE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS movie_cube (
+        genre TEXT NOT NULL,
+        release_year TEXT,
+        release_month INTEGER,
+        director_id INTEGER,
+        movie_count INTEGER NOT NULL,
+        avg_rating_sum REAL NOT NULL,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        box_office_sum INTEGER,
+        box_office_count INTEGER NOT NULL,
+        budget_sum INTEGER,
+        budget_count INTEGER NOT NULL,
+        profit_sum INTEGER,
+        profit_count INTEGER NOT NULL,
+        first_release DATE,
+        last_release DATE
+    )
+'''
+
+CUBE_INDEXES_SQL = [
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_movie_cube_cell
+    ON movie_cube (genre, release_year, release_month, director_id)
+    ''',
+    # Covers the director rollup, which would otherwise sort the whole cube
+    '''
+    CREATE INDEX IF NOT EXISTS idx_movie_cube_director
+    ON movie_cube (director_id, movie_count, avg_rating_sum, box_office_sum, box_office_count,
+                   profit_sum, profit_count, first_release, last_release)
+    ''',
+]
+
+# Changes waiting for the next refresh: movies whose rating aggregates or
+# attributes changed, and cells a movie was moved out of or deleted from
+DIRTY_TABLES_SQL = [
+    'CREATE TABLE IF NOT EXISTS movie_cube_dirty_movies (movie_id INTEGER PRIMARY KEY)',
+    '''
+    CREATE TABLE IF NOT EXISTS movie_cube_dirty_cells (
+        genre TEXT,
+        release_year TEXT,
+        release_month INTEGER,
+        director_id INTEGER
+    )
+    ''',
+]
+
+_YEAR = "strftime('%Y', {date})"
+_MONTH = "CAST(strftime('%m', {date}) AS INTEGER)"
+
+
+_OLD_CELL = (f"OLD.genre, {_YEAR.format(date='OLD.release_date')}, "
+             f"{_MONTH.format(date='OLD.release_date')}, OLD.director_id")
+
+
+# The triggers only record what changed, so writes to movie_ratings pay for one
+# extra insert per touched movie; the cells are recomputed on refresh. They use
+# ON CONFLICT DO NOTHING because the movie_rating_stats upsert that fires them
+# would override an OR IGNORE conflict policy. UPDATE OF lists name the stored
+# columns of the compact schema (compact_schema.py) as well.
+CUBE_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_cube_stats_insert
+    AFTER INSERT ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_cube_dirty_movies (movie_id) VALUES (NEW.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_cube_stats_update
+    AFTER UPDATE ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_cube_dirty_movies (movie_id) VALUES (OLD.movie_id), (NEW.movie_id)
+        ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_cube_stats_delete
+    AFTER DELETE ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_cube_dirty_movies (movie_id) VALUES (OLD.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_cube_movies_insert
+    AFTER INSERT ON movies
+    BEGIN
+        INSERT INTO movie_cube_dirty_movies (movie_id) VALUES (NEW.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_cube_movies_update
+    AFTER UPDATE OF movie_id, genre, genre_id, release_date, release_day, director_id, budget, box_office
+    ON movies
+    BEGIN
+        INSERT INTO movie_cube_dirty_cells (genre, release_year, release_month, director_id)
+        VALUES ({_OLD_CELL});
+        INSERT INTO movie_cube_dirty_movies (movie_id) VALUES (NEW.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_cube_movies_delete
+    AFTER DELETE ON movies
+    BEGIN
+        INSERT INTO movie_cube_dirty_cells (genre, release_year, release_month, director_id)
+        VALUES ({_OLD_CELL});
+    END
+    ''',
+]
+
+_TRIGGER_NAMES = ('stats_insert', 'stats_update', 'stats_delete',
+                  'movies_insert', 'movies_update', 'movies_delete')
+
+_CELL_COLUMNS = '''
+    genre, release_year, release_month, director_id, movie_count, avg_rating_sum,
+    rating_count, rating_sum, box_office_sum, box_office_count, budget_sum, budget_count,
+    profit_sum, profit_count, first_release, last_release
+'''
+
+_CELL_SELECT = f'''
+    SELECT
+        m.genre,
+        {_YEAR.format(date='m.release_date')},
+        {_MONTH.format(date='m.release_date')},
+        m.director_id,
+        COUNT(*),
+        SUM(s.rating_sum / s.rating_count),
+        SUM(s.rating_count),
+        SUM(s.rating_sum),
+        SUM(m.box_office),
+        COUNT(m.box_office),
+        SUM(m.budget),
+        COUNT(m.budget),
+        SUM(m.box_office - m.budget),
+        COUNT(m.box_office - m.budget),
+        MIN(m.release_date),
+        MAX(m.release_date)
+    FROM movies m
+    JOIN movie_rating_stats s ON m.movie_id = s.movie_id
+'''
+
+# Cells to recompute, with the release date range of dated cells so movies can
+# be found through the (genre, release_date) index
+_REFRESH_CELLS_SQL = f'''
+    CREATE TEMP TABLE movie_cube_refresh AS
+    SELECT genre, release_year, release_month, director_id,
+           date(printf('%s-%02d-01', release_year, release_month)) as month_start,
+           date(printf('%s-%02d-01', release_year, release_month), '+1 month') as month_end
+    FROM (
+        SELECT m.genre, {_YEAR.format(date='m.release_date')} as release_year,
+               {_MONTH.format(date='m.release_date')} as release_month, m.director_id
+        FROM movie_cube_dirty_movies d
+        JOIN movies m ON m.movie_id = d.movie_id
+        UNION
+        SELECT genre, release_year, release_month, director_id
+        FROM movie_cube_dirty_cells
+    )
+'''
+
+_CELL_MATCH = '''
+    c.genre = r.genre AND c.release_year IS r.release_year
+    AND c.release_month IS r.release_month AND c.director_id IS r.director_id
+'''
+
+
+def create_movie_cube(conn):
+    """Create movie_cube, fill it from movies and movie_rating_stats, and install its triggers"""
+    conn.execute(CUBE_TABLE_SQL)
+    for index_sql in CUBE_INDEXES_SQL:
+        conn.execute(index_sql)
+    for table_sql in DIRTY_TABLES_SQL:
+        conn.execute(table_sql)
+    rebuild_movie_cube(conn)
+    for trigger_sql in CUBE_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_movie_cube(conn):
+    """Drop movie_cube, its change tables and triggers"""
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS movie_cube_{name}')
+    for table in ('movie_cube', 'movie_cube_dirty_movies', 'movie_cube_dirty_cells'):
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def has_movie_cube(conn):
+    """Check whether the database already carries the cube"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie_cube'"
+    ).fetchone()
+    return row is not None
+
+
+def rebuild_movie_cube(conn):
+    """Recompute every cell"""
+    conn.execute('DELETE FROM movie_cube')
+    conn.execute(f'INSERT INTO movie_cube ({_CELL_COLUMNS}) {_CELL_SELECT} GROUP BY 1, 2, 3, 4')
+    conn.execute('DELETE FROM movie_cube_dirty_movies')
+    conn.execute('DELETE FROM movie_cube_dirty_cells')
+
+
+def pending_changes(conn):
+    """Number of recorded changes the cube has not absorbed yet"""
+    return conn.execute('''
+        SELECT (SELECT COUNT(*) FROM movie_cube_dirty_movies)
+             + (SELECT COUNT(*) FROM movie_cube_dirty_cells)
+    ''').fetchone()[0]
+
+
+def refresh_movie_cube(conn):
+    """Recompute only the cells touched since the last refresh; returns how many"""
+    pending = pending_changes(conn)
+    if not pending:
+        return 0
+    total = conn.execute('SELECT COUNT(*) FROM movie_cube').fetchone()[0]
+    if pending > total // 2:
+        # e.g. after refresh_rating_stats(): one grouped pass beats per-cell lookups
+        rebuild_movie_cube(conn)
+        return conn.execute('SELECT COUNT(*) FROM movie_cube').fetchone()[0]
+    conn.execute('DROP TABLE IF EXISTS temp.movie_cube_refresh')
+    conn.execute(_REFRESH_CELLS_SQL)
+    conn.execute(f'''
+        DELETE FROM movie_cube WHERE rowid IN (
+            SELECT c.rowid FROM temp.movie_cube_refresh r
+            JOIN movie_cube c ON {_CELL_MATCH}
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO movie_cube ({_CELL_COLUMNS})
+        {_CELL_SELECT}
+        JOIN temp.movie_cube_refresh r
+          ON m.genre = r.genre AND m.director_id IS r.director_id
+         AND m.release_date >= r.month_start AND m.release_date < r.month_end
+        WHERE strftime('%m', m.release_date) IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    ''')
+    # Movies without a usable release date share one undated cell per genre and director
+    conn.execute(f'''
+        INSERT INTO movie_cube ({_CELL_COLUMNS})
+        {_CELL_SELECT}
+        JOIN temp.movie_cube_refresh r
+          ON r.month_start IS NULL AND m.genre = r.genre AND m.director_id IS r.director_id
+        WHERE strftime('%m', m.release_date) IS NULL
+        GROUP BY 1, 2, 3, 4
+    ''')
+    cells = conn.execute('SELECT COUNT(*) FROM temp.movie_cube_refresh').fetchone()[0]
+    conn.execute('DROP TABLE temp.movie_cube_refresh')
+    conn.execute('DELETE FROM movie_cube_dirty_movies')
+    conn.execute('DELETE FROM movie_cube_dirty_cells')
+    return cells
+
+
+# Rollups of the cube with the same columns and order as the SQL analyses
+CUBE_GENRE_POPULARITY_QUERY = """
+    SELECT
+        genre,
+        release_year,
+        SUM(movie_count) as movie_count,
+        SUM(avg_rating_sum) / SUM(movie_count) as avg_genre_rating,
+        SUM(box_office_sum) as total_box_office
+    FROM movie_cube
+    GROUP BY genre, release_year
+    ORDER BY release_year, movie_count DESC
+    """
+
+CUBE_DIRECTOR_PERFORMANCE_QUERY = """
+    SELECT
+        d.name as director_name,
+        SUM(c.movie_count) as total_movies,
+        SUM(c.avg_rating_sum) / SUM(c.movie_count) as avg_director_rating,
+        1.0 * SUM(c.box_office_sum) / NULLIF(SUM(c.box_office_count), 0) as avg_box_office,
+        SUM(c.box_office_sum) as total_box_office,
+        1.0 * SUM(c.profit_sum) / NULLIF(SUM(c.profit_count), 0) as avg_profit,
+        MIN(c.first_release) as first_movie,
+        MAX(c.last_release) as latest_movie
+    FROM directors d
+    JOIN movie_cube c ON d.director_id = c.director_id
+    GROUP BY d.director_id, d.name
+    HAVING SUM(c.movie_count) >= 2
+    ORDER BY avg_director_rating DESC
+    """
+
+CUBE_SEASONAL_RELEASE_QUERY = """
+    SELECT
+        CASE
+            WHEN release_month IN (12, 1, 2) THEN 'Winter'
+            WHEN release_month IN (3, 4, 5) THEN 'Spring'
+            WHEN release_month IN (6, 7, 8) THEN 'Summer'
+            ELSE 'Fall'
+        END as season,
+        genre,
+        SUM(movie_count) as movie_count,
+        SUM(avg_rating_sum) / SUM(movie_count) as avg_rating,
+        1.0 * SUM(box_office_sum) / NULLIF(SUM(box_office_count), 0) as avg_box_office,
+        1.0 * SUM(profit_sum) / NULLIF(SUM(profit_count), 0) as avg_profit
+    FROM movie_cube
+    GROUP BY season, genre
+    ORDER BY season, avg_rating DESC
+    """
+
+CUBE_QUERIES = {
+    'genre_popularity_analysis': CUBE_GENRE_POPULARITY_QUERY,
+    'director_performance_metrics': CUBE_DIRECTOR_PERFORMANCE_QUERY,
+    'seasonal_release_patterns': CUBE_SEASONAL_RELEASE_QUERY,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or refresh the movie rollup cube')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every cell')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    with conn:
+        if args.rebuild or not has_movie_cube(conn):
+            drop_movie_cube(conn)
+            create_movie_cube(conn)
+            action = 'Built'
+        else:
+            action = f'Refreshed {refresh_movie_cube(conn):,} cells of'
+    cells = conn.execute('SELECT COUNT(*) FROM movie_cube').fetchone()[0]
+    conn.close()
+    print(f"{action} movie_cube ({cells:,} cells) in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,398 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from collaboration_graph import CollaborationGraph
+
+# Indexed by release month; 0 stands for a NULL release date, which the SQL
+# CASE sends to its ELSE branch
+SEASONS = np.array(['Fall', 'Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer',
+                    'Summer', 'Summer', 'Fall', 'Fall', 'Fall', 'Winter'])
+
+
+# Exported tables from_arrow reads (see columnar_export.py)
+ARROW_TABLES = ('movies', 'directors', 'actors', 'movie_actors', 'movie_rating_stats')
+
+
+def _dense_index(ids):
+    """Lookup array mapping an integer id to its row position (-1 when absent)"""
+    lookup = np.full(int(ids.max()) + 2 if len(ids) else 1, -1, dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    return lookup
+
+
+def _lookup(index, ids):
+    """Row positions for ids, with -1 for ids outside the index"""
+    positions = np.full(len(ids), -1, dtype=np.int64)
+    in_range = (ids >= 0) & (ids < len(index))
+    positions[in_range] = index[ids[in_range]]
+    return positions
+
+
+def _group(*keys):
+    """Group codes and the first-row position of each group for one or more key arrays"""
+    combined = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        # NULL keys form their own group, as in SQL's GROUP BY
+        codes, uniques = pd.factorize(key, sort=True, use_na_sentinel=False)
+        combined = combined * len(uniques) + codes
+    codes, uniques = pd.factorize(combined, sort=True)
+    # Assigning in reverse leaves the smallest row position for every group
+    first = np.empty(len(uniques), dtype=np.int64)
+    first[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+    return codes, first, len(uniques)
+
+
+def _mean(codes, values, counts):
+    return np.bincount(codes, weights=values, minlength=len(counts)) / counts
+
+
+# Nullable integer columns are float arrays with NaN for NULL. The aggregates
+# below skip NULLs like SQL's SUM and AVG, and are NULL for all-NULL groups.
+def _sum(codes, values, groups):
+    known = ~np.isnan(values)
+    totals = np.bincount(codes[known], weights=values[known], minlength=groups)
+    return np.where(np.bincount(codes[known], minlength=groups) > 0, totals, np.nan)
+
+
+def _avg(codes, values, groups):
+    known = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (np.bincount(codes[known], weights=values[known], minlength=groups)
+                / np.bincount(codes[known], minlength=groups))
+
+
+def _date_text(days):
+    """'YYYY-MM-DD' strings, None for NaT"""
+    return np.where(np.isnat(days), None, np.datetime_as_string(days, unit='D').astype(object))
+
+
+def _integers(values):
+    """Integer array when no value is NULL, as pandas reads the same SQLite column"""
+    return values if np.isnan(values).any() else values.astype(np.int64)
+
+
+def _arrow_values(column):
+    """NumPy array for a pyarrow ChunkedArray, without copying when the layout allows
+
+    A single null-free chunk of a numeric type is viewed in place; several
+    chunks, NULLs (NaN in a float copy) and strings need a conversion.
+    """
+    import pyarrow as pa
+    if column.num_chunks == 1 and column.null_count == 0:
+        try:
+            return column.chunk(0).to_numpy(zero_copy_only=True)
+        except pa.ArrowInvalid:
+            pass
+    return column.to_numpy()
+
+
+class NumpyAnalyticsEngine:
+    """Columnar in-memory implementation of the six MovieAnalytics analyses
+
+    The five tables are loaded once into NumPy arrays: ids become dense row
+    positions, genres become categorical codes, and every GROUP BY is a
+    np.bincount / np.*.reduceat over those codes. The engine is a snapshot;
+    call reload() after the database changes.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._prepare()
+
+    @classmethod
+    def from_sqlite(cls, db_path='movies.db', chunk_size=1000000):
+        """Load the five base tables from SQLite into column arrays"""
+        conn = sqlite3.connect(db_path)
+        try:
+            tables = {
+                'movies': pd.read_sql_query('''
+                    SELECT movie_id, title, genre, release_date, director_id, budget, box_office
+                    FROM movies ORDER BY movie_id
+                ''', conn),
+                'directors': pd.read_sql_query('SELECT director_id, name FROM directors', conn),
+                'actors': pd.read_sql_query('SELECT actor_id, name FROM actors', conn),
+                'movie_actors': pd.read_sql_query('SELECT movie_id, actor_id FROM movie_actors', conn),
+            }
+
+            # Ratings are streamed into preallocated arrays instead of a DataFrame
+            total = conn.execute('SELECT COUNT(rating) FROM movie_ratings').fetchone()[0]
+            movie_ids = np.empty(total, dtype=np.int64)
+            ratings = np.empty(total, dtype=np.float64)
+            cursor = conn.execute('SELECT movie_id, rating FROM movie_ratings WHERE rating IS NOT NULL')
+            position = 0
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                block = np.array(rows, dtype=np.float64)
+                movie_ids[position:position + len(rows)] = block[:, 0]
+                ratings[position:position + len(rows)] = block[:, 1]
+                position += len(rows)
+            tables['movie_ratings'] = {'movie_id': movie_ids[:position], 'rating': ratings[:position]}
+        finally:
+            conn.close()
+        engine = cls(tables)
+        engine.db_path = db_path
+        return engine
+
+    @classmethod
+    def from_arrow(cls, export_dir='columnar_export', db_path=None):
+        """Load the tables from an Arrow IPC export (see columnar_export.py)
+
+        The IPC files are memory-mapped, and numeric columns held in a single
+        null-free record batch become NumPy views of the mapped buffers, shared
+        through the page cache by every process reading the same export. Other
+        columns are converted straight from Arrow. Per-movie rating aggregates
+        come from the exported movie_rating_stats, so the ratings themselves
+        are never read. With db_path, an export older than the database is
+        refused.
+        """
+        from columnar_export import read_table, stale_tables
+
+        if db_path is not None:
+            stale = stale_tables(db_path, export_dir, ARROW_TABLES)
+            if stale:
+                raise ValueError(f"{export_dir} is out of date with {db_path} for "
+                                 f"{', '.join(stale)}; re-run columnar_export.py")
+
+        def columns(table, names):
+            data = read_table(export_dir, table, names)
+            if table == 'movies':
+                data = data.sort_by('movie_id')
+            return {name: _arrow_values(data.column(name)) for name in names}
+
+        tables = {
+            'movies': columns('movies', ['movie_id', 'title', 'genre', 'release_date', 'director_id',
+                                         'budget', 'box_office']),
+            'directors': columns('directors', ['director_id', 'name']),
+            'actors': pd.DataFrame(columns('actors', ['actor_id', 'name']), copy=False),
+            'movie_actors': pd.DataFrame(columns('movie_actors', ['movie_id', 'actor_id']), copy=False),
+            'movie_rating_stats': columns('movie_rating_stats', ['movie_id', 'rating_count', 'rating_sum',
+                                                                 'min_rating', 'max_rating']),
+        }
+        engine = cls(tables)
+        engine.export_dir = export_dir
+        engine.db_path = db_path
+        return engine
+
+    def reload(self):
+        if getattr(self, 'export_dir', None) is not None:
+            fresh = self.from_arrow(self.export_dir, self.db_path)
+        else:
+            fresh = self.from_sqlite(self.db_path)
+        self.tables = fresh.tables
+        self._prepare()
+
+    def _prepare(self):
+        self._graph = None
+        movies = self.tables['movies']
+        self.movie_id = np.asarray(movies['movie_id'], dtype=np.int64)
+        self.title = np.asarray(movies['title'], dtype=object)
+        self.genre_codes, self.genre_names = pd.factorize(np.asarray(movies['genre'], dtype=object),
+                                                          use_na_sentinel=False)
+        self.release_date = np.asarray(movies['release_date'], dtype=object)
+        # NULL dates: NaN year, month 0, NaT day and a NULL year label
+        dates = pd.Series(pd.to_datetime(self.release_date))
+        self.release_year = dates.dt.year.to_numpy(np.float64)
+        self.release_year_text = np.where(dates.isna(), None,
+                                          dates.dt.strftime('%Y').to_numpy(object))
+        self.release_month = dates.dt.month.fillna(0).to_numpy(np.int64)
+        self.release_day = dates.to_numpy('datetime64[D]')
+        # A NULL director joins no director row, like a missing one
+        director_id = np.asarray(movies['director_id'], dtype=np.float64)
+        self.director_id = np.where(np.isnan(director_id), -1, director_id).astype(np.int64)
+        self.budget = np.asarray(movies['budget'], dtype=np.float64)
+        self.box_office = np.asarray(movies['box_office'], dtype=np.float64)
+
+        self.movie_index = _dense_index(self.movie_id)
+        directors = self.tables['directors']
+        self.director_ids = np.asarray(directors['director_id'], dtype=np.int64)
+        self.director_names = np.asarray(directors['name'], dtype=object)
+        self.director_row = _lookup(_dense_index(self.director_ids), self.director_id)
+
+        if 'movie_rating_stats' in self.tables:
+            self._load_rating_stats(self.tables['movie_rating_stats'])
+        else:
+            self._aggregate_ratings(self.tables['movie_ratings'])
+        self.rated = np.flatnonzero(self.rating_count > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.avg_rating = self.rating_sum / self.rating_count
+
+    def _load_rating_stats(self, stats):
+        """Per-movie rating aggregates from precomputed movie_rating_stats columns"""
+        count = len(self.movie_id)
+        rows = _lookup(self.movie_index, np.asarray(stats['movie_id'], dtype=np.int64))
+        known = rows >= 0
+        self.rating_count = np.zeros(count, dtype=np.int64)
+        self.rating_sum = np.zeros(count)
+        self.min_rating = np.full(count, np.nan)
+        self.max_rating = np.full(count, np.nan)
+        self.rating_count[rows[known]] = np.asarray(stats['rating_count'])[known]
+        self.rating_sum[rows[known]] = np.asarray(stats['rating_sum'])[known]
+        self.min_rating[rows[known]] = np.asarray(stats['min_rating'])[known]
+        self.max_rating[rows[known]] = np.asarray(stats['max_rating'])[known]
+
+    def _aggregate_ratings(self, ratings):
+        """Per-movie rating aggregates computed from the raw ratings"""
+        rating_movie = _lookup(self.movie_index, np.asarray(ratings['movie_id'], dtype=np.int64))
+        known = rating_movie >= 0
+        rating_movie = rating_movie[known]
+        rating_values = np.asarray(ratings['rating'], dtype=np.float64)[known]
+        count = len(self.movie_id)
+        self.rating_count = np.bincount(rating_movie, minlength=count)
+        self.rating_sum = np.bincount(rating_movie, weights=rating_values, minlength=count)
+        self.min_rating = np.full(count, np.nan)
+        self.max_rating = np.full(count, np.nan)
+        if len(rating_movie):
+            order = np.argsort(rating_movie, kind='stable')
+            sorted_movies = rating_movie[order]
+            starts = np.flatnonzero(np.r_[True, sorted_movies[1:] != sorted_movies[:-1]])
+            rated_movies = sorted_movies[starts]
+            self.min_rating[rated_movies] = np.minimum.reduceat(rating_values[order], starts)
+            self.max_rating[rated_movies] = np.maximum.reduceat(rating_values[order], starts)
+
+    def genre_popularity_analysis(self):
+        movies = self.rated
+        codes, first, groups = _group(self.genre_codes[movies], self.release_year[movies])
+        counts = np.bincount(codes)
+        result = pd.DataFrame({
+            'genre': self.genre_names[self.genre_codes[movies[first]]],
+            'release_year': self.release_year_text[movies[first]],
+            'movie_count': counts,
+            'avg_genre_rating': _mean(codes, self.avg_rating[movies], counts),
+            'total_box_office': _integers(_sum(codes, self.box_office[movies], groups)),
+        })
+        # SQLite sorts NULL years first
+        return result.sort_values(['release_year', 'movie_count'], ascending=[True, False],
+                                  kind='stable', na_position='first', ignore_index=True)
+
+    def director_performance_metrics(self):
+        movies = self.rated[self.director_row[self.rated] >= 0]
+        codes, first, groups = _group(self.director_id[movies])
+        counts = np.bincount(codes)
+        order = np.argsort(codes, kind='stable')
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        days = self.release_day[movies][order]
+        result = pd.DataFrame({
+            'director_name': self.director_names[self.director_row[movies[first]]],
+            'total_movies': counts,
+            'avg_director_rating': _mean(codes, self.avg_rating[movies], counts),
+            'avg_box_office': _avg(codes, self.box_office[movies], groups),
+            'total_box_office': _integers(_sum(codes, self.box_office[movies], groups)),
+            'avg_profit': _avg(codes, self.box_office[movies] - self.budget[movies], groups),
+            # fmin/fmax skip NaT like MIN/MAX skip NULL
+            'first_movie': _date_text(np.fmin.reduceat(days, starts)),
+            'latest_movie': _date_text(np.fmax.reduceat(days, starts)),
+        })
+        result = result[result['total_movies'] >= 2]
+        return result.sort_values('avg_director_rating', ascending=False,
+                                  kind='stable', ignore_index=True)
+
+    def rating_distribution_analysis(self):
+        movies = self.rated[self.director_row[self.rated] >= 0]
+        avg = self.avg_rating[movies]
+        category = np.select([avg >= 8.0, avg >= 7.0, avg >= 6.0],
+                             ['Excellent', 'Good', 'Average'], default='Poor')
+        result = pd.DataFrame({
+            'title': self.title[movies],
+            'genre': self.genre_names[self.genre_codes[movies]],
+            'release_year': self.release_year_text[movies],
+            'director': self.director_names[self.director_row[movies]],
+            'avg_rating': avg,
+            'total_ratings': self.rating_count[movies],
+            'min_rating': self.min_rating[movies],
+            'max_rating': self.max_rating[movies],
+            'profit': _integers(self.box_office[movies] - self.budget[movies]),
+            'rating_category': category,
+        })
+        return result.sort_values('avg_rating', ascending=False, kind='stable', ignore_index=True)
+
+    def collaboration_graph(self):
+        """Sparse actor collaboration graph over the in-memory tables"""
+        if self._graph is None:
+            rated = self.rating_count > 0
+            titles = pd.Series(self.title, index=self.movie_id)
+            self._graph = CollaborationGraph(
+                self.tables['actors'], self.tables['movie_actors'],
+                pd.Series(self.avg_rating[rated], index=self.movie_id[rated]),
+                lambda movie_ids: titles.loc[movie_ids])
+        return self._graph
+
+    def actor_collaboration_network(self, min_collaborations=2, top_k=None):
+        return self.collaboration_graph().collaborations(min_collaborations, top_k)
+
+    def seasonal_release_patterns(self):
+        movies = self.rated
+        seasons = SEASONS[self.release_month[movies]]
+        codes, first, groups = _group(seasons, self.genre_codes[movies])
+        counts = np.bincount(codes)
+        result = pd.DataFrame({
+            'season': seasons[first],
+            'genre': self.genre_names[self.genre_codes[movies[first]]],
+            'movie_count': counts,
+            'avg_rating': _mean(codes, self.avg_rating[movies], counts),
+            'avg_box_office': _avg(codes, self.box_office[movies], groups),
+            'avg_profit': _avg(codes, self.box_office[movies] - self.budget[movies], groups),
+        })
+        return result.sort_values(['season', 'avg_rating'], ascending=[True, False],
+                                  kind='stable', ignore_index=True)
+
+    def budget_vs_rating_correlation(self):
+        movies = self.rated
+        budget = self.budget[movies]
+        result = pd.DataFrame({
+            'title': self.title[movies],
+            'budget': _integers(budget),
+            'box_office': _integers(self.box_office[movies]),
+            'profit': _integers(self.box_office[movies] - budget),
+            'avg_rating': self.avg_rating[movies],
+            'rating_count': self.rating_count[movies],
+            # A NULL budget fails both tests and lands in the ELSE branch
+            'budget_category': np.select([budget < 20000000, budget < 100000000],
+                                         ['Low Budget', 'Medium Budget'], default='High Budget'),
+        })
+        return result.sort_values('budget', ascending=False, kind='stable', ignore_index=True)
+
+
+def results_match(expected, actual, rtol=1e-9):
+    """Compare two analysis results independent of row order among ties"""
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    text_columns = [c for c in expected.columns if not pd.api.types.is_numeric_dtype(expected[c])]
+    sort_columns = text_columns or list(expected.columns)
+    expected = expected.sort_values(sort_columns, ignore_index=True)
+    actual = actual.sort_values(sort_columns, ignore_index=True)
+    for column in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[column]):
+            if not np.allclose(expected[column], actual[column], rtol=rtol, equal_nan=True):
+                return False
+        elif column != 'movies_together' and not (
+                (expected[column] == actual[column]) | (expected[column].isna() & actual[column].isna())).all():
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    from analysis_queries import MovieAnalytics, ANALYSES
+
+    parser = argparse.ArgumentParser(description='Compare the NumPy backend with SQLite')
+    parser.add_argument('--db', default='movies.db')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = NumpyAnalyticsEngine.from_sqlite(args.db)
+    print(f"Loaded tables into memory in {time.perf_counter() - start:.2f}s")
+
+    sql = MovieAnalytics(args.db)
+    for method in ANALYSES:
+        start = time.perf_counter()
+        expected = getattr(sql, method)()
+        sql_time = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = getattr(engine, method)()
+        numpy_time = time.perf_counter() - start
+        status = 'match' if results_match(expected, actual) else 'MISMATCH'
+        print(f"{method}: sqlite {sql_time * 1000:.1f}ms, numpy {numpy_time * 1000:.1f}ms "
+              f"({sql_time / max(numpy_time, 1e-9):.1f}x) {status}")
@@ -0,0 +1,526 @@
+import argparse
+import os
+import sqlite3
+import stat
+import time
+from urllib.request import pathname2url
+import pandas as pd
+from compact_schema import day_filter, is_compact_schema
+
+GRANULARITIES = ('month', 'year')
+
+# SQLite allows 10 attached databases by default; leave room for temp use
+MAX_ATTACHED = 8
+
+CATALOG_SQL = '''
+    CREATE TABLE IF NOT EXISTS rating_partitions (
+        partition_key TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        compacted INTEGER NOT NULL DEFAULT 0,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        max_rating_id INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# Review dates whose partition no longer matches movie_ratings. Updates and
+# deletes mark the old and new date; inserts only need marking when their
+# rating_id is below the copy watermark, since sync() appends everything above
+# it. As in rating_stats.py, UPDATE OF names the stored columns of the compact
+# schema too.
+DIRTY_SQL = 'CREATE TABLE IF NOT EXISTS rating_partitions_dirty (review_date TEXT PRIMARY KEY)'
+
+PARTITION_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_partitions_insert
+    AFTER INSERT ON movie_ratings
+    WHEN NEW.rating_id <= (SELECT COALESCE(MAX(max_rating_id), 0) FROM rating_partitions)
+    BEGIN
+        INSERT INTO rating_partitions_dirty (review_date) VALUES (NEW.review_date) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_partitions_update
+    AFTER UPDATE OF rating_id, movie_id, user_id, rating, rating_tenths, review_date, review_day
+    ON movie_ratings
+    BEGIN
+        INSERT INTO rating_partitions_dirty (review_date) VALUES (OLD.review_date), (NEW.review_date)
+        ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_partitions_delete
+    AFTER DELETE ON movie_ratings
+    BEGIN
+        INSERT INTO rating_partitions_dirty (review_date) VALUES (OLD.review_date) ON CONFLICT DO NOTHING;
+    END
+    ''',
+]
+
+_TRIGGER_NAMES = ('movie_ratings_partitions_insert', 'movie_ratings_partitions_update',
+                  'movie_ratings_partitions_delete')
+
+RAW_PARTITION_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS movie_ratings (
+        rating_id INTEGER PRIMARY KEY,
+        movie_id INTEGER,
+        user_id INTEGER,
+        rating REAL,
+        review_date DATE
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_partition_movie_date ON movie_ratings (movie_id, review_date, rating)',
+]
+
+COMPACTED_PARTITION_SQL = '''
+    CREATE TABLE IF NOT EXISTS daily_movie_ratings (
+        movie_id INTEGER NOT NULL,
+        review_date TEXT NOT NULL,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        rating_sum_sq REAL NOT NULL,
+        min_rating REAL,
+        max_rating REAL,
+        PRIMARY KEY (movie_id, review_date)
+    ) WITHOUT ROWID
+'''
+
+# Window aggregates use the movie_rating_stats column layout. The result is
+# created as a TEMP table of the same name, which shadows main.movie_rating_stats,
+# so the analytics queries run unchanged over the window.
+WINDOW_STATS_SQL = '''
+    CREATE TEMP TABLE movie_rating_stats (
+        movie_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        rating_sum_sq REAL NOT NULL,
+        min_rating REAL,
+        max_rating REAL
+    )
+'''
+
+_RAW_AGGREGATE = '''
+    SELECT movie_id, COUNT(rating), SUM(rating), SUM(rating * rating), MIN(rating), MAX(rating)
+    FROM {table}
+    WHERE rating IS NOT NULL{where}
+    GROUP BY movie_id
+'''
+
+_DAILY_AGGREGATE = '''
+    SELECT movie_id, SUM(rating_count), SUM(rating_sum), SUM(rating_sum_sq),
+           MIN(min_rating), MAX(max_rating)
+    FROM {table}
+    WHERE 1 = 1{where}
+    GROUP BY movie_id
+'''
+
+
+def _date_filter(since, until):
+    """SQL condition and parameters for a half-open [since, until) review_date window"""
+    where = ''
+    params = []
+    if since is not None:
+        where += ' AND review_date >= ?'
+        params.append(str(since))
+    if until is not None:
+        where += ' AND review_date < ?'
+        params.append(str(until))
+    return where, params
+
+
+def _has_triggers(conn):
+    placeholders = ', '.join('?' * len(_TRIGGER_NAMES))
+    row = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", _TRIGGER_NAMES
+    ).fetchone()
+    return row[0] == len(_TRIGGER_NAMES)
+
+
+def _install_triggers(conn):
+    """Create the dirty table and triggers; returns False when the triggers were missing"""
+    conn.execute(DIRTY_SQL)
+    present = _has_triggers(conn)
+    for trigger_sql in PARTITION_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+    return present
+
+
+def drop_rating_partitions(conn):
+    """Drop the partition catalog, dirty table and triggers; partition files are left on disk"""
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute('DROP TABLE IF EXISTS rating_partitions_dirty')
+    conn.execute('DROP TABLE IF EXISTS rating_partitions')
+
+
+def _uri(path, mode='rwc'):
+    return f'file:{pathname2url(os.path.abspath(path))}?mode={mode}'
+
+
+def _begin_window(conn):
+    conn.execute('''
+        CREATE TEMP TABLE window_parts (
+            movie_id INTEGER, rating_count INTEGER, rating_sum REAL,
+            rating_sum_sq REAL, min_rating REAL, max_rating REAL
+        )
+    ''')
+
+
+def _add_window_part(conn, sql, params):
+    """Store the per-movie partial aggregates returned by one SELECT"""
+    conn.execute('INSERT INTO temp.window_parts ' + sql, params)
+    conn.commit()
+
+
+def _end_window(conn):
+    """Merge the partial aggregates into a TEMP movie_rating_stats"""
+    conn.execute(WINDOW_STATS_SQL)
+    conn.execute('''
+        INSERT INTO temp.movie_rating_stats
+        SELECT movie_id, SUM(rating_count), SUM(rating_sum), SUM(rating_sum_sq),
+               MIN(min_rating), MAX(max_rating)
+        FROM temp.window_parts
+        GROUP BY movie_id
+        HAVING SUM(rating_count) > 0
+    ''')
+    conn.execute('DROP TABLE temp.window_parts')
+    conn.commit()
+
+
+def window_connection(db_path, since=None, until=None, factory=sqlite3.Connection):
+    """Connection whose movie_rating_stats covers only ratings in [since, until)
+
+    Unpartitioned fallback: aggregates the window straight from movie_ratings.
+    factory is the sqlite3.Connection class to open it with.
+    """
+    conn = sqlite3.connect(db_path, factory=factory)
+    # A compact database filters on integer day numbers, not the generated dates
+    where, params = day_filter(since, until) if is_compact_schema(conn) else _date_filter(since, until)
+    _begin_window(conn)
+    _add_window_part(conn, _RAW_AGGREGATE.format(table='main.movie_ratings', where=where), params)
+    _end_window(conn)
+    return conn
+
+
+class RatingPartitions:
+    """Copy of movie_ratings split into one SQLite file per month or year
+
+    movie_ratings stays the system of record; sync() appends ratings newer than
+    the last one copied, and recopies the partitions whose dates triggers on
+    movie_ratings marked as updated or deleted since. A catalog table in the main database records each partition's
+    date range, so window_connection() attaches only the files that overlap the
+    requested window. Partitions that are entirely in the past can be compacted
+    into read-only files of per-movie daily aggregates, which answer window
+    queries at day granularity without keeping the raw rows.
+    """
+
+    def __init__(self, db_path='movies.db', partition_dir='rating_partitions', granularity='month'):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        self.db_path = db_path
+        self.partition_dir = partition_dir
+        self.granularity = granularity
+
+    def _bounds(self, key):
+        """Start and (exclusive) end date of a partition key"""
+        if self.granularity == 'year':
+            return f'{key}-01-01', f'{int(key) + 1}-01-01'
+        year, month = map(int, key.split('-'))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return f'{key}-01', f'{year:04d}-{month:02d}-01'
+
+    def _path(self, file_name):
+        return os.path.join(self.partition_dir, file_name)
+
+    def catalog(self, since=None, until=None):
+        """Partitions overlapping [since, until), oldest first"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(CATALOG_SQL)
+            catalog = pd.read_sql_query('SELECT * FROM rating_partitions ORDER BY start_date', conn)
+        finally:
+            conn.close()
+        if since is not None:
+            catalog = catalog[catalog['end_date'] > str(since)]
+        if until is not None:
+            catalog = catalog[catalog['start_date'] < str(until)]
+        return catalog.reset_index(drop=True)
+
+    def build(self):
+        """Drop any existing partitions and copy every rating"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(CATALOG_SQL)
+            for (file_name,) in conn.execute('SELECT file_name FROM rating_partitions'):
+                path = self._path(file_name)
+                if os.path.exists(path):
+                    os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+                    os.remove(path)
+            conn.execute('DELETE FROM rating_partitions')
+            conn.execute(DIRTY_SQL)
+            conn.execute('DELETE FROM rating_partitions_dirty')
+            conn.commit()
+        finally:
+            conn.close()
+        return self.sync()
+
+    def sync(self, chunk_size=500000):
+        """Bring the partitions up to date with movie_ratings; returns rows copied
+
+        Partitions holding updated or deleted ratings are recopied from
+        movie_ratings, then ratings added since the last sync are appended.
+        Ratings without a review_date fall in no window and are not copied.
+        """
+        os.makedirs(self.partition_dir, exist_ok=True)
+        key_length = 4 if self.granularity == 'year' else 7
+        conn = sqlite3.connect(self.db_path)
+        opened = {}
+        copied = 0
+        try:
+            conn.execute(CATALOG_SQL)
+            catalog = {key: (file_name, bool(compacted)) for key, file_name, compacted in conn.execute(
+                'SELECT partition_key, file_name, compacted FROM rating_partitions')}
+            watermark = conn.execute(
+                'SELECT COALESCE(MAX(max_rating_id), 0) FROM rating_partitions').fetchone()[0]
+
+            # Without the triggers, changes since the partitions were built went unseen
+            dirty_dates = [row[0] for row in conn.execute('SELECT review_date FROM rating_partitions_dirty')] \
+                if _install_triggers(conn) else None
+            if dirty_dates is None:
+                dirty = set(catalog)
+            else:
+                dirty = {str(day)[:key_length] for day in dirty_dates if day is not None}
+            for key in sorted(dirty):
+                if key not in catalog:
+                    catalog[key] = self._register(conn, key)
+                opened[key] = self._open(*catalog[key])
+                copied += self._resync(conn, opened[key], key, catalog[key][1], watermark)
+            conn.execute('DELETE FROM rating_partitions_dirty')
+
+            chunks = pd.read_sql_query('''
+                SELECT rating_id, movie_id, user_id, rating, review_date
+                FROM movie_ratings
+                WHERE rating_id > ? AND review_date IS NOT NULL
+            ''', conn, params=(watermark,), chunksize=chunk_size)
+            for chunk in chunks:
+                chunk['review_date'] = chunk['review_date'].astype(str)
+                for key, rows in chunk.groupby(chunk['review_date'].str.slice(0, key_length)):
+                    if key not in opened:
+                        if key not in catalog:
+                            catalog[key] = self._register(conn, key)
+                        opened[key] = self._open(*catalog[key])
+                    self._append(opened[key], catalog[key][1], rows)
+                    copied += len(rows)
+
+                    conn.execute('''
+                        UPDATE rating_partitions
+                        SET row_count = row_count + ?, max_rating_id = MAX(max_rating_id, ?)
+                        WHERE partition_key = ?
+                    ''', (len(rows), int(rows['rating_id'].max()), key))
+
+            # Partition files are committed before the catalog that points at them
+            for part in opened.values():
+                part.commit()
+            conn.commit()
+        finally:
+            for key, part in opened.items():
+                part.close()
+                file_name, compacted = catalog[key]
+                if compacted:
+                    os.chmod(self._path(file_name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            conn.close()
+        return copied
+
+    def _register(self, conn, key):
+        start, end = self._bounds(key)
+        file_name = f'ratings_{key}.db'
+        # A file the catalog doesn't know about is left over from a dropped catalog
+        path = self._path(file_name)
+        if os.path.exists(path):
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+            os.remove(path)
+        conn.execute('''
+            INSERT INTO rating_partitions (partition_key, file_name, start_date, end_date)
+            VALUES (?, ?, ?, ?)
+        ''', (key, file_name, start, end))
+        return file_name, False
+
+    def _open(self, file_name, compacted):
+        path = self._path(file_name)
+        if compacted:
+            # Late ratings for a compacted period are merged into its daily aggregates
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+            return sqlite3.connect(path)
+        part = sqlite3.connect(path)
+        for sql in RAW_PARTITION_SQL:
+            part.execute(sql)
+        return part
+
+    def _append(self, part, compacted, rows):
+        if not compacted:
+            part.executemany('INSERT INTO movie_ratings VALUES (?, ?, ?, ?, ?)',
+                             rows.itertuples(index=False, name=None))
+            return
+        rated = rows.dropna(subset=['rating'])
+        daily = rated.assign(rating_sq=rated['rating'] ** 2).groupby(['movie_id', 'review_date']).agg(
+            rating_count=('rating', 'size'), rating_sum=('rating', 'sum'),
+            rating_sum_sq=('rating_sq', 'sum'), min_rating=('rating', 'min'),
+            max_rating=('rating', 'max'))
+        part.executemany('''
+            INSERT INTO daily_movie_ratings VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (movie_id, review_date) DO UPDATE SET
+                rating_count = rating_count + excluded.rating_count,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_sum_sq = rating_sum_sq + excluded.rating_sum_sq,
+                min_rating = MIN(min_rating, excluded.min_rating),
+                max_rating = MAX(max_rating, excluded.max_rating)
+        ''', daily.reset_index().itertuples(index=False, name=None))
+
+    def _resync(self, conn, part, key, compacted, watermark):
+        """Replace a partition's contents with movie_ratings rows up to the watermark; returns rows copied"""
+        start, end = self._bounds(key)
+        where, params = day_filter(start, end) if is_compact_schema(conn) else _date_filter(start, end)
+        params = [watermark] + params
+        if compacted:
+            part.execute('DELETE FROM daily_movie_ratings')
+            part.executemany('INSERT INTO daily_movie_ratings VALUES (?, ?, ?, ?, ?, ?, ?)', conn.execute(f'''
+                SELECT movie_id, review_date, COUNT(rating), SUM(rating),
+                       SUM(rating * rating), MIN(rating), MAX(rating)
+                FROM movie_ratings
+                WHERE rating IS NOT NULL AND rating_id <= ?{where}
+                GROUP BY movie_id, review_date
+            ''', params))
+        else:
+            part.execute('DELETE FROM movie_ratings')
+            part.executemany('INSERT INTO movie_ratings VALUES (?, ?, ?, ?, ?)', conn.execute(f'''
+                SELECT rating_id, movie_id, user_id, rating, review_date
+                FROM movie_ratings
+                WHERE rating_id <= ?{where}
+            ''', params))
+        row_count, max_rating_id = conn.execute(f'''
+            SELECT COUNT(*), COALESCE(MAX(rating_id), 0) FROM movie_ratings WHERE rating_id <= ?{where}
+        ''', params).fetchone()
+        conn.execute('UPDATE rating_partitions SET row_count = ?, max_rating_id = ? WHERE partition_key = ?',
+                     (row_count, max_rating_id, key))
+        return row_count
+
+    def compact(self, before):
+        """Replace raw partitions that end on or before `before` with read-only daily aggregates"""
+        compacted = []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(CATALOG_SQL)
+            candidates = conn.execute('''
+                SELECT partition_key, file_name FROM rating_partitions
+                WHERE compacted = 0 AND end_date <= ?
+                ORDER BY start_date
+            ''', (str(before),)).fetchall()
+            for key, file_name in candidates:
+                raw_path = self._path(file_name)
+                daily_name = f'ratings_{key}.daily.db'
+                daily_path = self._path(daily_name)
+                if os.path.exists(daily_path):
+                    os.chmod(daily_path, stat.S_IRUSR | stat.S_IWUSR)
+                    os.remove(daily_path)
+
+                part = sqlite3.connect(daily_path)
+                try:
+                    part.execute(COMPACTED_PARTITION_SQL)
+                    part.execute('ATTACH DATABASE ? AS raw', (raw_path,))
+                    part.execute('''
+                        INSERT INTO daily_movie_ratings
+                        SELECT movie_id, review_date, COUNT(rating), SUM(rating),
+                               SUM(rating * rating), MIN(rating), MAX(rating)
+                        FROM raw.movie_ratings
+                        WHERE rating IS NOT NULL
+                        GROUP BY movie_id, review_date
+                    ''')
+                    part.commit()
+                    part.execute('DETACH DATABASE raw')
+                    part.execute('VACUUM')
+                finally:
+                    part.close()
+                os.chmod(daily_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+                conn.execute('UPDATE rating_partitions SET file_name = ?, compacted = 1 WHERE partition_key = ?',
+                             (daily_name, key))
+                conn.commit()
+                os.remove(raw_path)
+                compacted.append(key)
+        finally:
+            conn.close()
+        return compacted
+
+    def window_connection(self, since=None, until=None, factory=sqlite3.Connection):
+        """Connection whose movie_rating_stats covers only ratings in [since, until)
+
+        Only the partitions overlapping the window are attached (a few at a
+        time, to stay under SQLite's attached-database limit), and the date
+        filter is skipped for partitions that lie entirely inside it.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            latest = conn.execute('SELECT MAX(rating_id) FROM movie_ratings').fetchone()[0] or 0
+            conn.execute(CATALOG_SQL)
+            watermark = conn.execute(
+                'SELECT COALESCE(MAX(max_rating_id), 0) FROM rating_partitions').fetchone()[0]
+            conn.execute(DIRTY_SQL)
+            changed = (not _has_triggers(conn) or
+                       conn.execute('SELECT EXISTS (SELECT 1 FROM rating_partitions_dirty)').fetchone()[0])
+        finally:
+            conn.close()
+        if latest > watermark or changed:
+            self.sync()
+
+        catalog = self.catalog(since, until)
+        conn = sqlite3.connect(_uri(self.db_path), uri=True, factory=factory)
+        _begin_window(conn)
+        for batch_start in range(0, len(catalog), MAX_ATTACHED):
+            batch = catalog.iloc[batch_start:batch_start + MAX_ATTACHED]
+            aliases = []
+            for i, partition in enumerate(batch.itertuples()):
+                alias = f'part{i}'
+                mode = 'ro' if partition.compacted else 'rw'
+                conn.execute(f'ATTACH DATABASE ? AS {alias}', (_uri(self._path(partition.file_name), mode),))
+                aliases.append(alias)
+
+                inside = ((since is None or partition.start_date >= str(since)) and
+                          (until is None or partition.end_date <= str(until)))
+                where, params = ('', []) if inside else _date_filter(since, until)
+                if partition.compacted:
+                    sql = _DAILY_AGGREGATE.format(table=f'{alias}.daily_movie_ratings', where=where)
+                else:
+                    sql = _RAW_AGGREGATE.format(table=f'{alias}.movie_ratings', where=where)
+                _add_window_part(conn, sql, params)
+            for alias in aliases:
+                conn.execute(f'DETACH DATABASE {alias}')
+        _end_window(conn)
+        return conn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Manage time-partitioned copies of movie_ratings')
+    parser.add_argument('command', choices=['build', 'sync', 'compact', 'list'])
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--dir', default='rating_partitions')
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='month')
+    parser.add_argument('--before', help='compact partitions ending on or before this date (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    partitions = RatingPartitions(args.db, args.dir, args.granularity)
+    start = time.perf_counter()
+    if args.command == 'build':
+        copied = partitions.build()
+        print(f"Copied {copied:,} ratings into {len(partitions.catalog())} partitions "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif args.command == 'sync':
+        print(f"Copied {partitions.sync():,} new or changed ratings in {time.perf_counter() - start:.2f}s")
+    elif args.command == 'compact':
+        if args.before is None:
+            parser.error('compact requires --before')
+        keys = partitions.compact(args.before)
+        print(f"Compacted {len(keys)} partitions in {time.perf_counter() - start:.2f}s")
+    else:
+        print(partitions.catalog().to_string(index=False))
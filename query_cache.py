@@ -0,0 +1,105 @@
+import hashlib
+import os
+from collections import OrderedDict
+import pandas as pd
+
+
+def database_fingerprint(db_path):
+    """Cheap token that changes whenever the database content changes
+
+    Uses the main file's mtime/size plus, in WAL mode, the WAL size and the
+    salt/checkpoint fields of its header (they change whenever the log is reset).
+    An empty or missing WAL contributes nothing, so merely opening the database
+    does not invalidate cached results.
+    """
+    stat = os.stat(db_path)
+    parts = [str(stat.st_mtime_ns), str(stat.st_size)]
+    wal_path = db_path + '-wal'
+    if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+        with open(wal_path, 'rb') as f:
+            header = f.read(32)
+        parts.append(str(os.path.getsize(wal_path)))
+        parts.append(header[12:24].hex())
+    return ':'.join(parts)
+
+
+class QueryCache:
+    """Two-level cache of query results: an in-memory LRU and Feather/Parquet files on disk"""
+
+    def __init__(self, cache_dir='.query_cache', max_memory_bytes=256 * 1024 * 1024,
+                 disk_format='feather', use_memory=True, use_disk=True):
+        if disk_format not in ('feather', 'parquet'):
+            raise ValueError("disk_format must be 'feather' or 'parquet'")
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_format = disk_format
+        self.use_memory = use_memory
+        self.use_disk = use_disk
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, db_path, query, params=()):
+        digest = hashlib.sha256()
+        for part in (query, repr(tuple(params)), database_fingerprint(db_path)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.{self.disk_format}')
+
+    def get(self, key):
+        """Return a copy of the cached DataFrame, or None on a miss"""
+        if self.use_memory and key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0].copy()
+
+        if self.use_disk and os.path.exists(self._path(key)):
+            if self.disk_format == 'feather':
+                df = pd.read_feather(self._path(key))
+            else:
+                df = pd.read_parquet(self._path(key))
+            self._remember(key, df)
+            self.hits += 1
+            return df.copy()
+
+        self.misses += 1
+        return None
+
+    def put(self, key, df):
+        self._remember(key, df.copy())
+        if self.use_disk:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary name first so readers never see a partial file
+            tmp_path = self._path(key) + f'.{os.getpid()}.tmp'
+            if self.disk_format == 'feather':
+                df.reset_index(drop=True).to_feather(tmp_path)
+            else:
+                df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key, df):
+        if not self.use_memory:
+            return
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_memory_bytes:
+            return
+        if key in self._entries:
+            self._memory_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (df, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def clear(self):
+        """Drop every cached result from memory and disk"""
+        self._entries.clear()
+        self._memory_bytes = 0
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(('.feather', '.parquet')):
+                    os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,244 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+# The SQLite progress handler fires every VM_STEP_INTERVAL virtual machine
+# instructions, so step counts are accurate to within one interval.
+VM_STEP_INTERVAL = 100
+
+DEFAULT_TRACE_PATH = 'profile_trace.json'
+
+_active = None
+
+
+def current():
+    """The profiler installed by profiling(), or None when profiling is off"""
+    return _active
+
+
+@contextmanager
+def span(name, category='app', **args):
+    """Time a block on the active profiler; a no-op when profiling is off"""
+    profiler = _active
+    if profiler is None:
+        yield None
+        return
+    with profiler.span(name, category, **args) as event:
+        yield event
+
+
+def profiled(method):
+    """Decorator recording each call of a method as a span named after it"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return method(*args, **kwargs)
+        with profiler.span(method.__name__, 'analysis'):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def annotate(**args):
+    """Attach values to the innermost open span of the active profiler"""
+    if _active is not None:
+        _active.annotate(**args)
+
+
+def timed_chunks(chunks, name):
+    """Yield from a chunk iterator, recording the time spent producing each chunk
+
+    Chunked results are computed while the caller iterates, after the method
+    that returned the iterator has finished, so its own span misses them.
+    """
+    chunks = iter(chunks)
+    while True:
+        profiler = _active
+        if profiler is None:
+            yield from chunks
+            return
+        with profiler.span(name, 'chunk') as args:
+            chunk = next(chunks, None)
+            args['rows'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class QueryProfiler:
+    """Collects timed spans and per-query statistics
+
+    Spans nest by time within a thread, so the recorded events form a call
+    tree: an analysis method, the execute/fetch/convert phases of its query,
+    report sections and chart renders. Timestamps come from perf_counter,
+    which is the system-wide monotonic clock on Linux, so events recorded in
+    chart worker processes line up with the parent's.
+    """
+
+    PHASES = [('execute', 'sql'), ('fetch', 'sql'), ('convert', 'pandas')]
+
+    def __init__(self):
+        self.events = []
+        self.queries = []
+        self._lock = threading.Lock()
+        self._open = threading.local()
+
+    def add_event(self, name, category, start, duration, args=None, pid=None, tid=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': duration * 1e6,
+            'pid': pid if pid is not None else os.getpid(),
+            'tid': tid if tid is not None else threading.get_ident(),
+            'args': args or {},
+        }
+        with self._lock:
+            self.events.append(event)
+        return event
+
+    def _open_spans(self):
+        if not hasattr(self._open, 'spans'):
+            self._open.spans = []
+        return self._open.spans
+
+    @contextmanager
+    def span(self, name, category='app', **args):
+        start = time.perf_counter()
+        args = dict(args)
+        spans = self._open_spans()
+        spans.append((name, args))
+        try:
+            yield args
+        finally:
+            spans.pop()
+            self.add_event(name, category, start, time.perf_counter() - start, args)
+
+    def annotate(self, **args):
+        spans = self._open_spans()
+        if spans:
+            spans[-1][1].update(args)
+
+    def profile_query(self, conn, query, params=(), label=None):
+        """Run a query as execute, fetch and convert phases and record its statistics
+
+        Returns the same DataFrame pd.read_sql_query would. The label defaults
+        to the innermost open span, normally the analysis method.
+        """
+        if label is None:
+            spans = self._open_spans()
+            label = spans[-1][0] if spans else 'query'
+
+        steps = [0]
+
+        def count_steps():
+            steps[0] += VM_STEP_INTERVAL
+            return 0
+
+        plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+        conn.set_progress_handler(count_steps, VM_STEP_INTERVAL)
+        try:
+            marks = [time.perf_counter()]
+            cursor = conn.execute(query, params)
+            marks.append(time.perf_counter())
+            rows = cursor.fetchall()
+            marks.append(time.perf_counter())
+        finally:
+            conn.set_progress_handler(None, 0)
+        columns = [column[0] for column in cursor.description]
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        marks.append(time.perf_counter())
+
+        stats = {'label': label, 'rows': len(df), 'vm_steps': steps[0]}
+        for (name, category), start, end in zip(self.PHASES, marks, marks[1:]):
+            self.add_event(name, category, start, end - start)
+            stats[f'{name}_ms'] = (end - start) * 1000
+        stats['plan'] = plan
+        with self._lock:
+            self.queries.append(stats)
+        return df
+
+    def summary(self):
+        """Per-span totals: calls, total and max milliseconds"""
+        if not self.events:
+            return pd.DataFrame(columns=['name', 'cat', 'calls', 'total_ms', 'max_ms'])
+        events = pd.DataFrame(self.events)
+        events['dur'] /= 1000
+        result = events.groupby(['name', 'cat'])['dur'].agg(calls='count', total_ms='sum', max_ms='max')
+        return result.sort_values('total_ms', ascending=False).reset_index()
+
+    def query_summary(self):
+        """One row per profiled query with its phase timings, rows and VM steps"""
+        return pd.DataFrame(self.queries, columns=['label', 'rows', 'vm_steps', 'execute_ms',
+                                                   'fetch_ms', 'convert_ms', 'plan'])
+
+    def write_trace(self, path):
+        """Write a Chrome trace (.json) or folded stacks for flamegraph.pl (any other extension)"""
+        if path.endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f, default=str)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, micros in self.folded_stacks().items():
+                    f.write(f"{stack} {round(micros)}\n")
+        return path
+
+    def folded_stacks(self):
+        """{'outer;inner': self time in microseconds} rebuilt from span nesting per thread"""
+        folded = {}
+        threads = {}
+        for event in self.events:
+            threads.setdefault((event['pid'], event['tid']), []).append(event)
+        for events in threads.values():
+            events.sort(key=lambda event: (event['ts'], -event['dur']))
+            stack = []
+            for event in events:
+                # A child starting on its predecessor's end mark must not nest in it
+                while stack and event['ts'] >= stack[-1][0]['ts'] + stack[-1][0]['dur'] - 0.01:
+                    stack.pop()
+                if stack:
+                    stack[-1][1] -= event['dur']
+                stack.append([event, event['dur']])
+                key = ';'.join(frame[0]['name'] for frame in stack)
+                folded.setdefault(key, [])
+                folded[key].append(stack[-1])
+        # Self time is only final once every child has been subtracted
+        return {key: sum(frame[1] for frame in frames) for key, frames in folded.items()}
+
+
+@contextmanager
+def profiling(trace_path=None):
+    """Install a QueryProfiler for the duration of the block
+
+    MovieAnalytics, the report and the charts record into it while it is
+    active. With trace_path the events are written out on exit.
+    """
+    global _active
+    previous, _active = _active, QueryProfiler()
+    profiler = _active
+    try:
+        yield profiler
+    finally:
+        _active = previous
+        if trace_path:
+            profiler.write_trace(trace_path)
+
+
+def print_profile(profiler):
+    """Print the span and query summaries"""
+    with pd.option_context('display.width', 200, 'display.max_colwidth', 80):
+        print("\nTime by span:")
+        print(profiler.summary().to_string(index=False))
+        queries = profiler.query_summary()
+        if not queries.empty:
+            print("\nQueries:")
+            print(queries.drop(columns='plan').to_string(index=False))
+            for label, plan in zip(queries['label'], queries['plan']):
+                print(f"\n{label} plan:")
+                for detail in plan:
+                    print(f"  {detail}")
@@ -0,0 +1,224 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+# Ratings are on a 1.0-10.0 scale at 0.1 resolution, so a movie's full rating
+# distribution fits in 91 counters. The histogram is exact, and merging two
+# histograms is element-wise addition, so it serves as the mergeable quantile
+# sketch for movies, genres and directors alike.
+MIN_RATING = 1.0
+RESOLUTION = 0.1
+NUM_BINS = 91
+BIN_VALUES = np.round(MIN_RATING + RESOLUTION * np.arange(NUM_BINS), 1)
+_DTYPE = np.dtype('<u4')
+
+HISTOGRAM_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS movie_rating_histograms (
+        movie_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL,
+        bins BLOB NOT NULL,
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    )
+'''
+
+# The ingest hook adds inserted ratings to the bins directly, and plain inserts
+# show up as a count that disagrees with movie_rating_stats. Updates and
+# deletes can leave the count unchanged, so triggers mark those movies dirty.
+# As in rating_stats.py, UPDATE OF names the stored column of the compact schema.
+DIRTY_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS movie_rating_histograms_dirty (movie_id INTEGER PRIMARY KEY)'
+
+HISTOGRAM_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_histograms_update
+    AFTER UPDATE OF movie_id, rating, rating_tenths ON movie_ratings
+    BEGIN
+        INSERT INTO movie_rating_histograms_dirty (movie_id) VALUES (OLD.movie_id), (NEW.movie_id)
+        ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_histograms_delete
+    AFTER DELETE ON movie_ratings
+    BEGIN
+        INSERT INTO movie_rating_histograms_dirty (movie_id) VALUES (OLD.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+]
+
+_TRIGGER_NAMES = ('movie_ratings_histograms_update', 'movie_ratings_histograms_delete')
+
+# Stay well below SQLite's host parameter limit
+_PARAMS_PER_QUERY = 500
+
+
+def rating_bins(ratings):
+    """Histogram bin of each rating; off-grid values go to the nearest 0.1"""
+    # floor(x + 0.5) rounds halves up, like SQLite's ROUND for positive values
+    bins = np.floor((np.asarray(ratings, dtype=np.float64) - MIN_RATING) / RESOLUTION + 0.5)
+    return np.clip(bins, 0, NUM_BINS - 1).astype(np.int64)
+
+
+def encode(counts):
+    return np.asarray(counts, dtype=_DTYPE).tobytes()
+
+
+def decode(blob):
+    return np.frombuffer(blob, dtype=_DTYPE).astype(np.int64)
+
+
+def create_rating_histograms(conn):
+    """Create movie_rating_histograms, fill it from movie_ratings and add its triggers"""
+    conn.execute(HISTOGRAM_TABLE_SQL)
+    conn.execute(DIRTY_TABLE_SQL)
+    refresh_rating_histograms(conn)
+    for trigger_sql in HISTOGRAM_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_rating_histograms(conn):
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute('DROP TABLE IF EXISTS movie_rating_histograms_dirty')
+    conn.execute('DROP TABLE IF EXISTS movie_rating_histograms')
+
+
+def has_rating_histograms(conn):
+    """Check whether the database already carries the histogram table and its triggers"""
+    row = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE (type = 'table' AND name = 'movie_rating_histograms_dirty') "
+        f"OR (type = 'trigger' AND name IN ({', '.join('?' * len(_TRIGGER_NAMES))}))", _TRIGGER_NAMES
+    ).fetchone()
+    return row[0] == len(_TRIGGER_NAMES) + 1
+
+
+def _write(conn, movie_ids, counts):
+    conn.executemany('''
+        INSERT INTO movie_rating_histograms (movie_id, rating_count, bins)
+        VALUES (?, ?, ?)
+        ON CONFLICT (movie_id) DO UPDATE SET
+            rating_count = excluded.rating_count,
+            bins = excluded.bins
+    ''', [(int(movie_id), int(row.sum()), encode(row)) for movie_id, row in zip(movie_ids, counts)])
+
+
+def _bin_counts(conn, where='', params=()):
+    """Per-movie histograms aggregated by SQLite: (movie ids, counts matrix)"""
+    rows = np.array(conn.execute(f'''
+        SELECT movie_id, CAST(ROUND((rating - {MIN_RATING}) / {RESOLUTION}) AS INTEGER), COUNT(*)
+        FROM movie_ratings
+        WHERE rating IS NOT NULL{where}
+        GROUP BY 1, 2
+    ''', params).fetchall(), dtype=np.int64).reshape(-1, 3)
+    movie_ids, rows_index = np.unique(rows[:, 0], return_inverse=True)
+    counts = np.zeros((len(movie_ids), NUM_BINS), dtype=np.int64)
+    np.add.at(counts, (rows_index, np.clip(rows[:, 1], 0, NUM_BINS - 1)), rows[:, 2])
+    return movie_ids, counts
+
+
+def refresh_rating_histograms(conn, movie_ids=None):
+    """Rebuild histograms for all movies, or only for the given movie ids"""
+    conn.execute(HISTOGRAM_TABLE_SQL)
+    conn.execute(DIRTY_TABLE_SQL)
+    if movie_ids is None:
+        conn.execute('DELETE FROM movie_rating_histograms')
+        conn.execute('DELETE FROM movie_rating_histograms_dirty')
+        _write(conn, *_bin_counts(conn))
+        return
+
+    movie_ids = [int(movie_id) for movie_id in movie_ids]
+    for start in range(0, len(movie_ids), _PARAMS_PER_QUERY):
+        chunk = movie_ids[start:start + _PARAMS_PER_QUERY]
+        placeholders = ', '.join('?' * len(chunk))
+        conn.execute(f'DELETE FROM movie_rating_histograms WHERE movie_id IN ({placeholders})', chunk)
+        conn.execute(f'DELETE FROM movie_rating_histograms_dirty WHERE movie_id IN ({placeholders})', chunk)
+        _write(conn, *_bin_counts(conn, f' AND movie_id IN ({placeholders})', chunk))
+
+
+def update_rating_histograms(conn, batch):
+    """RatingIngestor batch hook: add (rating_id, movie_id, user_id, rating, review_date) rows"""
+    if not batch:
+        return
+    movie_ids = np.array([row[1] for row in batch], dtype=np.int64)
+    bins = rating_bins([row[3] for row in batch])
+    touched, rows_index = np.unique(movie_ids, return_inverse=True)
+    counts = np.zeros((len(touched), NUM_BINS), dtype=np.int64)
+    np.add.at(counts, (rows_index, bins), 1)
+
+    position = {movie_id: i for i, movie_id in enumerate(touched.tolist())}
+    ids = touched.tolist()
+    for start in range(0, len(ids), _PARAMS_PER_QUERY):
+        chunk = ids[start:start + _PARAMS_PER_QUERY]
+        placeholders = ', '.join('?' * len(chunk))
+        for movie_id, blob in conn.execute(
+                f'SELECT movie_id, bins FROM movie_rating_histograms WHERE movie_id IN ({placeholders})', chunk):
+            counts[position[movie_id]] += decode(blob)
+    _write(conn, touched, counts)
+
+
+def stale_movies(conn):
+    """Movies with updated or deleted ratings, or whose histogram total disagrees with movie_rating_stats"""
+    return [row[0] for row in conn.execute('''
+        SELECT movie_id FROM movie_rating_histograms_dirty
+        UNION
+        SELECT s.movie_id FROM movie_rating_stats s
+        LEFT JOIN movie_rating_histograms h ON h.movie_id = s.movie_id
+        WHERE h.rating_count IS NOT s.rating_count
+        UNION
+        SELECT h.movie_id FROM movie_rating_histograms h
+        LEFT JOIN movie_rating_stats s ON s.movie_id = h.movie_id
+        WHERE s.movie_id IS NULL AND h.rating_count > 0
+    ''')]
+
+
+def load_rating_histograms(conn):
+    """All stored histograms as (movie ids, counts matrix)"""
+    rows = conn.execute('SELECT movie_id, bins FROM movie_rating_histograms ORDER BY movie_id').fetchall()
+    movie_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    blob = b''.join(row[1] for row in rows)
+    counts = np.frombuffer(blob, dtype=_DTYPE).astype(np.int64).reshape(len(rows), NUM_BINS)
+    return movie_ids, counts
+
+
+def rollup(keys, counts):
+    """Merge histograms that share a key: (unique keys, summed counts)"""
+    codes, uniques = pd.factorize(pd.Series(keys), sort=True)
+    merged = np.zeros((len(uniques), NUM_BINS), dtype=np.int64)
+    np.add.at(merged, codes, counts)
+    return uniques, merged
+
+
+def quantiles(counts, levels=(0.5, 0.9)):
+    """Rating at each quantile level for every histogram row (lower nearest rank)"""
+    counts = np.atleast_2d(counts)
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1:]
+    result = np.full((len(counts), len(levels)), np.nan)
+    for i, level in enumerate(levels):
+        rank = np.maximum(np.ceil(level * totals), 1)
+        index = (cumulative < rank).sum(axis=1)
+        result[:, i] = np.where(totals[:, 0] > 0, BIN_VALUES[np.minimum(index, NUM_BINS - 1)], np.nan)
+    return result
+
+
+def means(counts):
+    counts = np.atleast_2d(counts)
+    totals = counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts @ BIN_VALUES / totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build per-movie rating histograms')
+    parser.add_argument('--db', default='movies.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    with conn:
+        create_rating_histograms(conn)
+    movie_ids, counts = load_rating_histograms(conn)
+    conn.close()
+    print(f"Built {len(movie_ids):,} histograms from {counts.sum():,} ratings "
+          f"in {time.perf_counter() - start:.2f}s")
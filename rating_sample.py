@@ -0,0 +1,275 @@
+import sqlite3
+from connection_pool import add_math_functions
+
+# Per-movie bottom-k sample of movie_ratings. Every rating gets a uniform random
+# priority and each movie keeps the k ratings with the smallest priorities, which
+# is a uniform sample without replacement that can be maintained one insert at a
+# time. The sample size depends on the number of movies, not on the number of
+# ratings, so approximate analytics cost the same at 1M or 1B ratings.
+#
+# Once a movie has overflowed, rating_sample_cutoffs keeps the priority of the
+# last rating evicted, and the sample is exactly the movie's ratings below that
+# cutoff. Deletes shrink the sample without raising the cutoff, so later
+# ratings must still beat it, and the cutoff is each sampled rating's
+# inclusion probability.
+DEFAULT_PER_MOVIE = 32
+
+# Normal quantile for the 95% confidence intervals
+Z_95 = 1.96
+
+SAMPLE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS rating_sample (
+        movie_id INTEGER NOT NULL,
+        priority REAL NOT NULL,
+        rating_id INTEGER NOT NULL,
+        rating REAL NOT NULL,
+        review_date DATE,
+        PRIMARY KEY (movie_id, priority)
+    ) WITHOUT ROWID
+'''
+
+SETTINGS_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS rating_sample_settings (per_movie INTEGER NOT NULL)'
+
+CUTOFFS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS rating_sample_cutoffs (
+        movie_id INTEGER PRIMARY KEY,
+        cutoff REAL NOT NULL
+    )
+'''
+
+_PRIORITY = '((random() & 4503599627370495) / 4503599627370496.0)'
+
+_TRIGGER_NAMES = ('insert', 'delete', 'update')
+
+
+def _admit_sql(per_movie, condition='1'):
+    """Trigger statements offering NEW as a fresh rating to its movie's sample
+
+    It enters below the movie's cutoff; a sample over per_movie evicts its
+    largest priority, which becomes the new cutoff.
+    """
+    return f'''
+            INSERT OR IGNORE INTO rating_sample (movie_id, priority, rating_id, rating, review_date)
+            SELECT NEW.movie_id, priority, NEW.rating_id, NEW.rating, NEW.review_date
+            FROM (SELECT {_PRIORITY} as priority)
+            WHERE {condition}
+              AND priority < COALESCE((SELECT cutoff FROM rating_sample_cutoffs
+                                       WHERE movie_id = NEW.movie_id), 1.0);
+            INSERT INTO rating_sample_cutoffs (movie_id, cutoff)
+            SELECT movie_id, MAX(priority) FROM rating_sample
+            WHERE movie_id = NEW.movie_id
+            GROUP BY movie_id HAVING COUNT(*) > {per_movie}
+            ON CONFLICT (movie_id) DO UPDATE SET cutoff = excluded.cutoff;
+            DELETE FROM rating_sample
+            WHERE movie_id = NEW.movie_id
+              AND priority >= (SELECT cutoff FROM rating_sample_cutoffs WHERE movie_id = NEW.movie_id);
+    '''
+
+
+def sample_triggers_sql(per_movie=DEFAULT_PER_MOVIE):
+    """Triggers that keep rating_sample current as movie_ratings changes
+
+    A rating moved to another movie, or given a rating after being NULL, is
+    offered to the sample like a new one. The update trigger also names the
+    stored columns of the compact schema.
+    """
+    readmit = _admit_sql(per_movie, '(NEW.movie_id != OLD.movie_id OR OLD.rating IS NULL) '
+                                    'AND NEW.rating IS NOT NULL')
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movie_ratings_sample_insert
+        AFTER INSERT ON movie_ratings
+        WHEN NEW.rating IS NOT NULL
+        BEGIN{_admit_sql(per_movie)}
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS movie_ratings_sample_delete
+        AFTER DELETE ON movie_ratings
+        BEGIN
+            DELETE FROM rating_sample WHERE movie_id = OLD.movie_id AND rating_id = OLD.rating_id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movie_ratings_sample_update
+        AFTER UPDATE OF movie_id, rating, rating_tenths, review_date, review_day ON movie_ratings
+        BEGIN
+            UPDATE rating_sample SET rating = NEW.rating, review_date = NEW.review_date
+            WHERE movie_id = OLD.movie_id AND rating_id = OLD.rating_id
+              AND NEW.movie_id = OLD.movie_id AND NEW.rating IS NOT NULL;
+            DELETE FROM rating_sample
+            WHERE movie_id = OLD.movie_id AND rating_id = OLD.rating_id
+              AND (NEW.movie_id != OLD.movie_id OR NEW.rating IS NULL);{readmit}
+        END
+        ''',
+    ]
+
+
+def create_rating_sample(conn, per_movie=DEFAULT_PER_MOVIE):
+    """Build rating_sample from movie_ratings and install its maintenance triggers"""
+    drop_rating_sample(conn)
+    conn.execute(SAMPLE_TABLE_SQL)
+    conn.execute(SETTINGS_TABLE_SQL)
+    conn.execute(CUTOFFS_TABLE_SQL)
+    conn.execute('INSERT INTO rating_sample_settings (per_movie) VALUES (?)', (per_movie,))
+    conn.execute(f'''
+        WITH prioritized AS MATERIALIZED (
+            SELECT movie_id, rating_id, rating, review_date, {_PRIORITY} as priority
+            FROM movie_ratings
+            WHERE rating IS NOT NULL
+        )
+        INSERT OR IGNORE INTO rating_sample (movie_id, priority, rating_id, rating, review_date)
+        SELECT movie_id, priority, rating_id, rating, review_date
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY movie_id ORDER BY priority) as position
+            FROM prioritized
+        )
+        WHERE position <= ?
+    ''', (per_movie + 1,))
+    # The (k + 1)-th smallest priority of a larger movie is its cutoff
+    conn.execute('''
+        INSERT INTO rating_sample_cutoffs (movie_id, cutoff)
+        SELECT movie_id, MAX(priority) FROM rating_sample
+        GROUP BY movie_id HAVING COUNT(*) > ?
+    ''', (per_movie,))
+    conn.execute('''
+        DELETE FROM rating_sample
+        WHERE priority >= (SELECT cutoff FROM rating_sample_cutoffs c
+                           WHERE c.movie_id = rating_sample.movie_id)
+    ''')
+    for trigger_sql in sample_triggers_sql(per_movie):
+        conn.execute(trigger_sql)
+
+
+def drop_rating_sample(conn):
+    """Drop the rating_sample table and its triggers"""
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS movie_ratings_sample_{name}')
+    conn.execute('DROP TABLE IF EXISTS rating_sample')
+    conn.execute('DROP TABLE IF EXISTS rating_sample_settings')
+    conn.execute('DROP TABLE IF EXISTS rating_sample_cutoffs')
+
+
+def has_rating_sample(conn):
+    """Check whether the database already carries the sample and its cutoffs
+
+    Samples built before the cutoffs were kept are rebuilt once.
+    """
+    row = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+        "AND name IN ('rating_sample', 'rating_sample_cutoffs')"
+    ).fetchone()
+    return row[0] == 2
+
+
+# Estimates per movie from the sample. The sampled ratings are those with a
+# priority below a threshold q: the (k + 1)-th smallest sampled priority when
+# only the first k of the sample are used, else the movie's cutoff. Every
+# rating falls below q with probability q, so q is the sampling fraction used
+# to scale window counts and sums; a movie that never overflowed has q = 1 and
+# is exact. Variances include the finite population correction (1 - q); with a
+# single sampled rating they fall back to the largest variance on the 1-10 scale.
+# They are also scaled by (t / z)^2, using the first-order expansion of the
+# Student t quantile, so z = 1.96 intervals stay close to 95% for small samples.
+_APPROXIMATE_STATS_SQL = '''
+    CREATE TEMP TABLE movie_rating_stats AS
+    WITH thresholds AS MATERIALIZED (
+        SELECT st.movie_id,
+               COALESCE((SELECT priority FROM rating_sample r
+                         WHERE r.movie_id = st.movie_id
+                         ORDER BY priority LIMIT 1 OFFSET :per_movie),
+                        (SELECT cutoff FROM rating_sample_cutoffs c WHERE c.movie_id = st.movie_id),
+                        1.0) as threshold
+        FROM main.movie_rating_stats st
+    ),
+    sampled AS (
+        SELECT r.movie_id,
+               MAX(t.threshold) as q,
+               SUM(r.in_window) as n,
+               SUM(CASE WHEN r.in_window THEN r.rating END) as total,
+               SUM(CASE WHEN r.in_window THEN r.rating * r.rating END) as total_sq,
+               MIN(CASE WHEN r.in_window THEN r.rating END) as low,
+               MAX(CASE WHEN r.in_window THEN r.rating END) as high
+        FROM thresholds t
+        JOIN (SELECT *, {in_window} as in_window FROM rating_sample) r ON r.movie_id = t.movie_id
+        WHERE r.priority < t.threshold
+        GROUP BY r.movie_id
+    )
+    SELECT movie_id,
+           n / q as rating_count,
+           total / q as rating_sum,
+           total_sq / q as rating_sum_sq,
+           low as min_rating,
+           high as max_rating,
+           (1.0 - q) * (CASE WHEN n > 1 THEN (total_sq - total * total / n) / (n - 1) ELSE 20.25 END) / n
+               * t_factor * t_factor as mean_var,
+           (1.0 - q) * n / (q * q) * t_factor * t_factor as count_var
+    FROM (SELECT *, 1.0 + 4.8416 / (4.0 * MAX(n - 1, 1)) as t_factor FROM sampled)
+    WHERE n > 0
+'''
+
+
+def approximate_connection(db_path, sample_fraction=1.0, since=None, until=None, factory=sqlite3.Connection):
+    """Connection whose movie_rating_stats holds sample estimates
+
+    sample_fraction uses only that share of each movie's sample (at least two
+    ratings). The TEMP table shadows main.movie_rating_stats, so the analytics
+    queries run unchanged; it adds mean_var and count_var columns for
+    confidence intervals. The sample is built on first use.
+    """
+    conn = add_math_functions(sqlite3.connect(db_path, factory=factory))
+    if not has_rating_sample(conn):
+        with conn:
+            create_rating_sample(conn)
+
+    per_movie = conn.execute('SELECT per_movie FROM rating_sample_settings').fetchone()[0]
+    conditions = []
+    params = {'per_movie': max(2, round(per_movie * sample_fraction))}
+    if since is not None:
+        conditions.append('review_date >= :since')
+        params['since'] = str(since)
+    if until is not None:
+        conditions.append('review_date < :until')
+        params['until'] = str(until)
+    in_window = ' AND '.join(conditions) or '1'
+    conn.execute(_APPROXIMATE_STATS_SQL.format(in_window=f'({in_window})'), params)
+    return conn
+
+
+def _category_index(value):
+    return f'(({value}) >= 6.0) + (({value}) >= 7.0) + (({value}) >= 8.0)'
+
+
+_AVG = 's.rating_sum / s.rating_count'
+_AVG_CI = f'{Z_95} * SQRT(s.mean_var)'
+
+# Confidence interval half-widths added to each SQL analysis in approximate mode
+ERROR_COLUMNS = {
+    'genre_popularity_analysis': [
+        f'{Z_95} * SQRT(SUM(s.mean_var)) / COUNT(*) as avg_genre_rating_ci',
+    ],
+    'director_performance_metrics': [
+        f'{Z_95} * SQRT(SUM(s.mean_var)) / COUNT(m.movie_id) as avg_director_rating_ci',
+    ],
+    'rating_distribution_analysis': [
+        f'{_AVG_CI} as avg_rating_ci',
+        f'{Z_95} * SQRT(s.count_var) as total_ratings_ci',
+        # 1 when the whole interval falls in the same rating_category bucket
+        f'{_category_index(f"{_AVG} - {_AVG_CI}")} = {_category_index(f"{_AVG} + {_AVG_CI}")}'
+        ' as rating_category_certain',
+    ],
+    'seasonal_release_patterns': [
+        f'{Z_95} * SQRT(SUM(s.mean_var)) / COUNT(*) as avg_rating_ci',
+    ],
+    'budget_vs_rating_correlation': [
+        f'{_AVG_CI} as avg_rating_ci',
+        f'{Z_95} * SQRT(s.count_var) as rating_count_ci',
+    ],
+}
+
+
+def with_error_columns(method, query):
+    """Add the approximate-mode confidence interval columns to an analysis query"""
+    select, separator, rest = query.partition('\n    FROM ')
+    columns = ''.join(f',\n        {column}' for column in ERROR_COLUMNS[method])
+    return select.rstrip() + columns + separator + rest
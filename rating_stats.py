@@ -0,0 +1,149 @@
+import sqlite3
+
+# Per-movie rating aggregates shared by every analytics query. Averages and
+# variances are derived from count/sum/sum of squares, so the table can be
+# kept current row by row instead of re-aggregating movie_ratings.
+STATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS movie_rating_stats (
+        movie_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        rating_sum_sq REAL NOT NULL,
+        min_rating REAL,
+        max_rating REAL,
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    )
+'''
+
+# Adding a rating is a plain upsert; removing one decrements the sums and only
+# goes back to movie_ratings when the removed value was the current min or max.
+_ADD_RATING = '''
+    INSERT INTO movie_rating_stats
+        (movie_id, rating_count, rating_sum, rating_sum_sq, min_rating, max_rating)
+    VALUES (NEW.movie_id, 1, NEW.rating, NEW.rating * NEW.rating, NEW.rating, NEW.rating)
+    ON CONFLICT (movie_id) DO UPDATE SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_sq = rating_sum_sq + excluded.rating_sum_sq,
+        min_rating = MIN(min_rating, excluded.min_rating),
+        max_rating = MAX(max_rating, excluded.max_rating);
+'''
+
+_REMOVE_RATING = '''
+    UPDATE movie_rating_stats SET
+        rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        rating_sum_sq = rating_sum_sq - OLD.rating * OLD.rating
+    WHERE movie_id = OLD.movie_id;
+    DELETE FROM movie_rating_stats
+    WHERE movie_id = OLD.movie_id AND rating_count <= 0;
+    UPDATE movie_rating_stats SET
+        min_rating = (SELECT MIN(rating) FROM movie_ratings WHERE movie_id = OLD.movie_id),
+        max_rating = (SELECT MAX(rating) FROM movie_ratings WHERE movie_id = OLD.movie_id)
+    WHERE movie_id = OLD.movie_id
+      AND (OLD.rating <= min_rating OR OLD.rating >= max_rating);
+'''
+
+# rating_tenths is the stored rating column of a compact database (compact_schema.py)
+STATS_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_stats_insert
+    AFTER INSERT ON movie_ratings
+    WHEN NEW.rating IS NOT NULL
+    BEGIN
+        {_ADD_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_stats_delete
+    AFTER DELETE ON movie_ratings
+    WHEN OLD.rating IS NOT NULL
+    BEGIN
+        {_REMOVE_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_stats_update_old
+    AFTER UPDATE OF movie_id, rating, rating_tenths ON movie_ratings
+    WHEN OLD.rating IS NOT NULL
+    BEGIN
+        {_REMOVE_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_stats_update_new
+    AFTER UPDATE OF movie_id, rating, rating_tenths ON movie_ratings
+    WHEN NEW.rating IS NOT NULL
+    BEGIN
+        {_ADD_RATING}
+    END
+    ''',
+]
+
+_AGGREGATE_SELECT = '''
+    SELECT
+        movie_id,
+        COUNT(rating),
+        SUM(rating),
+        SUM(rating * rating),
+        MIN(rating),
+        MAX(rating)
+    FROM movie_ratings
+    WHERE rating IS NOT NULL
+'''
+
+
+def create_rating_stats(conn):
+    """Create the movie_rating_stats table and its maintenance triggers"""
+    conn.execute(STATS_TABLE_SQL)
+    refresh_rating_stats(conn)
+    for trigger_sql in STATS_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_rating_stats(conn):
+    """Drop the movie_rating_stats table and its triggers"""
+    for name in ('insert', 'delete', 'update_old', 'update_new'):
+        conn.execute(f'DROP TRIGGER IF EXISTS movie_ratings_stats_{name}')
+    conn.execute('DROP TABLE IF EXISTS movie_rating_stats')
+
+
+def refresh_rating_stats(conn, movie_ids=None):
+    """Rebuild aggregates for all movies, or only for the given movie ids"""
+    conn.execute(STATS_TABLE_SQL)
+    if movie_ids is None:
+        conn.execute('DELETE FROM movie_rating_stats')
+        conn.execute(f'''
+            INSERT INTO movie_rating_stats
+                (movie_id, rating_count, rating_sum, rating_sum_sq, min_rating, max_rating)
+            {_AGGREGATE_SELECT}
+            GROUP BY movie_id
+        ''')
+        return
+
+    params = [(movie_id,) for movie_id in movie_ids]
+    conn.executemany('DELETE FROM movie_rating_stats WHERE movie_id = ?', params)
+    conn.executemany(f'''
+        INSERT INTO movie_rating_stats
+            (movie_id, rating_count, rating_sum, rating_sum_sq, min_rating, max_rating)
+        {_AGGREGATE_SELECT}
+          AND movie_id = ?
+        GROUP BY movie_id
+    ''', params)
+
+
+def has_rating_stats(conn):
+    """Check whether the database already carries the aggregate table"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie_rating_stats'"
+    ).fetchone()
+    return row is not None
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect('movies.db')
+    with conn:
+        create_rating_stats(conn)
+    count = conn.execute('SELECT COUNT(*) FROM movie_rating_stats').fetchone()[0]
+    conn.close()
+    print(f"Rating aggregates refreshed for {count} movies")
@@ -0,0 +1,387 @@
+import argparse
+import sqlite3
+import time
+from compact_schema import TO_DAY, day_number
+
+GRANULARITIES = ('day', 'week')
+
+# Rolling windows and the comparison periods are measured in days
+DEFAULT_WINDOW = 28
+
+# Year-over-year compares with 52 weeks earlier, so weekdays and week buckets line up
+YEAR_DAYS = 364
+
+# Series span this many days unless a since date is given, so a query reads
+# the same number of buckets however long the history is
+DEFAULT_HISTORY = 365
+
+# Ratings per movie and per genre per review day. Buckets are keyed by day
+# number (days since 1970-01-01), so window frames can use RANGE offsets in
+# days; rolling means are pooled from the sums rather than averaged averages.
+MOVIE_DAYS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS movie_rating_days (
+        movie_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        rating_sum_sq REAL NOT NULL,
+        PRIMARY KEY (movie_id, day)
+    ) WITHOUT ROWID
+'''
+
+GENRE_DAYS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS genre_rating_days (
+        genre TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        rating_sum_sq REAL NOT NULL,
+        PRIMARY KEY (genre, day)
+    ) WITHOUT ROWID
+'''
+
+# Cross-series queries (trending, all genres) read one date range of these
+TREND_INDEXES_SQL = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_movie_rating_days_day
+    ON movie_rating_days (day, movie_id, rating_count, rating_sum)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_genre_rating_days_day
+    ON genre_rating_days (day, genre, rating_count, rating_sum)
+    ''',
+]
+
+_DAY = {value: TO_DAY.format(value=f'{value}.review_date') for value in ('NEW', 'OLD')}
+
+_ADD_RATING = f'''
+    INSERT INTO movie_rating_days (movie_id, day, rating_count, rating_sum, rating_sum_sq)
+    VALUES (NEW.movie_id, {_DAY['NEW']}, 1, NEW.rating, NEW.rating * NEW.rating)
+    ON CONFLICT (movie_id, day) DO UPDATE SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_sq = rating_sum_sq + excluded.rating_sum_sq;
+    INSERT INTO genre_rating_days (genre, day, rating_count, rating_sum, rating_sum_sq)
+    SELECT genre, {_DAY['NEW']}, 1, NEW.rating, NEW.rating * NEW.rating
+    FROM movies WHERE movie_id = NEW.movie_id AND genre IS NOT NULL
+    ON CONFLICT (genre, day) DO UPDATE SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_sq = rating_sum_sq + excluded.rating_sum_sq;
+'''
+
+_REMOVE_RATING = f'''
+    UPDATE movie_rating_days SET
+        rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        rating_sum_sq = rating_sum_sq - OLD.rating * OLD.rating
+    WHERE movie_id = OLD.movie_id AND day = {_DAY['OLD']};
+    DELETE FROM movie_rating_days
+    WHERE movie_id = OLD.movie_id AND day = {_DAY['OLD']} AND rating_count <= 0;
+    UPDATE genre_rating_days SET
+        rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        rating_sum_sq = rating_sum_sq - OLD.rating * OLD.rating
+    WHERE genre = (SELECT genre FROM movies WHERE movie_id = OLD.movie_id) AND day = {_DAY['OLD']};
+    DELETE FROM genre_rating_days
+    WHERE genre = (SELECT genre FROM movies WHERE movie_id = OLD.movie_id) AND day = {_DAY['OLD']}
+      AND rating_count <= 0;
+'''
+
+# Moves a movie's buckets into or out of a genre series; sign is 1 or -1
+_SHIFT_GENRE = '''
+    INSERT INTO genre_rating_days (genre, day, rating_count, rating_sum, rating_sum_sq)
+    SELECT {genre}, day, {sign} * rating_count, {sign} * rating_sum, {sign} * rating_sum_sq
+    FROM movie_rating_days WHERE movie_id = {movie} AND {genre} IS NOT NULL
+    ON CONFLICT (genre, day) DO UPDATE SET
+        rating_count = rating_count + excluded.rating_count,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_sq = rating_sum_sq + excluded.rating_sum_sq;
+    DELETE FROM genre_rating_days WHERE genre = {genre} AND rating_count <= 0;
+'''
+
+# As in rating_stats.py, UPDATE OF lists also name the stored columns of the
+# compact schema (compact_schema.py)
+TREND_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_trends_insert
+    AFTER INSERT ON movie_ratings
+    WHEN NEW.rating IS NOT NULL AND julianday(NEW.review_date) IS NOT NULL
+    BEGIN
+        {_ADD_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_trends_delete
+    AFTER DELETE ON movie_ratings
+    WHEN OLD.rating IS NOT NULL AND julianday(OLD.review_date) IS NOT NULL
+    BEGIN
+        {_REMOVE_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_trends_update_old
+    AFTER UPDATE OF movie_id, rating, rating_tenths, review_date, review_day ON movie_ratings
+    WHEN OLD.rating IS NOT NULL AND julianday(OLD.review_date) IS NOT NULL
+    BEGIN
+        {_REMOVE_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_trends_update_new
+    AFTER UPDATE OF movie_id, rating, rating_tenths, review_date, review_day ON movie_ratings
+    WHEN NEW.rating IS NOT NULL AND julianday(NEW.review_date) IS NOT NULL
+    BEGIN
+        {_ADD_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movies_trends_genre_update
+    AFTER UPDATE OF genre, genre_id ON movies
+    WHEN OLD.genre IS NOT NEW.genre
+    BEGIN
+        {_SHIFT_GENRE.format(genre='OLD.genre', sign=-1, movie='OLD.movie_id')}
+        {_SHIFT_GENRE.format(genre='NEW.genre', sign=1, movie='NEW.movie_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movies_trends_delete
+    AFTER DELETE ON movies
+    BEGIN
+        {_SHIFT_GENRE.format(genre='OLD.genre', sign=-1, movie='OLD.movie_id')}
+    END
+    ''',
+]
+
+_TRIGGER_NAMES = ('movie_ratings_trends_insert', 'movie_ratings_trends_delete',
+                  'movie_ratings_trends_update_old', 'movie_ratings_trends_update_new',
+                  'movies_trends_genre_update', 'movies_trends_delete')
+
+# Week buckets start on Mondays (day 0, 1970-01-01, was a Thursday)
+_BUCKETS = {'day': 'day', 'week': 'day - (day + 3) % 7'}
+
+# Rolling mean over the window ending at each bucket, the window before it
+# (momentum) and the same window 52 weeks earlier (year over year). Parameters:
+# series filter, read range, the six frame offsets, then the first bucket shown.
+_TREND_QUERY = """
+    WITH buckets AS (
+        SELECT {key} as series, {bucket} as day,
+               SUM(rating_count) as rating_count, SUM(rating_sum) as rating_sum
+        FROM {table}
+        WHERE {series_filter}day >= ? AND day < ?
+        GROUP BY 1, 2
+    ),
+    rolling AS (
+        SELECT
+            series,
+            day,
+            rating_count,
+            rating_sum / rating_count as avg_rating,
+            SUM(rating_count) OVER recent as rolling_count,
+            SUM(rating_sum) OVER recent / SUM(rating_count) OVER recent as rolling_mean,
+            SUM(rating_sum) OVER previous / SUM(rating_count) OVER previous as previous_mean,
+            SUM(rating_sum) OVER last_year / SUM(rating_count) OVER last_year as last_year_mean
+        FROM buckets
+        WINDOW
+            recent AS (PARTITION BY series ORDER BY day RANGE BETWEEN ? PRECEDING AND CURRENT ROW),
+            previous AS (PARTITION BY series ORDER BY day RANGE BETWEEN ? PRECEDING AND ? PRECEDING),
+            last_year AS (PARTITION BY series ORDER BY day RANGE BETWEEN ? PRECEDING AND ? PRECEDING)
+    )
+    SELECT
+        series as {key},
+        date(day + 2440587.5) as period_start,
+        rating_count,
+        avg_rating,
+        rolling_count,
+        rolling_mean,
+        rolling_mean - previous_mean as momentum,
+        rolling_mean - last_year_mean as yoy_change
+    FROM rolling
+    WHERE day >= ?
+    ORDER BY series, day
+    """
+
+# Movies whose mean rating over the last window days rose the most against
+# the window before. Reads two windows of the day index, whatever the history.
+TRENDING_MOVIES_QUERY = """
+    WITH periods AS (
+        SELECT
+            movie_id,
+            TOTAL(CASE WHEN day >= ? THEN rating_count END) as recent_count,
+            TOTAL(CASE WHEN day >= ? THEN rating_sum END) as recent_sum,
+            TOTAL(CASE WHEN day < ? THEN rating_count END) as previous_count,
+            TOTAL(CASE WHEN day < ? THEN rating_sum END) as previous_sum
+        FROM movie_rating_days
+        WHERE day >= ? AND day < ?
+        GROUP BY movie_id
+    ),
+    scored AS (
+        SELECT
+            movie_id,
+            CAST(recent_count AS INTEGER) as recent_count,
+            recent_sum / recent_count as recent_mean,
+            previous_sum / previous_count as previous_mean,
+            recent_sum / recent_count - previous_sum / previous_count as momentum
+        FROM periods
+        WHERE recent_count >= ? AND previous_count >= ?
+    )
+    SELECT
+        RANK() OVER (ORDER BY s.momentum DESC) as trend_rank,
+        s.movie_id,
+        m.title,
+        m.genre,
+        s.recent_count,
+        s.recent_mean,
+        s.previous_mean,
+        s.momentum
+    FROM scored s
+    JOIN movies m ON m.movie_id = s.movie_id
+    ORDER BY trend_rank, s.movie_id
+    LIMIT ?
+    """
+
+TREND_LEVELS = {
+    'movie': ('movie_id', 'movie_rating_days'),
+    'genre': ('genre', 'genre_rating_days'),
+}
+
+
+def create_rating_trends(conn):
+    """Create the daily bucket tables, fill them from movie_ratings and install the triggers"""
+    conn.execute(MOVIE_DAYS_TABLE_SQL)
+    conn.execute(GENRE_DAYS_TABLE_SQL)
+    rebuild_rating_trends(conn)
+    for trigger_sql in TREND_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_rating_trends(conn):
+    """Drop the daily bucket tables and their triggers"""
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute('DROP TABLE IF EXISTS movie_rating_days')
+    conn.execute('DROP TABLE IF EXISTS genre_rating_days')
+
+
+def has_rating_trends(conn):
+    """Check whether the database already carries the daily buckets"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie_rating_days'"
+    ).fetchone()
+    return row is not None
+
+
+def rebuild_rating_trends(conn):
+    """Recompute every bucket from movie_ratings
+
+    The day indexes are rebuilt afterwards, which is much faster than
+    maintaining them row by row during the bulk insert.
+    """
+    conn.execute('DROP INDEX IF EXISTS idx_movie_rating_days_day')
+    conn.execute('DROP INDEX IF EXISTS idx_genre_rating_days_day')
+    conn.execute('DELETE FROM movie_rating_days')
+    conn.execute('DELETE FROM genre_rating_days')
+    conn.execute(f'''
+        INSERT INTO movie_rating_days (movie_id, day, rating_count, rating_sum, rating_sum_sq)
+        SELECT movie_id, {TO_DAY.format(value='review_date')} as bucket_day,
+               COUNT(*), SUM(rating), SUM(rating * rating)
+        FROM movie_ratings
+        WHERE rating IS NOT NULL AND movie_id IS NOT NULL AND julianday(review_date) IS NOT NULL
+        GROUP BY movie_id, bucket_day
+    ''')
+    conn.execute('''
+        INSERT INTO genre_rating_days (genre, day, rating_count, rating_sum, rating_sum_sq)
+        SELECT m.genre, d.day, SUM(d.rating_count), SUM(d.rating_sum), SUM(d.rating_sum_sq)
+        FROM movie_rating_days d
+        JOIN movies m ON m.movie_id = d.movie_id
+        WHERE m.genre IS NOT NULL
+        GROUP BY m.genre, d.day
+    ''')
+    for index_sql in TREND_INDEXES_SQL:
+        conn.execute(index_sql)
+
+
+def latest_day(conn):
+    """Day number of the most recent bucket, or None when there are no ratings"""
+    return conn.execute('SELECT MAX(day) FROM movie_rating_days').fetchone()[0]
+
+
+def trend_query(level='movie', series=True, granularity='day'):
+    """Rolling trend SQL for one series (series=True) or every series of a level"""
+    if level not in TREND_LEVELS:
+        raise ValueError(f"level must be one of {tuple(TREND_LEVELS)}")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {GRANULARITIES}")
+    key, table = TREND_LEVELS[level]
+    return _TREND_QUERY.format(key=key, table=table, bucket=_BUCKETS[granularity],
+                               series_filter=f'{key} = ? AND ' if series else '')
+
+
+def trend_params(latest, series=None, since=None, until=None, window=DEFAULT_WINDOW, granularity='day'):
+    """Parameters of trend_query(); since/until are dates, the range is half-open
+
+    Buckets are read from far enough before since for every frame to be full,
+    and never beyond, so the cost depends on the range and not the history.
+    """
+    if int(window) < 1:
+        raise ValueError("window must be a positive number of days")
+    window = int(window)
+    end = day_number(until) if until is not None else (latest if latest is not None else 0) + 1
+    start = day_number(since) if since is not None else end - DEFAULT_HISTORY
+    if granularity == 'week':
+        start -= (start + 3) % 7
+    lookback = max(YEAR_DAYS, window) + window
+    params = [] if series is None else [series]
+    return tuple(params + [start - lookback, end,
+                           window - 1, 2 * window - 1, window,
+                           YEAR_DAYS + window - 1, YEAR_DAYS, start])
+
+
+def trending_params(latest, as_of=None, window=DEFAULT_WINDOW, min_ratings=5, n=20):
+    """Parameters of TRENDING_MOVIES_QUERY for the windows ending before as_of"""
+    if int(window) < 1:
+        raise ValueError("window must be a positive number of days")
+    window = int(window)
+    end = day_number(as_of) if as_of is not None else (latest if latest is not None else 0) + 1
+    split = end - window
+    return (split, split, split, split, split - window, end, min_ratings, min_ratings, n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the daily rating buckets and show rating trends')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every bucket')
+    parser.add_argument('--genre', default=None, help='genre to show the trend of (default: trending movies)')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='rolling window in days')
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='week')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    with conn:
+        if args.rebuild or not has_rating_trends(conn):
+            drop_rating_trends(conn)
+            create_rating_trends(conn)
+            buckets = conn.execute('SELECT COUNT(*) FROM movie_rating_days').fetchone()[0]
+            print(f"Built {buckets:,} movie-day buckets in {time.perf_counter() - start:.2f}s")
+    latest = latest_day(conn)
+
+    start = time.perf_counter()
+    if args.genre:
+        rows = conn.execute(trend_query('genre', True, args.granularity),
+                            trend_params(latest, args.genre, window=args.window,
+                                         granularity=args.granularity)).fetchall()
+        elapsed = time.perf_counter() - start
+        print(f"\n{args.genre}, {args.window}-day rolling mean by {args.granularity} ({elapsed * 1e3:.1f}ms):")
+        for _, period, count, _, _, rolling, momentum, yoy in rows:
+            print(f"  {period}  {count:>6,} ratings  rolling {rolling:.3f}  "
+                  f"momentum {momentum if momentum is not None else float('nan'):+.3f}  "
+                  f"yoy {yoy if yoy is not None else float('nan'):+.3f}")
+    else:
+        rows = conn.execute(TRENDING_MOVIES_QUERY, trending_params(latest, window=args.window)).fetchall()
+        elapsed = time.perf_counter() - start
+        print(f"\nTrending movies over the last {args.window} days ({elapsed * 1e3:.1f}ms):")
+        for rank, _, title, genre, count, recent, previous, momentum in rows:
+            print(f"  {rank:>3}. {title:<30} {genre or '':<12} {previous:.2f} -> {recent:.2f} "
+                  f"({momentum:+.2f}, {int(count)} ratings)")
+    conn.close()
@@ -0,0 +1,398 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+from scipy import sparse
+from rating_stats import create_rating_stats, has_rating_stats
+from user_rating_stats import create_user_index
+
+DEFAULT_NEIGHBORS = 20
+
+# Upper bound on the entries of one block of the similarity product, so the
+# item-item computation runs in bounded memory whatever the catalog size
+BLOCK_ENTRIES = 8000000
+
+# Stay well below SQLite's host parameter limit
+_PARAMS_PER_QUERY = 500
+
+# Each movie's nearest neighbors, best first. Clustered by (movie_id, rank), so
+# a lookup is a single range read.
+SIMILARITY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS movie_similarity (
+        movie_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor_id INTEGER NOT NULL,
+        similarity REAL NOT NULL,
+        PRIMARY KEY (movie_id, rank)
+    ) WITHOUT ROWID
+'''
+
+# Movies whose ratings changed since their neighbor lists were computed. Every
+# rating change goes through movie_rating_stats, so its triggers see them all.
+DIRTY_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS movie_similarity_dirty (movie_id INTEGER PRIMARY KEY)'
+
+SIMILARITY_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_similarity_stats_insert
+    AFTER INSERT ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_similarity_dirty (movie_id) VALUES (NEW.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_similarity_stats_update
+    AFTER UPDATE ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_similarity_dirty (movie_id) VALUES (OLD.movie_id), (NEW.movie_id)
+        ON CONFLICT DO NOTHING;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS movie_similarity_stats_delete
+    AFTER DELETE ON movie_rating_stats
+    BEGIN
+        INSERT INTO movie_similarity_dirty (movie_id) VALUES (OLD.movie_id) ON CONFLICT DO NOTHING;
+    END
+    ''',
+]
+
+_TRIGGER_NAMES = ('insert', 'update', 'delete')
+
+_MATRIX_QUERY = '''
+    SELECT user_id, movie_id, rating
+    FROM movie_ratings
+    WHERE rating IS NOT NULL AND user_id IS NOT NULL
+'''
+
+SIMILAR_MOVIES_QUERY = '''
+    SELECT s.neighbor_id, m.title, s.similarity
+    FROM movie_similarity s
+    JOIN movies m ON m.movie_id = s.neighbor_id
+    WHERE s.movie_id = ? AND s.rank < ?
+    ORDER BY s.rank
+'''
+
+# Item-based prediction: the candidate's mean plus the similarity-weighted
+# deviations of the user's ratings of its neighbors from their own means. The
+# extra 1.0 in the denominator shrinks predictions backed by a few weak
+# similarities towards the mean; the result is clamped to the rating scale.
+RECOMMEND_QUERY = '''
+    SELECT
+        s.neighbor_id as movie_id,
+        m.title,
+        MIN(MAX(c.rating_sum / c.rating_count
+                + SUM(s.similarity * (r.rating - n.rating_sum / n.rating_count)) / (SUM(s.similarity) + 1.0),
+                1), 10) as predicted_rating,
+        COUNT(*) as supporting_ratings
+    FROM movie_ratings r
+    JOIN movie_similarity s ON s.movie_id = r.movie_id
+    JOIN movie_rating_stats n ON n.movie_id = r.movie_id
+    JOIN movie_rating_stats c ON c.movie_id = s.neighbor_id
+    JOIN movies m ON m.movie_id = s.neighbor_id
+    WHERE r.user_id = ? AND r.rating IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM movie_ratings seen WHERE seen.user_id = r.user_id AND seen.movie_id = s.neighbor_id
+      )
+    GROUP BY s.neighbor_id
+    ORDER BY predicted_rating DESC, supporting_ratings DESC, s.neighbor_id
+    LIMIT ?
+'''
+
+
+def _movie_stats(conn):
+    """Rated movies in id order, with the mean and the centred norm of their ratings"""
+    stats = np.array(conn.execute('''
+        SELECT movie_id, rating_count, rating_sum, rating_sum_sq
+        FROM movie_rating_stats
+        WHERE rating_count > 0
+        ORDER BY movie_id
+    ''').fetchall(), dtype=np.float64).reshape(-1, 4)
+    movie_ids = stats[:, 0].astype(np.int64)
+    means = stats[:, 2] / stats[:, 1]
+    # sum((r - mean)^2) = sum(r^2) - n * mean^2
+    norms = np.sqrt(np.maximum(stats[:, 3] - stats[:, 1] * means * means, 0))
+    return movie_ids, means, norms
+
+
+def rating_matrix(conn, movie_ids, means, query=_MATRIX_QUERY, chunk_rows=1000000):
+    """Sparse user x movie CSR matrix of ratings centred on each movie's mean
+
+    Rows are read from the cursor chunk_rows at a time; columns follow
+    movie_ids, and ratings of movies missing from it are left out.
+    """
+    users, columns, values = [], [], []
+    cursor = conn.execute(query)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        block = np.array(rows, dtype=np.float64)
+        block_movies = block[:, 1].astype(np.int64)
+        positions = np.minimum(np.searchsorted(movie_ids, block_movies), max(len(movie_ids) - 1, 0))
+        known = (movie_ids[positions] == block_movies) if len(movie_ids) else np.zeros(len(block), bool)
+        users.append(block[known, 0].astype(np.int64))
+        columns.append(positions[known])
+        values.append(block[known, 2] - means[positions[known]])
+    users = np.concatenate(users) if users else np.array([], dtype=np.int64)
+    user_ids, user_rows = np.unique(users, return_inverse=True)
+    return sparse.csr_matrix(
+        (np.concatenate(values) if values else np.array([]),
+         (user_rows, np.concatenate(columns) if columns else np.array([], dtype=np.int64))),
+        shape=(len(user_ids), len(movie_ids)))
+
+
+def _top_per_group(groups, scores, k):
+    """Order of the k best scores within each group, groups ascending"""
+    order = np.lexsort((-scores, groups))
+    sorted_groups = groups[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_groups, sorted_groups, side='left')
+    return order[rank < k], rank[rank < k]
+
+
+def similarity_blocks(matrix, norms, rows, block_entries=BLOCK_ENTRIES):
+    """Yield (rows, CSR similarities) for blocks of movie columns
+
+    Each block holds the positive cosine similarities of its rows with every
+    movie (self-similarity excluded). At most block_entries similarities are
+    held at once, whatever the catalog size.
+    """
+    columns = matrix.tocsc()
+    block_rows = max(1, block_entries // max(matrix.shape[1], 1))
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        product = (columns[:, block].T @ matrix).tocsr()
+        source = np.repeat(block, np.diff(product.indptr))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            product.data /= norms[source] * norms[product.indices]
+        keep = (product.data > 0) & (source != product.indices) & np.isfinite(product.data)
+        product.data[~keep] = 0
+        product.eliminate_zeros()
+        yield block, product
+
+
+def _top_per_row(block, product, k):
+    """(sources, neighbors, similarities, ranks) of the k best entries of each row"""
+    sources, neighbors, similarities, ranks = [], [], [], []
+    indptr, indices, data = product.indptr, product.indices, product.data
+    for row, source in enumerate(block.tolist()):
+        values = data[indptr[row]:indptr[row + 1]]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+        else:
+            best = np.arange(len(values))
+        best = best[np.argsort(-values[best], kind='stable')]
+        sources.append(np.full(len(best), source))
+        neighbors.append(indices[indptr[row] + best])
+        similarities.append(values[best])
+        ranks.append(np.arange(len(best)))
+    if not sources:
+        return (np.array([], dtype=np.int64),) * 2 + (np.array([]), np.array([], dtype=np.int64))
+    return np.concatenate(sources), np.concatenate(neighbors), np.concatenate(similarities), np.concatenate(ranks)
+
+
+def _write_lists(conn, movie_ids, sources, neighbors, similarities, rank):
+    """Insert neighbor list rows given as movie positions"""
+    conn.executemany('''
+        INSERT INTO movie_similarity (movie_id, rank, neighbor_id, similarity) VALUES (?, ?, ?, ?)
+    ''', zip(movie_ids[sources].tolist(), rank.tolist(), movie_ids[neighbors].tolist(), similarities.tolist()))
+
+
+def _delete_lists(conn, movie_ids):
+    movie_ids = [int(movie_id) for movie_id in movie_ids]
+    for start in range(0, len(movie_ids), _PARAMS_PER_QUERY):
+        chunk = movie_ids[start:start + _PARAMS_PER_QUERY]
+        conn.execute(f'DELETE FROM movie_similarity WHERE movie_id IN ({", ".join("?" * len(chunk))})', chunk)
+
+
+def _load_lists(conn, movie_ids):
+    """Stored (movie_id, neighbor_id, similarity) rows of the given movies"""
+    rows = []
+    movie_ids = [int(movie_id) for movie_id in movie_ids]
+    for start in range(0, len(movie_ids), _PARAMS_PER_QUERY):
+        chunk = movie_ids[start:start + _PARAMS_PER_QUERY]
+        rows += conn.execute(f'''
+            SELECT movie_id, neighbor_id, similarity FROM movie_similarity
+            WHERE movie_id IN ({", ".join("?" * len(chunk))})
+        ''', chunk).fetchall()
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def _rebuild(conn, neighbors):
+    movie_ids, means, norms = _movie_stats(conn)
+    matrix = rating_matrix(conn, movie_ids, means)
+    conn.execute('DELETE FROM movie_similarity')
+    for block, product in similarity_blocks(matrix, norms, np.arange(len(movie_ids))):
+        _write_lists(conn, movie_ids, *_top_per_row(block, product, neighbors))
+    conn.execute('DELETE FROM movie_similarity_dirty')
+    return len(movie_ids)
+
+
+def create_movie_similarity(conn, neighbors=DEFAULT_NEIGHBORS):
+    """Create movie_similarity with the top neighbors of every movie, and its triggers
+
+    The user index is created too; recommendations and incremental refreshes
+    read ratings by user. So is movie_rating_stats, which the neighbor lists
+    are centred on, when the database does not carry it yet.
+    """
+    if not has_rating_stats(conn):
+        create_rating_stats(conn)
+    create_user_index(conn)
+    conn.execute(SIMILARITY_TABLE_SQL)
+    conn.execute(DIRTY_TABLE_SQL)
+    _rebuild(conn, neighbors)
+    for trigger_sql in SIMILARITY_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_movie_similarity(conn):
+    for name in _TRIGGER_NAMES:
+        conn.execute(f'DROP TRIGGER IF EXISTS movie_similarity_stats_{name}')
+    conn.execute('DROP TABLE IF EXISTS movie_similarity')
+    conn.execute('DROP TABLE IF EXISTS movie_similarity_dirty')
+
+
+def has_movie_similarity(conn):
+    """Check whether the database already carries the neighbor lists"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie_similarity'"
+    ).fetchone()
+    return row is not None
+
+
+def stored_neighbors(conn):
+    """Neighbor list length the table was built with (DEFAULT_NEIGHBORS when empty)"""
+    longest = conn.execute('SELECT MAX(rank) FROM movie_similarity').fetchone()[0]
+    return DEFAULT_NEIGHBORS if longest is None else longest + 1
+
+
+def refresh_movie_similarity(conn, neighbors=None):
+    """Bring the neighbor lists up to date with ratings changed since the last refresh
+
+    Ratings are centred on per-movie means, so the similarity of two movies
+    only changes when one of them was rated. Lists of changed movies, and
+    lists that named a changed movie, are recomputed in full; every other
+    list can only gain a changed movie, which is merged into it. The result
+    matches create_movie_similarity(). Returns the number of changed movies.
+    """
+    neighbors = neighbors or stored_neighbors(conn)
+    dirty = np.array([row[0] for row in conn.execute('SELECT movie_id FROM movie_similarity_dirty')],
+                     dtype=np.int64)
+    if len(dirty) == 0:
+        return 0
+    movie_ids, means, norms = _movie_stats(conn)
+    listing = np.array([row[0] for row in conn.execute('''
+        SELECT DISTINCT s.movie_id FROM movie_similarity s
+        JOIN movie_similarity_dirty d ON d.movie_id = s.neighbor_id
+    ''')], dtype=np.int64)
+    recompute = np.union1d(dirty, listing)
+    if len(recompute) * 4 > len(movie_ids):
+        # e.g. after refresh_rating_stats(): a full pass is cheaper than the merge
+        _rebuild(conn, neighbors)
+        return len(dirty)
+
+    matrix = rating_matrix(conn, movie_ids, means)
+    positions = np.searchsorted(movie_ids, recompute)
+    positions = positions[(positions < len(movie_ids)) &
+                          (movie_ids[np.minimum(positions, len(movie_ids) - 1)] == recompute)]
+    changed = np.isin(movie_ids, dirty)
+    untouched = ~np.isin(movie_ids, recompute)
+    _delete_lists(conn, recompute)
+
+    # Changed movies that may enter the lists of untouched movies
+    candidates = np.empty((0, 3))
+    for block, product in similarity_blocks(matrix, norms, positions):
+        _write_lists(conn, movie_ids, *_top_per_row(block, product, neighbors))
+        sources = np.repeat(block, np.diff(product.indptr))
+        targets, similarity = product.indices, product.data
+        entering = changed[sources] & untouched[targets]
+        candidates = np.vstack([candidates, np.column_stack([
+            movie_ids[targets[entering]], movie_ids[sources[entering]], similarity[entering]])])
+        order, _ = _top_per_group(candidates[:, 0].astype(np.int64), candidates[:, 2], neighbors)
+        candidates = candidates[order]
+
+    affected = np.unique(candidates[:, 0].astype(np.int64))
+    merged = np.vstack([candidates, _load_lists(conn, affected)])
+    _delete_lists(conn, affected)
+    order, rank = _top_per_group(merged[:, 0].astype(np.int64), merged[:, 2], neighbors)
+    conn.executemany('''
+        INSERT INTO movie_similarity (movie_id, rank, neighbor_id, similarity) VALUES (?, ?, ?, ?)
+    ''', zip(merged[order, 0].astype(np.int64).tolist(), rank.tolist(),
+             merged[order, 1].astype(np.int64).tolist(), merged[order, 2].tolist()))
+    conn.execute('DELETE FROM movie_similarity_dirty')
+    return len(dirty)
+
+
+class MovieRecommender:
+    """"Movies similar to X" and "top-N for user U" from the movie_similarity table
+
+    Lookups are range reads of the clustered neighbor lists over one persistent
+    connection, with the statements kept in sqlite3's statement cache, so a
+    similar-movies lookup takes microseconds. The connection belongs to the
+    thread that created the recommender.
+    """
+
+    def __init__(self, db_path='movies.db', neighbors=DEFAULT_NEIGHBORS):
+        self.db_path = db_path
+        self.neighbors = neighbors
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path)
+        return self._conn
+
+    def build(self, rebuild=False):
+        """Create the neighbor lists, or bring them up to date; returns the movies (re)computed"""
+        with self.conn:
+            if rebuild or not has_movie_similarity(self.conn):
+                drop_movie_similarity(self.conn)
+                create_movie_similarity(self.conn, self.neighbors)
+                return self.conn.execute('SELECT COUNT(DISTINCT movie_id) FROM movie_similarity').fetchone()[0]
+            return refresh_movie_similarity(self.conn, self.neighbors)
+
+    def similar_movies(self, movie_id, n=10):
+        """[(movie_id, title, similarity)] of the n most similar movies, best first"""
+        return self.conn.execute(SIMILAR_MOVIES_QUERY, (movie_id, n)).fetchall()
+
+    def recommend(self, user_id, n=10):
+        """[(movie_id, title, predicted_rating, supporting_ratings)] of unseen movies for a user"""
+        return self.conn.execute(RECOMMEND_QUERY, (user_id, n)).fetchall()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build item-item neighbor lists and query them')
+    parser.add_argument('--db', default='movies.db')
+    parser.add_argument('--neighbors', type=int, default=DEFAULT_NEIGHBORS)
+    parser.add_argument('--rebuild', action='store_true', help='recompute every neighbor list')
+    parser.add_argument('--movie', type=int, default=1, help='movie to find similar movies for')
+    parser.add_argument('--user', type=int, default=1, help='user to recommend movies to')
+    args = parser.parse_args()
+
+    recommender = MovieRecommender(args.db, args.neighbors)
+    start = time.perf_counter()
+    computed = recommender.build(args.rebuild)
+    print(f"Neighbor lists computed for {computed:,} movies in {time.perf_counter() - start:.2f}s")
+
+    print(f"\nMovies similar to {args.movie}:")
+    for movie_id, title, similarity in recommender.similar_movies(args.movie):
+        print(f"  {movie_id:>8} {title:<30} {similarity:.3f}")
+    print(f"\nRecommendations for user {args.user}:")
+    for movie_id, title, predicted, support in recommender.recommend(args.user):
+        print(f"  {movie_id:>8} {title:<30} {predicted:.2f} (from {support} ratings)")
+
+    lookups = 10000
+    start = time.perf_counter()
+    for i in range(lookups):
+        recommender.similar_movies(args.movie + i % 100)
+    print(f"\nsimilar_movies: {(time.perf_counter() - start) / lookups * 1e6:.1f}us per lookup")
+    start = time.perf_counter()
+    for i in range(100):
+        recommender.recommend(args.user + i)
+    print(f"recommend: {(time.perf_counter() - start) / 100 * 1e3:.2f}ms per user")
+    recommender.close()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+import pandas as pd
+
+DEFAULT_FRAGMENT_DIR = '.report_fragments'
+
+# Movie, cast and crew tables change rarely, so a per-row trigger bumping a
+# counter is cheap and catches every insert, update and delete. Counters start
+# at a random value, so a rebuilt database never matches an old signature.
+VERSIONED_TABLES = ('movies', 'directors', 'actors', 'movie_actors')
+
+TABLE_VERSIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+'''
+
+_VERSION_TRIGGER_SQL = '''
+    CREATE TRIGGER IF NOT EXISTS table_versions_{table}_{event}
+    AFTER {event} ON {table}
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+    END
+'''
+
+_EVENTS = ('insert', 'update', 'delete')
+
+# Ratings arrive too often for another per-row trigger. Every rating-derived
+# figure is computed from movie_rating_stats, so checksums over it (weighted by
+# movie id, so ratings moving between movies show up) stand in for a version.
+RATINGS_SIGNATURE_SQL = '''
+    SELECT COUNT(*), TOTAL(rating_count), TOTAL(rating_sum), TOTAL(rating_sum_sq),
+           TOTAL(movie_id * rating_count), TOTAL(movie_id * rating_sum),
+           TOTAL(min_rating), TOTAL(max_rating)
+    FROM movie_rating_stats
+'''
+
+
+def create_table_versions(conn):
+    """Create table_versions and the triggers that keep it current"""
+    conn.execute(TABLE_VERSIONS_SQL)
+    conn.executemany('''
+        INSERT INTO table_versions (table_name, version) VALUES (?, abs(random()) % 1000000000000)
+        ON CONFLICT DO NOTHING
+    ''', [(table,) for table in VERSIONED_TABLES])
+    for table in VERSIONED_TABLES:
+        for event in _EVENTS:
+            conn.execute(_VERSION_TRIGGER_SQL.format(table=table, event=event))
+
+
+def drop_table_versions(conn):
+    for table in VERSIONED_TABLES:
+        for event in _EVENTS:
+            conn.execute(f'DROP TRIGGER IF EXISTS table_versions_{table}_{event}')
+    conn.execute('DROP TABLE IF EXISTS table_versions')
+
+
+def has_table_versions(conn):
+    """Check whether the database already carries the version counters"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'table_versions'"
+    ).fetchone()
+    return row is not None
+
+
+def table_signatures(conn):
+    """{table: signature} for the versioned tables and 'movie_ratings'"""
+    signatures = {table: version for table, version in conn.execute(
+        'SELECT table_name, version FROM table_versions')}
+    signatures['movie_ratings'] = list(conn.execute(RATINGS_SIGNATURE_SQL).fetchone())
+    return signatures
+
+
+def signature(*parts):
+    """Stable digest of JSON-serializable values"""
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+def update_frame_hash(digest, frame):
+    """Feed a DataFrame's columns, dtypes, index and values into a hashlib digest"""
+    digest.update(repr((list(frame.columns), [str(dtype) for dtype in frame.dtypes])).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+
+
+def frame_hash(frame):
+    """Content hash of a DataFrame"""
+    digest = hashlib.sha256()
+    update_frame_hash(digest, frame)
+    return digest.hexdigest()
+
+
+def hashed_chunks(chunks, digest):
+    """Pass chunks through while feeding each one into digest"""
+    for chunk in chunks:
+        update_frame_hash(digest, chunk)
+        yield chunk
+
+
+class FragmentCache:
+    """Rendered HTML fragments on disk with the inputs they were rendered from
+
+    manifest.json records, per fragment key, the dependency signature and the
+    hash of the data the fragment was rendered from. A fragment is reused when
+    either still matches.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_FRAGMENT_DIR):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.html')
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def lookup(self, key, dependencies=None, data_hash=None):
+        """Path of the cached fragment if its dependencies or its data are unchanged, else None"""
+        entry = self.manifest.get(key)
+        if entry is None or not os.path.exists(self._path(key)):
+            return None
+        if dependencies is not None and entry['dependencies'] == dependencies:
+            return self._path(key)
+        if data_hash is not None and entry['data_hash'] == data_hash:
+            # Same data under new dependencies: remember them for the next run
+            if dependencies is not None:
+                entry['dependencies'] = dependencies
+                self._save()
+            return self._path(key)
+        return None
+
+    @contextmanager
+    def write(self, key, dependencies, digest):
+        """Stream a fragment to disk; digest is read once the block has fed it the data"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._path(key) + f'.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yield f
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.manifest[key] = {'dependencies': dependencies, 'data_hash': digest.hexdigest()}
+        self._save()
+
+    def copy_to(self, key, stream):
+        """Write a cached fragment into stream"""
+        with open(self._path(key), encoding='utf-8') as f:
+            shutil.copyfileobj(f, stream)
+
+    def clear(self):
+        """Drop every cached fragment"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._manifest = {}
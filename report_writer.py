@@ -0,0 +1,76 @@
+import html
+import pandas as pd
+
+
+def escape(values):
+    """HTML-escape a column of values"""
+    return values.astype(str).map(html.escape)
+
+
+def integer(values):
+    return values.round().astype('int64').astype(str)
+
+
+def decimal(places=1):
+    fmt = f'{{:.{places}f}}'.format
+    return lambda values: values.map(fmt)
+
+
+def currency(values):
+    return '$' + values.map('{:,.0f}'.format)
+
+
+def truncated(width):
+    return lambda values: escape(values.astype(str).str.slice(0, width)) + '...'
+
+
+class HtmlReportWriter:
+    """Write an HTML document section by section straight to a file
+
+    Tables are rendered a column at a time: each column is formatted as a whole,
+    the cells of a block of rows are concatenated with vectorized string ops,
+    and the block is written out before the next one is formatted. Memory use
+    therefore depends on the block size, not on the number of rows.
+    """
+
+    def __init__(self, stream, chunk_rows=2000):
+        self.stream = stream
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def table(self, columns, frames):
+        """Write a <table> from a DataFrame or an iterable of DataFrame chunks
+
+        columns is a list of (header, column name, formatter) tuples.
+        """
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+
+        header_cells = ''.join(f'<th>{html.escape(header)}</th>' for header, _, _ in columns)
+        self.write(f'''
+                <table>
+                    <thead>
+                        <tr>{header_cells}</tr>
+                    </thead>
+                    <tbody>
+''')
+        for frame in frames:
+            for start in range(0, len(frame), self.chunk_rows):
+                self._write_rows(columns, frame.iloc[start:start + self.chunk_rows])
+        self.write('''
+                    </tbody>
+                </table>
+''')
+
+    def _write_rows(self, columns, block):
+        if block.empty:
+            return
+        rows = pd.Series('                        <tr>', index=block.index)
+        for _, column, formatter in columns:
+            rows = rows + '<td>' + formatter(block[column]) + '</td>'
+        self.write('\n'.join(rows + '</tr>'))
+        self.write('\n')
+        self.rows_written += len(block)
@@ -0,0 +1,61 @@
+import pandas as pd
+
+# Low-cardinality text columns returned as categoricals. Every chunk of a result
+# shares the same categories, so chunks concatenate without falling back to object.
+FIXED_CATEGORIES = {
+    'rating_category': ['Poor', 'Average', 'Good', 'Excellent'],
+    'budget_category': ['Low Budget', 'Medium Budget', 'High Budget'],
+    'season': ['Winter', 'Spring', 'Summer', 'Fall'],
+}
+
+CATEGORY_LEVELS_SQL = {
+    'genre': 'SELECT DISTINCT genre FROM movies WHERE genre IS NOT NULL ORDER BY 1',
+    'director': 'SELECT DISTINCT name FROM directors WHERE name IS NOT NULL ORDER BY 1',
+    'release_year': '''
+        SELECT DISTINCT strftime('%Y', release_date) FROM movies
+        WHERE release_date IS NOT NULL ORDER BY 1
+    ''',
+}
+
+# Result columns that hold director names
+CATEGORY_ALIASES = {'director_name': 'director'}
+
+# Ratings themselves and values derived from single ratings (quantiles, interval
+# widths) fit float32 exactly enough. Averages stay float64: float32 would move
+# means like 9.65 across a rounding boundary when they are shown to one decimal.
+FLOAT32_COLUMNS = {
+    'min_rating', 'max_rating', 'p50', 'p90',
+    'avg_rating_ci', 'avg_genre_rating_ci', 'avg_director_rating_ci',
+}
+
+
+def category_levels(conn):
+    """Categories for every categorical result column, read once per iteration"""
+    levels = dict(FIXED_CATEGORIES)
+    for column, query in CATEGORY_LEVELS_SQL.items():
+        levels[column] = [row[0] for row in conn.execute(query)]
+    return levels
+
+
+def compact_dtypes(frame, levels):
+    """Categoricals for the known text columns, downcast numerics elsewhere (in place)"""
+    for column in frame.columns:
+        values = frame[column]
+        categories = levels.get(CATEGORY_ALIASES.get(column, column))
+        if categories is not None:
+            # Values written after the levels were read must not turn into NaN
+            unseen = pd.Index(values.dropna().unique()).difference(categories)
+            frame[column] = pd.Categorical(values, categories=list(categories) + list(unseen))
+        elif pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+            frame[column] = pd.to_numeric(values, downcast='integer')
+        elif column in FLOAT32_COLUMNS and pd.api.types.is_numeric_dtype(values):
+            frame[column] = values.astype('float32')
+    return frame
+
+
+def frame_chunks(frame, chunksize):
+    """Split an in-memory result into chunks of at most chunksize rows"""
+    for start in range(0, len(frame), chunksize):
+        chunk = frame.iloc[start:start + chunksize]
+        # Number rows from 0 like read_sql_query chunks; keep meaningful indexes
+        yield chunk.reset_index(drop=True) if isinstance(frame.index, pd.RangeIndex) else chunk.copy()
@@ -0,0 +1,38 @@
+import os
+import shutil
+import sqlite3
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact_schema import migrate_to_compact  # noqa: E402
+from data_generator import DataGenerator  # noqa: E402
+
+
+@pytest.fixture(scope='session', params=['legacy', 'compact'])
+def template_db(request, tmp_path_factory):
+    """Small generated database, once per schema; tests work on copies"""
+    path = str(tmp_path_factory.mktemp(request.param) / 'movies.db')
+    DataGenerator(path, num_movies=400, num_ratings=20000, num_users=500, seed=7).generate()
+    if request.param == 'compact':
+        conn = sqlite3.connect(path)
+        try:
+            migrate_to_compact(conn)
+        finally:
+            conn.close()
+    return path
+
+
+@pytest.fixture
+def db_path(template_db, tmp_path):
+    path = str(tmp_path / 'movies.db')
+    shutil.copy(template_db, path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
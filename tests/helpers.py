@@ -0,0 +1,74 @@
+import pandas as pd
+from compact_schema import RATING_INSERT_SQL, TO_DAY, is_compact_schema
+
+LEGACY_INSERT_SQL = '''
+    INSERT INTO movie_ratings (rating_id, movie_id, user_id, rating, review_date) VALUES (?, ?, ?, ?, ?)
+'''
+
+
+def _ratings_of(conn, movie_id):
+    return [row[0] for row in conn.execute(
+        'SELECT rating_id FROM movie_ratings WHERE movie_id = ? ORDER BY rating_id', (movie_id,))]
+
+
+def change_ratings(conn):
+    """Insert, update, move, NULL out and delete ratings of six movies; returns their ids
+
+    The third movie only has ratings changed in place, so its rating count
+    stays the same. Written against the stored columns, so it works on
+    either schema.
+    """
+    compact = is_compact_schema(conn)
+    set_rating = 'rating_tenths = CAST(round(? * 10) AS INTEGER)' if compact else 'rating = ?'
+    set_date = f"review_day = {TO_DAY.format(value='?')}" if compact else 'review_date = ?'
+    movies = [row[0] for row in conn.execute(
+        'SELECT movie_id FROM movie_rating_stats WHERE rating_count >= 3 ORDER BY movie_id LIMIT 6')]
+    first, second, third, fourth, fifth, sixth = movies
+    next_id = conn.execute('SELECT MAX(rating_id) FROM movie_ratings').fetchone()[0] + 1
+    with conn:
+        # Enough top ratings to lift the first movie into the leaderboards
+        conn.executemany(RATING_INSERT_SQL if compact else LEGACY_INSERT_SQL, [
+            (next_id + i, first, i + 1, 10.0, '2023-05-01') for i in range(40)
+        ] + [
+            (next_id + 40, second, 2, 2.0, '2015-03-01'),
+            (next_id + 41, second, 3, 7.3, '2022-12-31'),
+        ])
+        rated = _ratings_of(conn, third)
+        conn.execute(f'UPDATE movie_ratings SET {set_rating} WHERE rating_id = ?', (1.0, rated[0]))
+        conn.execute(f'UPDATE movie_ratings SET {set_date} WHERE rating_id = ?', ('2016-02-29', rated[1]))
+        moved, nulled = _ratings_of(conn, fourth)[:2]
+        conn.execute('UPDATE movie_ratings SET movie_id = ? WHERE rating_id = ?', (fifth, moved))
+        conn.execute(f'UPDATE movie_ratings SET {set_rating} WHERE rating_id = ?', (None, nulled))
+        conn.executemany('DELETE FROM movie_ratings WHERE rating_id = ?',
+                         [(rating_id,) for rating_id in _ratings_of(conn, sixth)[:2] + _ratings_of(conn, second)[:1]])
+    return movies
+
+
+def change_movie(conn, movie_id):
+    """Give a movie another genre, director and release date"""
+    if is_compact_schema(conn):
+        changes = ("genre_id = (SELECT genre_id FROM genres WHERE name = ?), "
+                   f"release_day = {TO_DAY.format(value='?')}")
+    else:
+        changes = 'genre = ?, release_date = ?'
+    with conn:
+        conn.execute(f'''
+            UPDATE movies SET {changes}, director_id = (SELECT MAX(director_id) FROM directors)
+            WHERE movie_id = ?
+        ''', ('Horror', '2010-06-15', movie_id))
+
+
+def read(conn, query, keys, params=()):
+    """Query result sorted by keys, for comparing tables regardless of row order"""
+    return pd.read_sql_query(query, conn, params=params).sort_values(keys).reset_index(drop=True)
+
+
+def assert_same(actual, expected):
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def forbid(monkeypatch, module, name):
+    """Fail the test if module.name is called, to keep a refresh on its incremental path"""
+    def fail(*args, **kwargs):
+        raise AssertionError(f'{module.__name__}.{name} called')
+    monkeypatch.setattr(module, name, fail)
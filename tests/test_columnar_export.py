@@ -0,0 +1,23 @@
+import pytest
+from columnar_export import export_database, stale_tables
+from helpers import change_movie
+from numpy_backend import ARROW_TABLES, NumpyAnalyticsEngine
+from report_fragments import drop_table_versions, has_table_versions
+
+
+def test_stale_tables_only_reads(conn, db_path, tmp_path):
+    export_dir = str(tmp_path / 'export')
+    with conn:
+        drop_table_versions(conn)
+    assert stale_tables(db_path, export_dir, ARROW_TABLES) == list(ARROW_TABLES)
+    assert not has_table_versions(conn)
+
+    export_database(db_path, export_dir, ['arrow'], ARROW_TABLES)
+    assert has_table_versions(conn)
+    assert stale_tables(db_path, export_dir, ARROW_TABLES) == []
+
+    movie_id = conn.execute('SELECT MIN(movie_id) FROM movies').fetchone()[0]
+    change_movie(conn, movie_id)
+    assert 'movies' in stale_tables(db_path, export_dir, ARROW_TABLES)
+    with pytest.raises(ValueError):
+        NumpyAnalyticsEngine.from_arrow(export_dir, db_path)
@@ -0,0 +1,31 @@
+import json
+import pytest
+from ingest_ratings import RatingIngestor
+
+
+def event(movie_id, rating):
+    return json.dumps({'movie_id': movie_id, 'user_id': 1, 'rating': rating, 'review_date': '2024-01-02'})
+
+
+def test_chunk_of_invalid_lines_is_rejected_and_reading_goes_on(conn, db_path, tmp_path):
+    dead_letter = tmp_path / 'rejected.jsonl'
+    before = conn.execute('SELECT COUNT(*) FROM movie_ratings').fetchone()[0]
+    lines = [event(1, 7.5), event(2, 8.0), 'not json', '{broken', event(3, 6.5), event(4, 9.0)]
+    ingestor = RatingIngestor(db_path, chunk_rows=2, dead_letter_path=str(dead_letter))
+    result = ingestor.ingest(lines)
+    assert (result['accepted'], result['rejected']) == (4, 2)
+    assert conn.execute('SELECT COUNT(*) FROM movie_ratings').fetchone()[0] == before + 4
+    assert [json.loads(line)['line'] for line in dead_letter.read_text().splitlines()] == [3, 4]
+
+
+def test_reader_failure_is_raised(conn, db_path, tmp_path):
+    def lines():
+        yield event(1, 7.5)
+        raise OSError('input went away')
+
+    before = conn.execute('SELECT COUNT(*) FROM movie_ratings').fetchone()[0]
+    ingestor = RatingIngestor(db_path, chunk_rows=1, dead_letter_path=str(tmp_path / 'rejected.jsonl'))
+    with pytest.raises(OSError, match='input went away'):
+        ingestor.ingest(lines())
+    # Rows read before the failure are still written
+    assert conn.execute('SELECT COUNT(*) FROM movie_ratings').fetchone()[0] == before + 1
@@ -0,0 +1,30 @@
+import leaderboards
+from helpers import assert_same, change_movie, change_ratings, forbid, read
+from leaderboards import LEADERBOARD_QUERY, RANKING_QUERY, create_leaderboards, refresh_leaderboards
+
+DEPTH = 3
+
+# Every leaderboard a rated movie belongs to
+SCOPES_SQL = '''
+    SELECT 'all', ''
+    UNION SELECT 'genre', m.genre FROM movies m JOIN movie_rating_stats s USING (movie_id)
+          WHERE m.genre IS NOT NULL
+    UNION SELECT 'director', CAST(m.director_id AS TEXT) FROM movies m JOIN movie_rating_stats s USING (movie_id)
+          WHERE m.director_id IS NOT NULL
+    UNION SELECT 'year', strftime('%Y', m.release_date) FROM movies m JOIN movie_rating_stats s USING (movie_id)
+          WHERE m.release_date IS NOT NULL
+'''
+
+
+def test_refresh_matches_full_ranking(conn, monkeypatch):
+    with conn:
+        create_leaderboards(conn, depth=DEPTH)
+    movies = change_ratings(conn)
+    change_movie(conn, movies[0])
+    forbid(monkeypatch, leaderboards, '_rank_all')
+    with conn:
+        assert refresh_leaderboards(conn) > 0
+    for scope, key in conn.execute(SCOPES_SQL).fetchall():
+        stored = read(conn, LEADERBOARD_QUERY, 'rank', (scope, key, DEPTH))
+        ranked = read(conn, RANKING_QUERY, 'rank', (scope, key)).head(DEPTH)
+        assert_same(stored, ranked)
@@ -0,0 +1,42 @@
+import movie_cube
+from analysis_queries import MovieAnalytics
+from connection_pool import connect_read_only
+from helpers import assert_same, change_movie, change_ratings, forbid, read
+from movie_cube import create_movie_cube, pending_changes, rebuild_movie_cube, refresh_movie_cube
+
+CELLS = 'SELECT * FROM movie_cube'
+KEYS = ['genre', 'release_year', 'release_month', 'director_id']
+
+
+def test_refresh_matches_rebuild(conn, monkeypatch):
+    with conn:
+        create_movie_cube(conn)
+    movies = change_ratings(conn)
+    change_movie(conn, movies[0])
+    assert pending_changes(conn) > 0
+    forbid(monkeypatch, movie_cube, 'rebuild_movie_cube')
+    with conn:
+        assert refresh_movie_cube(conn) > 0
+    assert pending_changes(conn) == 0
+    refreshed = read(conn, CELLS, KEYS)
+    monkeypatch.undo()
+    with conn:
+        rebuild_movie_cube(conn)
+    assert_same(refreshed, read(conn, CELLS, KEYS))
+
+
+def test_read_only_connection_leaves_cube_dirty(conn, db_path):
+    with conn:
+        create_movie_cube(conn)
+    change_ratings(conn)
+    expected = MovieAnalytics(db_path, use_cube=False).genre_popularity_analysis()
+    analytics = MovieAnalytics(db_path)
+    # As in run_all, where each worker is bound to a pooled read-only connection
+    analytics._local.conn = connect_read_only(db_path)
+    try:
+        assert_same(analytics.genre_popularity_analysis(), expected)
+    finally:
+        analytics._local.conn.close()
+    assert pending_changes(conn) > 0
+    assert_same(MovieAnalytics(db_path).genre_popularity_analysis(), expected)
+    assert pending_changes(conn) == 0
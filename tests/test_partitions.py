@@ -0,0 +1,63 @@
+import sqlite3
+import pytest
+from compact_schema import RATING_INSERT_SQL, is_compact_schema
+from create_database import create_schema
+from helpers import LEGACY_INSERT_SQL, assert_same, change_ratings, read
+from partitions import RatingPartitions, window_connection
+
+STATS = 'SELECT * FROM movie_rating_stats'
+
+
+def window_stats(conn):
+    try:
+        return read(conn, STATS, 'movie_id')
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('since, until', [
+    (None, None),
+    ('2015-01-01', '2016-06-01'),
+    ('2016-02-01', '2023-01-01'),
+])
+def test_sync_matches_unpartitioned_windows(conn, db_path, tmp_path, since, until):
+    partitions = RatingPartitions(db_path, str(tmp_path / 'partitions'), granularity='year')
+    partitions.build()
+    assert partitions.compact('2017-01-01')
+    change_ratings(conn)
+    assert_same(window_stats(partitions.window_connection(since, until)),
+                window_stats(window_connection(db_path, since, until)))
+
+
+def test_sync_skips_missing_review_dates(conn, db_path, tmp_path):
+    partitions = RatingPartitions(db_path, str(tmp_path / 'partitions'), granularity='month')
+    partitions.build()
+    compact = is_compact_schema(conn)
+    rating_id, movie_id = conn.execute('SELECT rating_id, movie_id FROM movie_ratings LIMIT 1').fetchone()
+    next_id = conn.execute('SELECT MAX(rating_id) FROM movie_ratings').fetchone()[0] + 1
+    with conn:
+        conn.execute(f"UPDATE movie_ratings SET {'review_day' if compact else 'review_date'} = NULL "
+                     'WHERE rating_id = ?', (rating_id,))
+        conn.execute(RATING_INSERT_SQL if compact else LEGACY_INSERT_SQL, (next_id, movie_id, 1, 5.0, None))
+    partitions.sync()
+    assert 'None' not in set(partitions.catalog()['partition_key'])
+    assert_same(window_stats(partitions.window_connection('2015-01-01', '2020-01-01')),
+                window_stats(window_connection(db_path, '2015-01-01', '2020-01-01')))
+
+
+def test_create_schema_drops_catalog(db_path, tmp_path):
+    partitions = RatingPartitions(db_path, str(tmp_path / 'partitions'), granularity='year')
+    partitions.build()
+    assert partitions.compact('2017-01-01')
+    conn = sqlite3.connect(db_path)
+    try:
+        create_schema(conn.cursor())
+        assert not conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'rating_partitions%'").fetchall()
+        conn.execute(LEGACY_INSERT_SQL, (1, 1, 1, 7.0, '2015-06-01'))
+        conn.commit()
+    finally:
+        conn.close()
+    # Files left by the dropped catalog are replaced, not appended to
+    assert partitions.build() == 1
+    assert partitions.catalog()['row_count'].tolist() == [1]
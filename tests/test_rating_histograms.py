@@ -0,0 +1,20 @@
+from helpers import assert_same, change_ratings, read
+from rating_histograms import create_rating_histograms, refresh_rating_histograms, stale_movies
+
+HISTOGRAMS = 'SELECT * FROM movie_rating_histograms'
+
+
+def test_refresh_of_stale_movies_matches_rebuild(conn):
+    with conn:
+        create_rating_histograms(conn)
+    movies = change_ratings(conn)
+    stale = stale_movies(conn)
+    assert set(movies) <= set(stale)
+    with conn:
+        refresh_rating_histograms(conn, stale)
+    assert stale_movies(conn) == []
+    refreshed = read(conn, HISTOGRAMS, 'movie_id')
+    with conn:
+        refresh_rating_histograms(conn)
+    assert_same(refreshed, read(conn, HISTOGRAMS, 'movie_id'))
+
@@ -0,0 +1,34 @@
+from helpers import assert_same, change_ratings, read
+from rating_sample import create_rating_sample
+
+SAMPLED = 'SELECT rating_id, movie_id, rating, review_date FROM rating_sample'
+RATED = 'SELECT rating_id, movie_id, rating, review_date FROM movie_ratings WHERE rating IS NOT NULL'
+
+
+def test_unbounded_sample_tracks_every_rating(conn):
+    # With room for every rating the sample is the ratings table itself
+    with conn:
+        create_rating_sample(conn, per_movie=1000000)
+    change_ratings(conn)
+    assert_same(read(conn, SAMPLED, 'rating_id'), read(conn, RATED, 'rating_id'))
+
+
+def test_bounded_sample_stays_below_cutoffs(conn):
+    per_movie = 4
+    with conn:
+        create_rating_sample(conn, per_movie)
+    change_ratings(conn)
+    sampled = read(conn, SAMPLED, 'rating_id')
+    rated = read(conn, RATED, 'rating_id')
+    # Sampled rows are current ratings with current values
+    assert_same(sampled, sampled[['rating_id']].merge(rated, on='rating_id'))
+    assert sampled.groupby('movie_id').size().max() <= per_movie
+    assert not conn.execute('''
+        SELECT 1 FROM rating_sample s JOIN rating_sample_cutoffs c USING (movie_id)
+        WHERE s.priority >= c.cutoff
+    ''').fetchone()
+    # Movies that never overflowed keep all of their ratings
+    uncut = rated[~rated['movie_id'].isin(
+        [row[0] for row in conn.execute('SELECT movie_id FROM rating_sample_cutoffs')])]
+    assert_same(sampled[sampled['movie_id'].isin(uncut['movie_id'])].reset_index(drop=True),
+                uncut.reset_index(drop=True))
@@ -0,0 +1,37 @@
+from analysis_queries import MovieAnalytics
+from helpers import assert_same, change_ratings, read
+from rating_stats import drop_rating_stats, has_rating_stats, refresh_rating_stats
+
+STATS = 'SELECT * FROM movie_rating_stats'
+
+
+def test_triggers_match_rebuild(conn):
+    change_ratings(conn)
+    maintained = read(conn, STATS, 'movie_id')
+    with conn:
+        refresh_rating_stats(conn)
+    assert_same(maintained, read(conn, STATS, 'movie_id'))
+
+
+def test_refresh_of_changed_movies_matches_rebuild(conn):
+    movies = change_ratings(conn)
+    with conn:
+        refresh_rating_stats(conn)
+    rebuilt = read(conn, STATS, 'movie_id')
+    with conn:
+        conn.executemany('DELETE FROM movie_rating_stats WHERE movie_id = ?', [(movie_id,) for movie_id in movies])
+        refresh_rating_stats(conn, movies)
+    assert_same(read(conn, STATS, 'movie_id'), rebuilt)
+
+
+def test_analytics_build_missing_stats(db_path, conn):
+    # Databases from create_database.py before the aggregates existed
+    with conn:
+        drop_rating_stats(conn)
+    analytics = MovieAnalytics(db_path)
+    assert len(analytics.genre_popularity_analysis()) > 0
+    assert has_rating_stats(conn)
+    with conn:
+        drop_rating_stats(conn)
+    results = MovieAnalytics(db_path).run_all(['director_performance_metrics', 'budget_vs_rating_correlation'])
+    assert all(len(frame) for frame in results.values())
@@ -0,0 +1,17 @@
+from helpers import assert_same, change_movie, change_ratings, read
+from rating_trends import create_rating_trends, rebuild_rating_trends
+
+MOVIE_DAYS = 'SELECT * FROM movie_rating_days'
+GENRE_DAYS = 'SELECT * FROM genre_rating_days'
+
+
+def test_triggers_match_rebuild(conn):
+    with conn:
+        create_rating_trends(conn)
+    movies = change_ratings(conn)
+    change_movie(conn, movies[0])
+    maintained = read(conn, MOVIE_DAYS, ['movie_id', 'day']), read(conn, GENRE_DAYS, ['genre', 'day'])
+    with conn:
+        rebuild_rating_trends(conn)
+    assert_same(maintained[0], read(conn, MOVIE_DAYS, ['movie_id', 'day']))
+    assert_same(maintained[1], read(conn, GENRE_DAYS, ['genre', 'day']))
@@ -0,0 +1,20 @@
+import recommender
+from helpers import assert_same, change_ratings, forbid, read
+from recommender import create_movie_similarity, drop_movie_similarity, refresh_movie_similarity
+
+LISTS = 'SELECT * FROM movie_similarity'
+
+
+def test_refresh_matches_rebuild(conn, monkeypatch):
+    with conn:
+        create_movie_similarity(conn, neighbors=5)
+    movies = change_ratings(conn)
+    forbid(monkeypatch, recommender, '_rebuild')
+    with conn:
+        assert refresh_movie_similarity(conn) == len(movies)
+    refreshed = read(conn, LISTS, ['movie_id', 'rank'])
+    monkeypatch.undo()
+    with conn:
+        drop_movie_similarity(conn)
+        create_movie_similarity(conn, neighbors=5)
+    assert_same(refreshed, read(conn, LISTS, ['movie_id', 'rank']))
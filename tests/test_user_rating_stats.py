@@ -0,0 +1,28 @@
+from analysis_queries import MovieAnalytics
+from helpers import assert_same, change_ratings, read
+from user_rating_stats import create_user_rating_stats, refresh_user_rating_stats
+
+STATS = 'SELECT * FROM user_rating_stats'
+
+
+def test_triggers_match_rebuild(conn):
+    with conn:
+        create_user_rating_stats(conn)
+    change_ratings(conn)
+    with conn:
+        conn.execute('UPDATE movie_ratings SET user_id = 1 WHERE rating_id IN (SELECT MIN(rating_id) FROM movie_ratings)')
+    maintained = read(conn, STATS, 'user_id')
+    with conn:
+        refresh_user_rating_stats(conn)
+    assert_same(maintained, read(conn, STATS, 'user_id'))
+
+
+def test_profiles_read_the_maintained_stats(db_path, conn):
+    analytics = MovieAnalytics(db_path)
+    analytics.user_rating_profiles()
+    change_ratings(conn)
+    profiles = analytics.user_rating_profiles().set_index('user_id')
+    counts = dict(conn.execute(
+        'SELECT user_id, COUNT(rating) FROM movie_ratings WHERE user_id IS NOT NULL GROUP BY user_id'))
+    assert profiles['rating_count'].to_dict() == {user: n for user, n in counts.items() if n}
+    assert (profiles['rating_stddev'] >= 0).all()
@@ -0,0 +1,213 @@
+import sqlite3
+from compact_schema import COMPACT_INDEXES, is_compact_schema
+
+# Per-user rating aggregates, the user-side counterpart of movie_rating_stats.
+# Means and variances are derived from count/sum/sum of squares, so adding or
+# removing a rating is a single upsert and never rescans movie_ratings.
+USER_STATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS user_rating_stats (
+        user_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL,
+        rating_sum REAL NOT NULL,
+        rating_sum_sq REAL NOT NULL
+    )
+'''
+
+# Ratings of one user are contiguous in this index, so per-user aggregates and
+# the user bias join read it sequentially. A compact database indexes the
+# stored rating_tenths, since SQLite cannot read generated columns from an index.
+USER_INDEX_NAME = 'idx_movie_ratings_user'
+USER_INDEX = 'movie_ratings (user_id, movie_id, rating)'
+
+_ADD_RATING = '''
+    INSERT INTO user_rating_stats (user_id, rating_count, rating_sum, rating_sum_sq)
+    VALUES (NEW.user_id, 1, NEW.rating, NEW.rating * NEW.rating)
+    ON CONFLICT (user_id) DO UPDATE SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_sq = rating_sum_sq + excluded.rating_sum_sq;
+'''
+
+_REMOVE_RATING = '''
+    UPDATE user_rating_stats SET
+        rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        rating_sum_sq = rating_sum_sq - OLD.rating * OLD.rating
+    WHERE user_id = OLD.user_id;
+    DELETE FROM user_rating_stats
+    WHERE user_id = OLD.user_id AND rating_count <= 0;
+'''
+
+# rating_tenths is the stored rating column of a compact database (compact_schema.py)
+USER_STATS_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_user_stats_insert
+    AFTER INSERT ON movie_ratings
+    WHEN NEW.rating IS NOT NULL AND NEW.user_id IS NOT NULL
+    BEGIN
+        {_ADD_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_user_stats_delete
+    AFTER DELETE ON movie_ratings
+    WHEN OLD.rating IS NOT NULL AND OLD.user_id IS NOT NULL
+    BEGIN
+        {_REMOVE_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_user_stats_update_old
+    AFTER UPDATE OF user_id, rating, rating_tenths ON movie_ratings
+    WHEN OLD.rating IS NOT NULL AND OLD.user_id IS NOT NULL
+    BEGIN
+        {_REMOVE_RATING}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS movie_ratings_user_stats_update_new
+    AFTER UPDATE OF user_id, rating, rating_tenths ON movie_ratings
+    WHEN NEW.rating IS NOT NULL AND NEW.user_id IS NOT NULL
+    BEGIN
+        {_ADD_RATING}
+    END
+    ''',
+]
+
+_AGGREGATE_SELECT = '''
+    SELECT user_id, COUNT(rating), SUM(rating), SUM(rating * rating)
+    FROM movie_ratings
+    WHERE rating IS NOT NULL AND user_id IS NOT NULL
+'''
+
+# Per-user terms, materialized so SQLite computes them once per user rather
+# than inlining them into every rating. Users
+# below min_user_ratings get no bias of their own: their ratings are compared
+# with the global mean, and they add nothing to the z-scores.
+_USER_BIAS = '''
+    SELECT
+        user_id,
+        CASE WHEN rating_count >= ? THEN rating_sum / rating_count
+             ELSE (SELECT mean FROM global) END as baseline,
+        CASE WHEN rating_count >= ? THEN
+            1 / NULLIF(sqrt(MAX(rating_sum_sq / rating_count
+                                - (rating_sum / rating_count) * (rating_sum / rating_count), 0)), 0)
+        END as inverse_stddev
+    FROM user_rating_stats
+'''
+
+# One pass over the users in key order, each joined to its range of the user
+# index (CROSS JOIN pins that loop order), so the work is linear in the number
+# of ratings however many users there are. {rating} is the rating expression
+# for the schema in use.
+USER_BIAS_ADJUSTED_QUERY = """
+    WITH global AS (
+        SELECT TOTAL(rating_sum) / TOTAL(rating_count) as mean FROM user_rating_stats
+    ),
+    users AS MATERIALIZED (""" + _USER_BIAS + """),
+    adjusted AS (
+        SELECT
+            r.movie_id,
+            COUNT(*) as rating_count,
+            AVG({rating}) as avg_rating,
+            AVG({rating} - u.baseline) as avg_deviation,
+            AVG(({rating} - u.baseline) * u.inverse_stddev) as avg_z_score
+        FROM users u
+        CROSS JOIN movie_ratings r ON r.user_id = u.user_id
+        WHERE {rating} IS NOT NULL
+        GROUP BY r.movie_id
+    )
+    SELECT
+        m.movie_id,
+        m.title,
+        m.genre,
+        a.rating_count,
+        a.avg_rating,
+        (SELECT mean FROM global) + a.avg_deviation as adjusted_rating,
+        a.avg_z_score
+    FROM adjusted a
+    JOIN movies m ON m.movie_id = a.movie_id
+    WHERE a.rating_count >= ?
+    ORDER BY adjusted_rating DESC, m.movie_id
+    """
+
+USER_PROFILES_QUERY = """
+    SELECT
+        user_id,
+        rating_count,
+        rating_sum / rating_count as avg_rating,
+        sqrt(MAX(rating_sum_sq / rating_count - (rating_sum / rating_count) * (rating_sum / rating_count), 0))
+            as rating_stddev,
+        rating_sum / rating_count
+            - (SELECT TOTAL(rating_sum) / TOTAL(rating_count) FROM user_rating_stats) as bias
+    FROM user_rating_stats
+    WHERE rating_count >= ?
+    ORDER BY rating_count DESC, user_id
+    """
+
+
+def user_bias_query(compact=False):
+    """USER_BIAS_ADJUSTED_QUERY for the legacy or the compact schema"""
+    rating = 'r.rating_tenths / 10.0' if compact else 'r.rating'
+    return USER_BIAS_ADJUSTED_QUERY.format(rating=rating)
+
+
+def create_user_index(conn):
+    """Index movie_ratings by user; skipped when it already exists"""
+    definition = COMPACT_INDEXES[USER_INDEX_NAME] if is_compact_schema(conn) else USER_INDEX
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {USER_INDEX_NAME} ON {definition}')
+
+
+def create_user_rating_stats(conn):
+    """Create the user_id index, the user_rating_stats table and its maintenance triggers"""
+    create_user_index(conn)
+    conn.execute(USER_STATS_TABLE_SQL)
+    refresh_user_rating_stats(conn)
+    for trigger_sql in USER_STATS_TRIGGERS_SQL:
+        conn.execute(trigger_sql)
+
+
+def drop_user_rating_stats(conn):
+    """Drop the user_rating_stats table and its triggers (the index is left in place)"""
+    for name in ('insert', 'delete', 'update_old', 'update_new'):
+        conn.execute(f'DROP TRIGGER IF EXISTS movie_ratings_user_stats_{name}')
+    conn.execute('DROP TABLE IF EXISTS user_rating_stats')
+
+
+def refresh_user_rating_stats(conn, user_ids=None):
+    """Rebuild aggregates for all users, or only for the given user ids"""
+    conn.execute(USER_STATS_TABLE_SQL)
+    if user_ids is None:
+        conn.execute('DELETE FROM user_rating_stats')
+        conn.execute(f'''
+            INSERT INTO user_rating_stats (user_id, rating_count, rating_sum, rating_sum_sq)
+            {_AGGREGATE_SELECT}
+            GROUP BY user_id
+        ''')
+        return
+
+    params = [(user_id,) for user_id in user_ids]
+    conn.executemany('DELETE FROM user_rating_stats WHERE user_id = ?', params)
+    conn.executemany(f'''
+        INSERT INTO user_rating_stats (user_id, rating_count, rating_sum, rating_sum_sq)
+        {_AGGREGATE_SELECT}
+          AND user_id = ?
+        GROUP BY user_id
+    ''', params)
+
+
+def has_user_rating_stats(conn):
+    """Check whether the database already carries the per-user aggregates"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_rating_stats'"
+    ).fetchone()
+    return row is not None
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect('movies.db')
+    with conn:
+        create_user_rating_stats(conn)
+    count = conn.execute('SELECT COUNT(*) FROM user_rating_stats').fetchone()[0]
+    conn.close()
+    print(f"Rating aggregates refreshed for {count} users")
@@ -1,217 +1,449 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
 from analysis_queries import MovieAnalytics
+from query_cache import QueryCache
+import query_profiler
+from query_profiler import span
+from report_fragments import frame_hash, signature
+
+FORMATS = ('png', 'svg', 'webp')
+
+
+def apply_style():
+    # Set style for better-looking plots
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+
+
+def plot_genre_popularity(data):
+    """Draw genre popularity visualization"""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+    
+    # Genre count by year
+    genre_pivot = data.pivot_table(values='movie_count', index='release_year', 
+                                 columns='genre', fill_value=0)
+    genre_pivot.plot(kind='bar', stacked=True, ax=ax1)
+    ax1.set_title('Movie Count by Genre Over Time')
+    ax1.set_xlabel('Release Year')
+    ax1.set_ylabel('Number of Movies')
+    ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    
+    # Average rating by genre
+    genre_ratings = data.groupby('genre')['avg_genre_rating'].mean().sort_values(ascending=True)
+    genre_ratings.plot(kind='barh', ax=ax2, color='skyblue')
+    ax2.set_title('Average Rating by Genre')
+    ax2.set_xlabel('Average Rating')
+    
+    fig.tight_layout()
+    return fig
+
+
+def plot_director_performance(data):
+    """Draw director performance visualization"""
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+    
+    # Director ratings vs box office
+    ax1.scatter(data['avg_director_rating'], data['avg_box_office'], 
+               s=data['total_movies']*50, alpha=0.6)
+    ax1.set_xlabel('Average Rating')
+    ax1.set_ylabel('Average Box Office ($)')
+    ax1.set_title('Director Rating vs Box Office Performance')
+    
+    # Add director names to points
+    for i, row in data.iterrows():
+        ax1.annotate(row['director_name'], 
+                    (row['avg_director_rating'], row['avg_box_office']),
+                    xytext=(5, 5), textcoords='offset points', fontsize=8)
+    
+    # Top directors by rating
+    top_directors = data.nlargest(8, 'avg_director_rating')
+    ax2.barh(top_directors['director_name'], top_directors['avg_director_rating'])
+    ax2.set_title('Top Directors by Average Rating')
+    ax2.set_xlabel('Average Rating')
+    
+    # Profit analysis
+    ax3.bar(top_directors['director_name'], top_directors['avg_profit'])
+    ax3.set_title('Average Profit by Top Directors')
+    ax3.set_ylabel('Average Profit ($)')
+    ax3.tick_params(axis='x', rotation=45)
+    
+    # Movie count vs rating
+    ax4.scatter(data['total_movies'], data['avg_director_rating'], alpha=0.7)
+    ax4.set_xlabel('Total Movies Directed')
+    ax4.set_ylabel('Average Rating')
+    ax4.set_title('Productivity vs Quality')
+    
+    fig.tight_layout()
+    return fig
+
+
+def plot_rating_distribution(data):
+    """Draw rating distribution visualization"""
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+    
+    # Rating distribution histogram
+    ax1.hist(data['avg_rating'], bins=20, alpha=0.7, color='lightblue', edgecolor='black')
+    ax1.set_xlabel('Average Rating')
+    ax1.set_ylabel('Number of Movies')
+    ax1.set_title('Distribution of Movie Ratings')
+    ax1.axvline(data['avg_rating'].mean(), color='red', linestyle='--', 
+               label=f'Mean: {data["avg_rating"].mean():.2f}')
+    ax1.legend()
+    
+    # Rating by genre boxplot
+    sns.boxplot(data=data, x='genre', y='avg_rating', ax=ax2)
+    ax2.set_title('Rating Distribution by Genre')
+    ax2.tick_params(axis='x', rotation=45)
+    
+    # Rating vs profit scatter
+    ax3.scatter(data['avg_rating'], data['profit'], alpha=0.6)
+    ax3.set_xlabel('Average Rating')
+    ax3.set_ylabel('Profit ($)')
+    ax3.set_title('Rating vs Profit Correlation')
+    
+    # Add trend line
+    z = np.polyfit(data['avg_rating'], data['profit'], 1)
+    p = np.poly1d(z)
+    ax3.plot(data['avg_rating'], p(data['avg_rating']), "r--", alpha=0.8)
+    
+    # Rating categories pie chart
+    rating_counts = data['rating_category'].value_counts()
+    ax4.pie(rating_counts.values, labels=rating_counts.index, autopct='%1.1f%%')
+    ax4.set_title('Movies by Rating Category')
+    
+    fig.tight_layout()
+    return fig
+
+
+def plot_seasonal_analysis(data):
+    """Draw seasonal release pattern visualization"""
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+    
+    # Movies by season
+    season_counts = data.groupby('season')['movie_count'].sum()
+    ax1.pie(season_counts.values, labels=season_counts.index, autopct='%1.1f%%')
+    ax1.set_title('Movie Releases by Season')
+    
+    # Average rating by season
+    season_ratings = data.groupby('season')['avg_rating'].mean()
+    ax2.bar(season_ratings.index, season_ratings.values, color='lightgreen')
+    ax2.set_title('Average Rating by Season')
+    ax2.set_ylabel('Average Rating')
+    
+    # Genre distribution by season
+    season_genre = data.pivot_table(values='movie_count', index='season', 
+                                  columns='genre', fill_value=0)
+    season_genre.plot(kind='bar', stacked=True, ax=ax3)
+    ax3.set_title('Genre Distribution by Season')
+    ax3.set_ylabel('Number of Movies')
+    ax3.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    
+    # Box office by season
+    season_boxoffice = data.groupby('season')['avg_box_office'].mean()
+    ax4.bar(season_boxoffice.index, season_boxoffice.values, color='orange')
+    ax4.set_title('Average Box Office by Season')
+    ax4.set_ylabel('Average Box Office ($)')
+    
+    fig.tight_layout()
+    return fig
+
+
+def plot_budget_analysis(data):
+    """Draw budget vs performance visualization"""
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+    
+    # Budget vs Rating scatter
+    colors = {'Low Budget': 'green', 'Medium Budget': 'orange', 'High Budget': 'red'}
+    for category in data['budget_category'].unique():
+        subset = data[data['budget_category'] == category]
+        ax1.scatter(subset['budget'], subset['avg_rating'], 
+                   label=category, color=colors[category], alpha=0.7)
+    
+    ax1.set_xlabel('Budget ($)')
+    ax1.set_ylabel('Average Rating')
+    ax1.set_title('Budget vs Rating')
+    ax1.legend()
+    ax1.ticklabel_format(style='scientific', axis='x', scilimits=(0,0))
+    
+    # Budget categories distribution
+    budget_counts = data['budget_category'].value_counts()
+    ax2.bar(budget_counts.index, budget_counts.values, color=['green', 'orange', 'red'])
+    ax2.set_title('Movies by Budget Category')
+    ax2.set_ylabel('Number of Movies')
+    
+    # ROI analysis
+    data['roi'] = (data['box_office'] / data['budget']) * 100
+    budget_roi = data.groupby('budget_category')['roi'].mean()
+    ax3.bar(budget_roi.index, budget_roi.values, color=['green', 'orange', 'red'])
+    ax3.set_title('Average ROI by Budget Category')
+    ax3.set_ylabel('ROI (%)')
+    
+    # Profit vs Rating
+    ax4.scatter(data['avg_rating'], data['profit'], alpha=0.6, color='purple')
+    ax4.set_xlabel('Average Rating')
+    ax4.set_ylabel('Profit ($)')
+    ax4.set_title('Rating vs Profit')
+    ax4.ticklabel_format(style='scientific', axis='y', scilimits=(0,0))
+    
+    fig.tight_layout()
+    return fig
+
+
+def plot_rating_histograms(data):
+    """Draw per-genre rating distribution visualization"""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+    
+    # Share of ratings at each 0.1 step
+    shares = data.div(data.sum(axis=1), axis=0).fillna(0)
+    for genre, row in shares.iterrows():
+        ax1.plot(row.index, row.values, label=genre, alpha=0.8)
+    ax1.set_title('Rating Distribution by Genre')
+    ax1.set_xlabel('Rating')
+    ax1.set_ylabel('Share of Ratings')
+    ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    
+    # Cumulative distribution, where the 0.5 and 0.9 crossings are p50 and p90
+    for genre, row in shares.cumsum(axis=1).iterrows():
+        ax2.plot(row.index, row.values, label=genre, alpha=0.8)
+    for level in (0.5, 0.9):
+        ax2.axhline(level, color='gray', linestyle='--', linewidth=1)
+    ax2.set_title('Cumulative Rating Distribution by Genre')
+    ax2.set_xlabel('Rating')
+    ax2.set_ylabel('Share of Ratings at or Below')
+    
+    fig.tight_layout()
+    return fig
+
+
+def plot_rating_trends(data):
+    """Draw weekly rolling rating trend visualization"""
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 10), sharex=True)
+    
+    data = data.assign(period_start=pd.to_datetime(data['period_start']))
+    
+    # Rolling mean rating per genre
+    rolling = data.pivot_table(values='rolling_mean', index='period_start', columns='genre')
+    rolling.plot(ax=ax1, alpha=0.8)
+    ax1.set_title('Rolling Average Rating by Genre')
+    ax1.set_ylabel('Rolling Average Rating')
+    ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    
+    # Change against the same window 52 weeks earlier
+    yoy = data.pivot_table(values='yoy_change', index='period_start', columns='genre')
+    yoy.plot(ax=ax2, alpha=0.8, legend=False)
+    ax2.axhline(0, color='gray', linestyle='--', linewidth=1)
+    ax2.set_title('Year-over-Year Change in Rolling Average Rating')
+    ax2.set_xlabel('Week')
+    ax2.set_ylabel('Rating Change')
+    
+    fig.tight_layout()
+    return fig
+
+
+# chart name -> (MovieAnalytics method, plot function, output file stem)
+CHARTS = {
+    'genre_popularity': ('genre_popularity_analysis', plot_genre_popularity, 'genre_analysis'),
+    'director_performance': ('director_performance_metrics', plot_director_performance, 'director_analysis'),
+    'rating_distribution': ('rating_distribution_analysis', plot_rating_distribution, 'rating_analysis'),
+    'seasonal_analysis': ('seasonal_release_patterns', plot_seasonal_analysis, 'seasonal_analysis'),
+    'budget_analysis': ('budget_vs_rating_correlation', plot_budget_analysis, 'budget_analysis'),
+    'rating_histograms': ('rating_histogram', plot_rating_histograms, 'rating_histograms'),
+    'rating_trends': ('genre_rating_trend', plot_rating_trends, 'rating_trends'),
+}
+
+
+# Input hashes of the charts saved in an output directory, keyed by file name
+CHART_HASHES = '.chart_inputs.json'
+
+
+def _init_render_worker():
+    matplotlib.use('Agg', force=True)
+    apply_style()
+
+
+def render_chart(name, data, output_dir='.', dpi=300, fmt='png'):
+    """Draw one chart, save it and release the figure; returns the file path"""
+    _, plot, stem = CHARTS[name]
+    fig = plot(data)
+    path = os.path.join(output_dir, f'{stem}.{fmt}')
+    fig.savefig(path, dpi=dpi, format=fmt, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def _timed_render_chart(name, data, output_dir='.', dpi=300, fmt='png'):
+    """render_chart in a worker, also returning (start, duration, pid) for the parent's profiler"""
+    start = time.perf_counter()
+    path = render_chart(name, data, output_dir, dpi, fmt)
+    return path, start, time.perf_counter() - start, os.getpid()
+
 
 class MovieVisualizations:
-    def __init__(self):
-        self.analytics = MovieAnalytics()
-        # Set style for better-looking plots
-        plt.style.use('seaborn-v0_8')
-        sns.set_palette("husl")
+    def __init__(self, analytics=None, output_dir='.', dpi=300, fmt='png'):
+        if fmt not in FORMATS:
+            raise ValueError(f"fmt must be one of {FORMATS}")
+        self.analytics = analytics or MovieAnalytics(cache=QueryCache())
+        self.output_dir = output_dir
+        self.dpi = dpi
+        self.fmt = fmt
+        self.unchanged = []
+        apply_style()
+    
+    def _create_chart(self, name):
+        method, plot, stem = CHARTS[name]
+        data = getattr(self.analytics, method)()
+        with span(f'render {name}', 'chart'):
+            fig = plot(data)
+            path = os.path.join(self.output_dir, f'{stem}.{self.fmt}')
+            fig.savefig(path, dpi=self.dpi, format=self.fmt, bbox_inches='tight')
+        plt.show()
+        plt.close(fig)
+        return path
+    
+    def _chart_path(self, name):
+        return os.path.join(self.output_dir, f'{CHARTS[name][2]}.{self.fmt}')
+    
+    def _load_chart_hashes(self):
+        try:
+            with open(os.path.join(self.output_dir, CHART_HASHES), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_chart_hashes(self, hashes):
+        path = os.path.join(self.output_dir, CHART_HASHES)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(hashes, f, indent=1)
+        os.replace(path + '.tmp', path)
+    
+    def render_all(self, charts=None, max_workers=None, force=False):
+        """Render charts headlessly in a process pool and return their file paths
+        
+        The datasets are fetched once in a single run_all batch, then every
+        figure is drawn on the Agg backend in its own worker and closed as soon
+        as it has been saved. Charts whose saved file was drawn from the same
+        data at the same dpi are skipped (listed in self.unchanged) unless
+        force=True.
+        """
+        names = list(charts or CHARTS)
+        datasets = self.analytics.run_all(list(dict.fromkeys(CHARTS[name][0] for name in names)))
+        os.makedirs(self.output_dir, exist_ok=True)
+        
+        hashes = self._load_chart_hashes()
+        pending = {}
+        for name in names:
+            data_hash = signature(frame_hash(datasets[CHARTS[name][0]]), self.dpi)
+            path = self._chart_path(name)
+            if force or hashes.get(os.path.basename(path)) != data_hash or not os.path.exists(path):
+                pending[name] = data_hash
+        self.unchanged = [name for name in names if name not in pending]
+        
+        paths = {name: self._chart_path(name) for name in self.unchanged}
+        if pending:
+            workers = max_workers or min(len(pending), os.cpu_count() or 1)
+            profiler = query_profiler.current()
+            render = render_chart if profiler is None else _timed_render_chart
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+                futures = {
+                    name: pool.submit(render, name, datasets[CHARTS[name][0]],
+                                      self.output_dir, self.dpi, self.fmt)
+                    for name in pending
+                }
+                rendered = {name: future.result() for name, future in futures.items()}
+            if profiler is not None:
+                # Worker renders show up as one trace row per worker process
+                for name, (path, start, duration, pid) in rendered.items():
+                    profiler.add_event(f'render {name}', 'chart', start, duration, pid=pid, tid=pid)
+                    rendered[name] = path
+            paths.update(rendered)
+            for name, data_hash in pending.items():
+                hashes[os.path.basename(paths[name])] = data_hash
+            self._save_chart_hashes(hashes)
+        return {name: paths[name] for name in names}
         
     def create_genre_popularity_chart(self):
         """Create genre popularity visualization"""
-        data = self.analytics.genre_popularity_analysis()
-        
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
-        
-        # Genre count by year
-        genre_pivot = data.pivot_table(values='movie_count', index='release_year', 
-                                     columns='genre', fill_value=0)
-        genre_pivot.plot(kind='bar', stacked=True, ax=ax1)
-        ax1.set_title('Movie Count by Genre Over Time')
-        ax1.set_xlabel('Release Year')
-        ax1.set_ylabel('Number of Movies')
-        ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        
-        # Average rating by genre
-        genre_ratings = data.groupby('genre')['avg_genre_rating'].mean().sort_values(ascending=True)
-        genre_ratings.plot(kind='barh', ax=ax2, color='skyblue')
-        ax2.set_title('Average Rating by Genre')
-        ax2.set_xlabel('Average Rating')
-        
-        plt.tight_layout()
-        plt.savefig('genre_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._create_chart('genre_popularity')
         
     def create_director_performance_chart(self):
         """Create director performance visualization"""
-        data = self.analytics.director_performance_metrics()
-        
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
-        
-        # Director ratings vs box office
-        ax1.scatter(data['avg_director_rating'], data['avg_box_office'], 
-                   s=data['total_movies']*50, alpha=0.6)
-        ax1.set_xlabel('Average Rating')
-        ax1.set_ylabel('Average Box Office ($)')
-        ax1.set_title('Director Rating vs Box Office Performance')
-        
-        # Add director names to points
-        for i, row in data.iterrows():
-            ax1.annotate(row['director_name'], 
-                        (row['avg_director_rating'], row['avg_box_office']),
-                        xytext=(5, 5), textcoords='offset points', fontsize=8)
-        
-        # Top directors by rating
-        top_directors = data.nlargest(8, 'avg_director_rating')
-        ax2.barh(top_directors['director_name'], top_directors['avg_director_rating'])
-        ax2.set_title('Top Directors by Average Rating')
-        ax2.set_xlabel('Average Rating')
-        
-        # Profit analysis
-        ax3.bar(top_directors['director_name'], top_directors['avg_profit'])
-        ax3.set_title('Average Profit by Top Directors')
-        ax3.set_ylabel('Average Profit ($)')
-        ax3.tick_params(axis='x', rotation=45)
-        
-        # Movie count vs rating
-        ax4.scatter(data['total_movies'], data['avg_director_rating'], alpha=0.7)
-        ax4.set_xlabel('Total Movies Directed')
-        ax4.set_ylabel('Average Rating')
-        ax4.set_title('Productivity vs Quality')
-        
-        plt.tight_layout()
-        plt.savefig('director_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._create_chart('director_performance')
         
     def create_rating_distribution_chart(self):
         """Create rating distribution visualization"""
-        data = self.analytics.rating_distribution_analysis()
-        
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
-        
-        # Rating distribution histogram
-        ax1.hist(data['avg_rating'], bins=20, alpha=0.7, color='lightblue', edgecolor='black')
-        ax1.set_xlabel('Average Rating')
-        ax1.set_ylabel('Number of Movies')
-        ax1.set_title('Distribution of Movie Ratings')
-        ax1.axvline(data['avg_rating'].mean(), color='red', linestyle='--', 
-                   label=f'Mean: {data["avg_rating"].mean():.2f}')
-        ax1.legend()
-        
-        # Rating by genre boxplot
-        sns.boxplot(data=data, x='genre', y='avg_rating', ax=ax2)
-        ax2.set_title('Rating Distribution by Genre')
-        ax2.tick_params(axis='x', rotation=45)
-        
-        # Rating vs profit scatter
-        ax3.scatter(data['avg_rating'], data['profit'], alpha=0.6)
-        ax3.set_xlabel('Average Rating')
-        ax3.set_ylabel('Profit ($)')
-        ax3.set_title('Rating vs Profit Correlation')
-        
-        # Add trend line
-        z = np.polyfit(data['avg_rating'], data['profit'], 1)
-        p = np.poly1d(z)
-        ax3.plot(data['avg_rating'], p(data['avg_rating']), "r--", alpha=0.8)
-        
-        # Rating categories pie chart
-        rating_counts = data['rating_category'].value_counts()
-        ax4.pie(rating_counts.values, labels=rating_counts.index, autopct='%1.1f%%')
-        ax4.set_title('Movies by Rating Category')
-        
-        plt.tight_layout()
-        plt.savefig('rating_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._create_chart('rating_distribution')
         
     def create_seasonal_analysis_chart(self):
         """Create seasonal release pattern visualization"""
-        data = self.analytics.seasonal_release_patterns()
-        
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
-        
-        # Movies by season
-        season_counts = data.groupby('season')['movie_count'].sum()
-        ax1.pie(season_counts.values, labels=season_counts.index, autopct='%1.1f%%')
-        ax1.set_title('Movie Releases by Season')
-        
-        # Average rating by season
-        season_ratings = data.groupby('season')['avg_rating'].mean()
-        ax2.bar(season_ratings.index, season_ratings.values, color='lightgreen')
-        ax2.set_title('Average Rating by Season')
-        ax2.set_ylabel('Average Rating')
-        
-        # Genre distribution by season
-        season_genre = data.pivot_table(values='movie_count', index='season', 
-                                      columns='genre', fill_value=0)
-        season_genre.plot(kind='bar', stacked=True, ax=ax3)
-        ax3.set_title('Genre Distribution by Season')
-        ax3.set_ylabel('Number of Movies')
-        ax3.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        
-        # Box office by season
-        season_boxoffice = data.groupby('season')['avg_box_office'].mean()
-        ax4.bar(season_boxoffice.index, season_boxoffice.values, color='orange')
-        ax4.set_title('Average Box Office by Season')
-        ax4.set_ylabel('Average Box Office ($)')
-        
-        plt.tight_layout()
-        plt.savefig('seasonal_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        return self._create_chart('seasonal_analysis')
         
     def create_budget_analysis_chart(self):
         """Create budget vs performance visualization"""
-        data = self.analytics.budget_vs_rating_correlation()
-        
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
-        
-        # Budget vs Rating scatter
-        colors = {'Low Budget': 'green', 'Medium Budget': 'orange', 'High Budget': 'red'}
-        for category in data['budget_category'].unique():
-            subset = data[data['budget_category'] == category]
-            ax1.scatter(subset['budget'], subset['avg_rating'], 
-                       label=category, color=colors[category], alpha=0.7)
-        
-        ax1.set_xlabel('Budget ($)')
-        ax1.set_ylabel('Average Rating')
-        ax1.set_title('Budget vs Rating')
-        ax1.legend()
-        ax1.ticklabel_format(style='scientific', axis='x', scilimits=(0,0))
+        return self._create_chart('budget_analysis')
         
-        # Budget categories distribution
-        budget_counts = data['budget_category'].value_counts()
-        ax2.bar(budget_counts.index, budget_counts.values, color=['green', 'orange', 'red'])
-        ax2.set_title('Movies by Budget Category')
-        ax2.set_ylabel('Number of Movies')
+    def create_rating_histogram_chart(self):
+        """Create per-genre rating distribution visualization"""
+        return self._create_chart('rating_histograms')
         
-        # ROI analysis
-        data['roi'] = (data['box_office'] / data['budget']) * 100
-        budget_roi = data.groupby('budget_category')['roi'].mean()
-        ax3.bar(budget_roi.index, budget_roi.values, color=['green', 'orange', 'red'])
-        ax3.set_title('Average ROI by Budget Category')
-        ax3.set_ylabel('ROI (%)')
-        
-        # Profit vs Rating
-        ax4.scatter(data['avg_rating'], data['profit'], alpha=0.6, color='purple')
-        ax4.set_xlabel('Average Rating')
-        ax4.set_ylabel('Profit ($)')
-        ax4.set_title('Rating vs Profit')
-        ax4.ticklabel_format(style='scientific', axis='y', scilimits=(0,0))
-        
-        plt.tight_layout()
-        plt.savefig('budget_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+    def create_rating_trend_chart(self):
+        """Create weekly rolling rating trend visualization"""
+        return self._create_chart('rating_trends')
 
 if __name__ == "__main__":
-    viz = MovieVisualizations()
-    
-    print("Generating visualizations...")
-    print("1. Creating genre analysis charts...")
-    viz.create_genre_popularity_chart()
-    
-    print("2. Creating director performance charts...")
-    viz.create_director_performance_chart()
-    
-    print("3. Creating rating distribution charts...")
-    viz.create_rating_distribution_chart()
+    parser = argparse.ArgumentParser(description='Generate movie analysis charts')
+    parser.add_argument('--headless', action='store_true',
+                        help='render all charts in parallel on the Agg backend without showing them')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--format', choices=FORMATS, default='png')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--force', action='store_true',
+                        help='with --headless, redraw charts even when their data is unchanged')
+    parser.add_argument('--profile', nargs='?', const=query_profiler.DEFAULT_TRACE_PATH, metavar='TRACE',
+                        help='time queries and chart renders and write a trace (.json for '
+                             'chrome://tracing, anything else for flamegraph.pl folded stacks)')
+    args = parser.parse_args()
     
-    print("4. Creating seasonal analysis charts...")
-    viz.create_seasonal_analysis_chart()
+    if args.headless:
+        matplotlib.use('Agg', force=True)
+    viz = MovieVisualizations(output_dir=args.output_dir, dpi=args.dpi, fmt=args.format)
     
-    print("5. Creating budget analysis charts...")
-    viz.create_budget_analysis_chart()
+    with query_profiler.profiling(args.profile) as profiler:
+        if args.headless:
+            for name, path in viz.render_all(force=args.force).items():
+                print(f"{'Unchanged' if name in viz.unchanged else 'Saved'} {path}")
+        else:
+            print("Generating visualizations...")
+            print("1. Creating genre analysis charts...")
+            viz.create_genre_popularity_chart()
+            
+            print("2. Creating director performance charts...")
+            viz.create_director_performance_chart()
+            
+            print("3. Creating rating distribution charts...")
+            viz.create_rating_distribution_chart()
+            
+            print("4. Creating seasonal analysis charts...")
+            viz.create_seasonal_analysis_chart()
+            
+            print("5. Creating budget analysis charts...")
+            viz.create_budget_analysis_chart()
+            
+            print("6. Creating rating histogram charts...")
+            viz.create_rating_histogram_chart()
+            
+            print("7. Creating rating trend charts...")
+            viz.create_rating_trend_chart()
+            
+            print(f"All visualizations saved as {args.format.upper()} files!")
     
-    print("All visualizations saved as PNG files!")
\ No newline at end of file
+    if args.profile:
+        query_profiler.print_profile(profiler)
+        print(f"\nTrace written to {args.profile}")